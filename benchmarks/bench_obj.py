@@ -0,0 +1,95 @@
+# bench_obj.py
+# Benchmark the OBJ exporter on a large mesh.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# A 32x32x32 checkerboard of isolated voxels gives a mesh of 98,304 faces.
+# We time the original one-write-per-line exporter against the current
+# ObjFile handler and report file sizes. Both include building the mesh.
+#
+# Usage: python benchmarks/bench_obj.py [output directory]
+
+import os
+import sys
+import tempfile
+from common import create_host, timed
+from voxel import VoxelData
+
+SIZE = 32
+
+# The exporter as it was, one write per line and six vertices per face
+def legacy_save(filename, voxels):
+    vertices, colours, _, _, _ = voxels.get_vertices()
+    f = open(filename, "wt")
+    f.write("mtllib %s\r\n" % (os.path.splitext(filename)[0]+".mtl"))
+    i = 0
+    while i < len(vertices):
+        f.write("v %f %f %f\r\n" %
+            (vertices[i], vertices[i+1], vertices[i+2]))
+        i += 3
+    mats = {}
+    i = 0
+    while i < len(colours):
+        colour = colours[i]<<24 | colours[i+1]<<16 | colours[i+2]<<8
+        if colour not in mats:
+            mats[colour] = "material_%i" % len(mats)
+        i += 3
+    faces = (len(vertices)//(3*3))//2
+    for i in xrange(faces):
+        n = 1+(i * 6)
+        colour = (colours[(i*18)]<<24 | colours[(i*18)+1]<<16
+            | colours[(i*18)+2]<<8)
+        f.write("usemtl %s\r\n" % mats[colour])
+        f.write("f %i %i %i\r\n" % (n, n+2, n+1))
+        f.write("f %i %i %i\r\n" % (n+5, n+4, n+3))
+    f.close()
+
+def build_model():
+    voxels = VoxelData()
+    voxels.resize(SIZE, SIZE, SIZE)
+    data = voxels.blank_data()
+    for x in xrange(SIZE):
+        for y in xrange(SIZE):
+            for z in xrange(SIZE):
+                if (x + y + z) % 2 == 0:
+                    colour = 0x40 + (x * 6)
+                    data[x][y][z] = colour<<24 | 0x8000ff
+    voxels.set_data(data)
+    return voxels
+
+def main():
+    directory = sys.argv[1] if len(sys.argv) > 1 else tempfile.mkdtemp()
+    voxels = build_model()
+    host = create_host(voxels)
+    handler = host.find_handler("model.obj", "save")
+
+    print "Faces: %i" % (len(voxels.get_vertices()[0]) // 18)
+
+    legacy = os.path.join(directory, "legacy.obj")
+    current = os.path.join(directory, "current.obj")
+    coloured = os.path.join(directory, "coloured.obj")
+    results = [
+        ("legacy", legacy, timed(legacy_save, legacy, voxels)),
+        ("current", current, timed(handler.save, current)),
+    ]
+    handler.vertex_colours = True
+    results.append(("vertex colours", coloured,
+        timed(handler.save, coloured)))
+    for name, filename, seconds in results:
+        print "%-16s %8.3fs %10i bytes" % (name, seconds,
+            os.path.getsize(filename))
+
+if __name__ == '__main__':
+    main()
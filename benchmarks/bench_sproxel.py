@@ -0,0 +1,108 @@
+# bench_sproxel.py
+# Benchmark Sproxel CSV import and export.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Saves and loads a 127x127x127 model, randomly filled to the given density,
+# with the original per-voxel code and with the current SproxelFile handler.
+# The original loader calls set() for every voxel so it slows down sharply
+# as density increases.
+#
+# Usage: python benchmarks/bench_sproxel.py [density] [output directory]
+
+import os
+import sys
+import random
+import tempfile
+from common import create_host, timed
+from voxel import VoxelData
+
+SIZE = 127
+
+# The exporter as it was
+def legacy_save(filename, voxels):
+    f = open(filename,"wt")
+    f.write("%i,%i,%i\n" % (voxels.width, voxels.height, voxels.depth))
+    for y in xrange(voxels.height-1, -1, -1):
+        for z in xrange(voxels.depth-1, -1, -1):
+            line = []
+            for x in xrange(voxels.width):
+                voxel = voxels.get(x, y, z)
+                if voxel == 0:
+                    line.append("#00000000")
+                else:
+                    voxel = (voxel & 0xffffff00) | 0xff
+                    voxel = "%x" % voxel
+                    line.append("#"+voxel.upper().rjust(8,"0"))
+            f.write(",".join(line)+"\n")
+        f.write("\n")
+    f.close()
+
+# The importer as it was
+def legacy_load(filename, voxels):
+    f = open(filename,"rt")
+    x,y,z = f.readline().strip().split(",")
+    x = int(x)
+    y = int(y)
+    z = int(z)
+    voxels.resize(x, y, z)
+    for fy in xrange(y-1,-1,-1):
+        for fz in xrange(z-1,-1,-1):
+            line = f.readline().strip().split(",")
+            for fx in xrange(0, x):
+                if line[fx] == "#00000000":
+                    continue
+                colour = line[fx][1:]
+                r = int(colour[:2], 16)
+                g = int(colour[2:4], 16)
+                b = int(colour[4:6], 16)
+                voxels.set(fx, fy, fz, r<<24 | g<<16 | b<<8 | 0xff)
+        f.readline()
+    f.close()
+
+def build_model(density):
+    random.seed(1)
+    voxels = VoxelData()
+    voxels.resize(SIZE, SIZE, SIZE)
+    palette = [random.randint(1, 0xffffff)<<8 | 0xff for _ in xrange(16)]
+    data = voxels.blank_data()
+    for x in xrange(SIZE):
+        for y in xrange(SIZE):
+            for z in xrange(SIZE):
+                if random.random() < density:
+                    data[x][y][z] = random.choice(palette)
+    voxels.set_data(data)
+    return voxels
+
+def main():
+    density = float(sys.argv[1]) if len(sys.argv) > 1 else 0.01
+    directory = sys.argv[2] if len(sys.argv) > 2 else tempfile.mkdtemp()
+    voxels = build_model(density)
+    host = create_host(voxels)
+    handler = host.find_handler("model.csv", "save")
+    print "Model: %ix%ix%i, density %.3f" % (SIZE, SIZE, SIZE, density)
+
+    legacy = os.path.join(directory, "legacy.csv")
+    current = os.path.join(directory, "current.csv")
+    print "%-16s %8.3fs" % ("legacy save",
+        timed(legacy_save, legacy, voxels))
+    print "%-16s %8.3fs" % ("current save", timed(handler.save, current))
+    voxels.disable_undo()
+    print "%-16s %8.3fs" % ("legacy load",
+        timed(legacy_load, current, voxels))
+    print "%-16s %8.3fs" % ("current load", timed(handler.load, current))
+
+if __name__ == '__main__':
+    main()
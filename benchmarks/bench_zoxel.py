@@ -0,0 +1,148 @@
+# bench_zoxel.py
+# Benchmark the Zoxel file handler on a long animation.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Saves and loads a 200 frame walk cycle, where only the limbs move from
+# frame to frame, with the original per-voxel code and with the current
+# ZoxelFile handler storing complete frames and storing deltas.
+#
+# Usage: python benchmarks/bench_zoxel.py [frames] [output directory]
+
+import os
+import sys
+import json
+import math
+import tempfile
+from common import create_host, timed
+from voxel import VoxelData
+import shapes
+
+WIDTH = 32
+HEIGHT = 48
+DEPTH = 16
+
+# Frames in one step of the walk
+STEP = 20
+
+SKIN = 0xe0b090ff
+SHIRT = 0x3050c0ff
+TROUSERS = 0x404040ff
+
+# The exporter as it was
+def legacy_save(filename, voxels):
+    data = {'version': 1, 'frames': voxels.get_frame_count()}
+    for f in xrange(voxels.get_frame_count()):
+        frame = []
+        voxels.select_frame(f)
+        for y in range(voxels.height):
+            for z in range(voxels.depth):
+                for x in range(voxels.width):
+                    v = voxels.get(x, y, z)
+                    if v:
+                        frame.append((x,y,z,v))
+        data['frame{0}'.format(f+1)] = frame
+    data['width'] = voxels.width
+    data['height'] = voxels.height
+    data['depth'] = voxels.depth
+    f = open(filename,"wt")
+    f.write(json.dumps(data))
+    f.close()
+
+# The importer as it was
+def legacy_load(filename, voxels):
+    f = open(filename, "rt")
+    data = json.loads(f.read())
+    f.close()
+    frames = data['frames']
+    voxels.resize(data['width'], data['height'], data['depth'])
+    for f in xrange(frames):
+        for x, y, z, v in data['frame{0}'.format(f+1)]:
+            voxels.set(x, y, z, v)
+        if f < frames-1:
+            voxels.add_frame(False)
+    if frames > 1:
+        voxels.select_frame(0)
+
+# A limb two voxels thick swinging from x, y by angle
+def limb(x, y, z, length, angle):
+    dx = int(round(math.sin(angle) * length))
+    dy = -int(round(math.cos(angle) * length))
+    runs = []
+    for ox in (0, 1):
+        for oz in (0, 1):
+            runs += shapes.line(x+ox, y, z+oz, x+ox+dx, y+dy, z+oz+dx // 2)
+    return runs
+
+def build_model(frames):
+    voxels = VoxelData()
+    voxels.disable_undo()
+    voxels.resize(WIDTH, HEIGHT, DEPTH)
+    for f in xrange(frames):
+        swing = math.sin(f * 2 * math.pi / STEP) * 0.6
+        parts = [
+            (TROUSERS, limb(12, 20, 7, 18, swing)),
+            (TROUSERS, limb(18, 20, 7, 18, -swing)),
+            (SHIRT, shapes.box(11, 21, 5, 20, 36, 10)),
+            (SHIRT, limb(8, 35, 7, 13, -swing)),
+            (SHIRT, limb(22, 35, 7, 13, swing)),
+            (SKIN, shapes.box(12, 37, 5, 19, 44, 11))]
+        data = voxels.blank_data()
+        for colour, runs in parts:
+            for x, y, z0, z1 in shapes.clip(runs, WIDTH, HEIGHT, DEPTH):
+                data[x][y][z0:z1] = [colour] * (z1-z0)
+        voxels.set_data(data)
+        if f < frames-1:
+            voxels.add_frame(False)
+    voxels.select_frame(0)
+    return voxels
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    directory = sys.argv[2] if len(sys.argv) > 2 else tempfile.mkdtemp()
+    voxels = build_model(frames)
+    host = create_host(voxels)
+    handler = host.find_handler("model.zox", "save")
+    print "Model: %ix%ix%i, %i frames" % (WIDTH, HEIGHT, DEPTH, frames)
+
+    legacy = os.path.join(directory, "legacy.zox")
+    full = os.path.join(directory, "full.zox")
+    delta = os.path.join(directory, "delta.zox")
+    print "%-16s %8.3fs" % ("legacy save",
+        timed(legacy_save, legacy, voxels.copy()))
+    handler.delta_frames = False
+    print "%-16s %8.3fs" % ("full save", timed(handler.save, full))
+    handler.delta_frames = True
+    print "%-16s %8.3fs" % ("delta save", timed(handler.save, delta))
+    for filename in (legacy, full, delta):
+        print "%-16s %8iKB" % (os.path.basename(filename),
+            os.path.getsize(filename) // 1024)
+
+    loaded = VoxelData()
+    loaded.disable_undo()
+    print "%-16s %8.3fs" % ("legacy load",
+        timed(legacy_load, legacy, loaded))
+    print "%-16s %8.3fs" % ("full load", timed(host.load, full))
+    print "%-16s %8.3fs" % ("delta load", timed(host.load, delta))
+
+    # Make sure the deltas rebuilt every frame
+    result = host.load(delta)
+    for f in xrange(frames):
+        if result.get_frame_data(f) != voxels.get_frame_data(f):
+            print "Frame %i differs after loading deltas" % (f+1)
+            return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,35 @@
+# common.py
+# Shared helpers for the benchmark scripts.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from zoxel_cli import get_host
+
+# Return the headless host, with all file handlers loaded, hosting voxels
+def create_host(voxels):
+    host = get_host()
+    host.display.voxels = voxels
+    return host
+
+# Return the number of seconds taken to call function
+def timed(function, *args):
+    start = time.time()
+    function(*args)
+    return time.time() - start
@@ -0,0 +1,277 @@
+# run.py
+# Zoxel benchmark suite.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Times the core VoxelData operations and every file handler over a matrix
+# of model sizes, densities and frame counts. No display is needed.
+#
+#   python benchmarks/run.py --output results.json
+#   python benchmarks/run.py --quick --compare results.json
+#
+# Each benchmark is a function which is given a fresh model and returns the
+# callable to time, so setup is never included. A benchmark is repeated
+# until it has run for MIN_TIME or MAX_REPEATS times and the fastest run is
+# reported. Results are written as JSON so runs can be compared.
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import fnmatch
+import argparse
+import platform
+import tempfile
+from common import create_host
+from voxel import VoxelData
+from mesh import Mesh, MeshCache
+
+SIZES = (16, 32, 64, 127)
+QUICK_SIZES = (16, 32)
+DENSITIES = (0.05, 0.3)
+FRAMES = (1, 4)
+
+# Repeat each benchmark until it has taken this long in total
+MIN_TIME = 0.5
+MAX_REPEATS = 5
+
+# Colours we fill models with
+PALETTE = (0xff0000ff, 0x00ff00ff, 0x0000ffff, 0xffff00ff)
+
+# Registered benchmarks, (name, function, uses frames)
+BENCHMARKS = []
+
+def benchmark(name, frames = False):
+    def register(function):
+        BENCHMARKS.append((name, function, frames))
+        return function
+    return register
+
+# Build a model with the given number of frames, each randomly filled
+def build_model(size, density, frames):
+    rand = random.Random(size * 1000 + int(density * 100) + frames)
+    voxels = VoxelData()
+    voxels.disable_undo()
+    voxels.resize(size, size, size)
+    for f in xrange(frames):
+        data = voxels.blank_data()
+        for plane in data:
+            for column in plane:
+                for z in xrange(size):
+                    if rand.random() < density:
+                        column[z] = rand.choice(PALETTE)
+        voxels.set_data(data)
+        if f < frames-1:
+            voxels.add_frame(False)
+    voxels.select_frame(0)
+    voxels.enable_undo()
+    voxels.saved()
+    return voxels
+
+# Random coordinates and colours within a model
+def random_edits(voxels, count):
+    rand = random.Random(count)
+    return [(rand.randrange(voxels.width), rand.randrange(voxels.height),
+        rand.randrange(voxels.depth), rand.choice(PALETTE + (0,)))
+        for _ in xrange(count)]
+
+@benchmark("set")
+def bench_set(voxels):
+    edits = random_edits(voxels, 200)
+    def run():
+        for x, y, z, v in edits:
+            voxels.set(x, y, z, v)
+    return run
+
+@benchmark("cache_rebuild")
+def bench_cache_rebuild(voxels):
+    return voxels._cache_rebuild
+
+@benchmark("get_vertices")
+def bench_get_vertices(voxels):
+    return voxels.get_vertices
+
+@benchmark("get_bounding_box", True)
+def bench_get_bounding_box(voxels):
+    return voxels.get_bounding_box
+
+@benchmark("resize", True)
+def bench_resize(voxels):
+    size = voxels.width
+    return lambda: voxels.resize(size, size, size, 0)
+
+@benchmark("rotate_about_axis", True)
+def bench_rotate(voxels):
+    return lambda: voxels.rotate_about_axis(voxels.Y_AXIS)
+
+@benchmark("rotate_180", True)
+def bench_rotate_180(voxels):
+    return lambda: voxels.rotate_about_axis(voxels.Y_AXIS, 2)
+
+@benchmark("mirror", True)
+def bench_mirror(voxels):
+    return lambda: voxels.mirror(voxels.Z_AXIS)
+
+@benchmark("make_symmetric", True)
+def bench_make_symmetric(voxels):
+    return lambda: voxels.make_symmetric(voxels.X_AXIS)
+
+@benchmark("translate")
+def bench_translate(voxels):
+    return lambda: voxels.translate(1, 0, 0)
+
+@benchmark("translate_clip")
+def bench_translate_clip(voxels):
+    return lambda: voxels.translate(1, 0, 1, wrap = False)
+
+@benchmark("flood_fill")
+def bench_flood_fill(voxels):
+    # Replace the model with a solid slab of one colour holding the same
+    # number of voxels, so the fill always reaches all of them
+    data = voxels.blank_data()
+    count = len(voxels._cache)
+    for y in xrange(voxels.height):
+        for x in xrange(voxels.width):
+            for z in xrange(voxels.depth):
+                if count > 0:
+                    data[x][y][z] = PALETTE[0]
+                    count -= 1
+    voxels.set_data(data)
+    return lambda: voxels.fill(0, 0, 0, PALETTE[1])
+
+# One pass through the animation, meshing every frame as it is shown
+@benchmark("playback", True)
+def bench_playback(voxels):
+    def run():
+        for _ in xrange(voxels.get_frame_count()):
+            voxels.select_next_frame()
+            Mesh(voxels)
+    return run
+
+# One pass through the animation with every frame's mesh already cached
+@benchmark("playback_cached", True)
+def bench_playback_cached(voxels):
+    cache = MeshCache()
+    for frame in xrange(voxels.get_frame_count()):
+        cache.mesh(voxels.frame_view(frame))
+    def run():
+        for _ in xrange(voxels.get_frame_count()):
+            voxels.select_next_frame()
+            cache.mesh(voxels)
+    return run
+
+# Add save and load benchmarks for each of our file handlers
+def register_handlers(directory):
+    host = create_host(VoxelData())
+    for handler in host.handlers:
+        extension = handler.filetype.lstrip("*")
+        filename = os.path.join(directory, "model" + extension)
+        def save(voxels, handler = handler, filename = filename):
+            host.display.voxels = voxels
+            return lambda: handler.save(filename)
+        def load(voxels, filename = filename):
+            host.save(voxels, filename)
+            return lambda: host.load(filename)
+        BENCHMARKS.append(("save" + extension, save, True))
+        if hasattr(handler, "load"):
+            BENCHMARKS.append(("load" + extension, load, True))
+
+# Time a benchmark, returns (fastest time, repeats)
+def measure(function, model):
+    times = []
+    while len(times) < MAX_REPEATS and sum(times) < MIN_TIME:
+        run = function(model.copy())
+        start = time.time()
+        run()
+        times.append(time.time() - start)
+    return min(times), len(times)
+
+def key(result):
+    return (result["name"], result["size"], result["density"],
+        result["frames"])
+
+def main():
+    parser = argparse.ArgumentParser(description = "Zoxel benchmarks.")
+    parser.add_argument("-o", "--output", metavar = "FILE",
+        help = "write JSON results to FILE")
+    parser.add_argument("-c", "--compare", metavar = "FILE",
+        help = "compare against previous JSON results")
+    parser.add_argument("-f", "--filter", default = "*", metavar = "GLOB",
+        help = "only run benchmarks whose name matches")
+    parser.add_argument("--sizes", type = int, nargs = "+",
+        default = SIZES, help = "model sizes to run")
+    parser.add_argument("--densities", type = float, nargs = "+",
+        default = DENSITIES, help = "model densities to run")
+    parser.add_argument("--frames", type = int, nargs = "+",
+        default = FRAMES, help = "frame counts to run")
+    parser.add_argument("--quick", action = "store_true",
+        help = "only run the small model sizes")
+    args = parser.parse_args()
+    if args.quick:
+        args.sizes = QUICK_SIZES
+
+    previous = {}
+    if args.compare:
+        f = open(args.compare, "rt")
+        try:
+            for result in json.loads(f.read())["results"]:
+                previous[key(result)] = result["seconds"]
+        finally:
+            f.close()
+
+    directory = tempfile.mkdtemp()
+    register_handlers(directory)
+    results = []
+    try:
+        for size in args.sizes:
+            for density in args.densities:
+                for frames in args.frames:
+                    model = build_model(size, density, frames)
+                    for name, function, uses_frames in BENCHMARKS:
+                        if not fnmatch.fnmatch(name, args.filter):
+                            continue
+                        # Skip frame counts which make no difference
+                        if frames != args.frames[0] and not uses_frames:
+                            continue
+                        seconds, repeats = measure(function, model)
+                        result = {"name": name, "size": size,
+                            "density": density, "frames": frames,
+                            "seconds": seconds, "repeats": repeats}
+                        results.append(result)
+                        line = "%-20s %4i %5.2f %3i %10.4fs" % (name, size,
+                            density, frames, seconds)
+                        if key(result) in previous:
+                            line += "  x%.2f" % (
+                                seconds / max(previous[key(result)], 1e-9))
+                        print line
+                        sys.stdout.flush()
+    finally:
+        shutil.rmtree(directory, True)
+
+    if args.output:
+        f = open(args.output, "wt")
+        try:
+            f.write(json.dumps({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results}, indent = 1))
+        finally:
+            f.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# animation_export.py
+# Write rendered animation frames as an animated GIF or PNG sequence.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Frames have to be rendered on the GUI thread, which owns the GL context,
+# but rendering is quick. Encoding them is the slow part, so an
+# AnimationExport behaves like a file handler and is saved by a FileJob.
+
+import os
+from PySide import QtGui
+from file_job import FileJob
+from gif import write_gif
+
+class AnimationExport(object):
+
+    # images is a list of QImage, one per frame, and delay the time
+    # between frames in milliseconds.
+    def __init__(self, images, delay):
+        self._images = images
+        self._delay = delay
+
+    # Save as an animated GIF if the filename ends .gif, otherwise as a
+    # numbered PNG file per frame, name_0001.png and so on.
+    def save(self, filename):
+        if filename.lower().endswith(".gif"):
+            self._save_gif(filename)
+        else:
+            self._save_pngs(filename)
+
+    # Return the files saving to filename writes
+    def filenames(self, filename):
+        if filename.lower().endswith(".gif"):
+            return [filename]
+        return [self._frame_filename(filename, i)
+            for i in xrange(len(self._images))]
+
+    def _frame_filename(self, filename, index):
+        name, ext = os.path.splitext(filename)
+        return "%s_%04i%s" % (name, index+1, ext or ".png")
+
+    def _progress(self, done, total):
+        job = FileJob.current()
+        if job:
+            job.set_progress(done, total)
+
+    def _save_gif(self, filename):
+        frames = []
+        for image in self._images:
+            image = image.convertToFormat(QtGui.QImage.Format_RGB32)
+            frames.append(bytearray(image.constBits()))
+        width = self._images[0].width()
+        height = self._images[0].height()
+        with open(filename, "wb") as f:
+            write_gif(f, width, height, frames, self._delay, self._progress)
+
+    def _save_pngs(self, filename):
+        total = len(self._images)
+        for i, image in enumerate(self._images):
+            self._progress(i, total)
+            frame = self._frame_filename(filename, i)
+            if not image.save(frame, "PNG"):
+                raise Exception("Unable to write %s" % frame)
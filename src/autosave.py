@@ -0,0 +1,333 @@
+# autosave.py
+# Crash recovery through an append-only journal of edits.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# We keep two files. The snapshot is a complete copy of the model in the
+# Zoxel file format, plus the sequence number of the last edit it includes.
+# The journal is a text file with one line per edit:
+#
+#   <sequence> s <frame> <x> <y> <z> <state>     voxel set
+#   <sequence> t <frame> <x> <y> <z>             frame translated
+#   <sequence> c <frame> <x> <y> <z>             translated without wrapping
+#   <sequence> g <frame> <x> <y> <z> <states>... run of voxels set along z
+#   <sequence> r                                 anything else (resize etc.)
+#
+# These are the same edits the undo buffer records, reported to us through
+# VoxelData.notify_edit. Edits are queued in memory and appended to the
+# journal on a timer. Every so often we take a copy of the model and write
+# a new snapshot on a background thread, after which the journal entries it
+# includes are dropped. To recover we load the snapshot and replay journal
+# entries with a higher sequence number, stopping at an "r" entry as the
+# snapshot which would include it was never finished.
+#
+# Every running Zoxel holds a lock on the files it journals to, which the
+# OS releases if it crashes. A second Zoxel uses another set of files
+# rather than discarding the first one's, and only files nobody holds a
+# lock on are offered for recovery.
+
+import os
+import json
+import threading
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+from PySide import QtCore, QtGui
+from undo import Undo
+from voxel import VoxelData
+from constants import ZOXEL_VERSION
+
+# How often we write queued edits to the journal (milliseconds)
+FLUSH_INTERVAL = 2000
+# Take a new snapshot once the journal has this many entries
+COMPACT_ENTRIES = 20000
+
+# Write a snapshot of voxels to filename
+def write_snapshot(filename, voxels, sequence):
+    data = {'version': 1, 'frames': voxels.get_frame_count(),
+            'creator': "Zoxel Version "+ZOXEL_VERSION,
+            'sequence': sequence,
+            'width': voxels.width, 'height': voxels.height,
+            'depth': voxels.depth}
+    current = voxels.get_frame_number()
+    for f in xrange(voxels.get_frame_count()):
+        voxels.select_frame(f)
+        data['frame{0}'.format(f+1)] = [(x, y, z, v)
+            for x, plane in enumerate(voxels.get_data())
+                for y, column in enumerate(plane)
+                    for z, v in enumerate(column) if v]
+    voxels.select_frame(current)
+    # Write to a temporary file first so we never leave a partial snapshot
+    temp = filename+".tmp"
+    f = open(temp, "wt")
+    try:
+        f.write(json.dumps(data))
+        f.flush()
+        os.fsync(f.fileno())
+    finally:
+        f.close()
+    _replace(temp, filename)
+
+# Rename temp to filename, replacing it. On POSIX this happens in one step,
+# so a crash leaves either the old file or the new one.
+def _replace(temp, filename):
+    try:
+        os.rename(temp, filename)
+    except OSError:
+        # Windows won't rename over an existing file
+        if not os.path.exists(filename):
+            raise
+        os.remove(filename)
+        os.rename(temp, filename)
+
+# Lock filename for as long as we run. Returns the open lock file, which
+# must be kept open to keep the lock, or None if another process holds it.
+def _lock(filename):
+    f = open(filename, "a+")
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except (IOError, OSError):
+        f.close()
+        return None
+    return f
+
+# Read a snapshot, returning the model and the sequence number it includes
+def read_snapshot(filename):
+    f = open(filename, "rt")
+    try:
+        data = json.loads(f.read())
+    finally:
+        f.close()
+    voxels = VoxelData()
+    voxels.disable_undo()
+    voxels.resize(data['width'], data['height'], data['depth'])
+    for f in xrange(data['frames']):
+        frame = voxels.blank_data()
+        for x, y, z, v in data['frame{0}'.format(f+1)]:
+            frame[x][y][z] = v
+        voxels.set_data(frame)
+        if f < data['frames']-1:
+            voxels.add_frame(False)
+    voxels.select_frame(0)
+    return voxels, data['sequence']
+
+class AutoSave(QtCore.QObject):
+
+    def __init__(self, parent = None, directory = None):
+        super(AutoSave, self).__init__(parent)
+        if directory is None:
+            directory = QtGui.QDesktopServices.storageLocation(
+                QtGui.QDesktopServices.DataLocation)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._directory = directory
+        self._lock = None
+        self._claim()
+        self._voxels = None
+        self._file = None
+        self._sequence = 0
+        self._pending = []
+        self._entries = 0
+        # Snapshot in progress, and the sequence number it includes
+        self._thread = None
+        self._thread_sequence = 0
+        self._compact = False
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self.flush)
+
+    # Return the name of a file of the given session number
+    def _filename(self, session, extension):
+        if session:
+            return os.path.join(self._directory,
+                "autosave-%i%s" % (session, extension))
+        return os.path.join(self._directory, "autosave" + extension)
+
+    # Lock the files of a session no other running Zoxel is using,
+    # preferring one which a crashed session left behind
+    def _claim(self):
+        session = 0
+        while True:
+            lock_file = self._filename(session, ".lock")
+            left = os.path.exists(self._filename(session, ".zox"))
+            if self._lock and not left:
+                # Only sessions which have run before can be left over
+                if not os.path.exists(lock_file):
+                    return
+            else:
+                lock = _lock(lock_file)
+                if lock:
+                    if self._lock:
+                        self._lock.close()
+                    self._lock = lock
+                    self._snapshot = self._filename(session, ".zox")
+                    self._journal = self._filename(session, ".journal")
+                    if left:
+                        return
+            session += 1
+
+    # Is there anything left over from a previous session?
+    def can_recover(self):
+        return os.path.exists(self._snapshot)
+
+    # Rebuild the model from our snapshot and journal
+    def recover(self):
+        voxels, base = read_snapshot(self._snapshot)
+        if os.path.exists(self._journal):
+            f = open(self._journal, "rt")
+            try:
+                for line in f:
+                    if not line.endswith("\n"):
+                        # Incomplete final line, we crashed mid write
+                        break
+                    entry = line.split()
+                    if int(entry[0]) <= base:
+                        continue
+                    kind = entry[1]
+                    if kind == "r":
+                        break
+                    entry = [int(n) for n in entry[2:]]
+                    voxels.select_frame(entry[0])
+                    if kind == "s":
+                        voxels.set(entry[1], entry[2], entry[3], entry[4],
+                            False)
+                    elif kind == "t":
+                        voxels.translate(entry[1], entry[2], entry[3], False)
+                    elif kind == "c":
+                        voxels.translate(entry[1], entry[2], entry[3], False,
+                            False)
+                    elif kind == "g":
+                        voxels.set_region([(entry[1], entry[2], entry[3],
+                            entry[4:])], False)
+            finally:
+                f.close()
+        voxels.select_frame(0)
+        voxels.enable_undo()
+        voxels.changed = True
+        return voxels
+
+    # Start journaling the given model, discarding any previous session
+    def attach(self, voxels):
+        self.detach()
+        self.discard()
+        self._voxels = voxels
+        self._file = open(self._journal, "at")
+        voxels.notify_edit = self.on_edit
+        self._timer.start(FLUSH_INTERVAL)
+        self._request_snapshot()
+
+    # Stop journaling
+    def detach(self):
+        self._timer.stop()
+        if self._voxels:
+            self._voxels.notify_edit = None
+            self._voxels = None
+        self._wait_snapshot()
+        if self._file:
+            self._file.close()
+            self._file = None
+        self._pending = []
+
+    # Remove our files, we no longer need them
+    def discard(self):
+        self._wait_snapshot()
+        for filename in (self._snapshot, self._journal):
+            if os.path.exists(filename):
+                os.remove(filename)
+        self._entries = 0
+
+    # Edit callback from VoxelData
+    def on_edit(self, frame, item):
+        self._sequence += 1
+        if item is None:
+            self._pending.append("%i r\n" % self._sequence)
+            self._compact = True
+        elif item.operation == Undo.SET_VOXEL:
+            self._pending.append("%i s %i %i %i %i %i\n" %
+                ((self._sequence, frame) + item.newdata))
+        elif item.operation == Undo.TRANSLATE:
+            self._pending.append("%i t %i %i %i %i\n" %
+                ((self._sequence, frame) + item.newdata))
+        elif item.operation == Undo.SHIFT:
+            self._pending.append("%i c %i %i %i %i\n" %
+                ((self._sequence, frame) + item.newdata))
+        elif item.operation == Undo.SET_REGION:
+            # One line per run, all sharing the same sequence number
+            for x, y, z, states in item.newdata:
+                self._pending.append("%i g %i %i %i %i %s\n" %
+                    (self._sequence, frame, x, y, z,
+                    " ".join(str(state) for state in states)))
+
+    # Write queued edits to the journal, snapshot if it's time to
+    def flush(self):
+        if not self._file:
+            return
+        if self._pending:
+            self._file.writelines(self._pending)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._entries += len(self._pending)
+            self._pending = []
+        # Has a snapshot finished?
+        if self._thread and not self._thread.is_alive():
+            self._thread = None
+            self._trim_journal(self._thread_sequence)
+        if self._compact or self._entries > COMPACT_ENTRIES:
+            self._request_snapshot()
+
+    # Copy the model and write the copy to a snapshot in the background
+    def _request_snapshot(self):
+        if self._thread:
+            # Try again when this one is done
+            self._compact = True
+            return
+        self._compact = False
+        self._thread_sequence = self._sequence
+        voxels = self._voxels.copy()
+        self._thread = threading.Thread(target = write_snapshot,
+            args = (self._snapshot, voxels, self._sequence))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _wait_snapshot(self):
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    # Drop journal entries included in the snapshot
+    def _trim_journal(self, sequence):
+        self._file.close()
+        f = open(self._journal, "rt")
+        try:
+            keep = [line for line in f if line.endswith("\n")
+                and int(line.split(" ", 1)[0]) > sequence]
+        finally:
+            f.close()
+        temp = self._journal+".tmp"
+        f = open(temp, "wt")
+        try:
+            f.writelines(keep)
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        _replace(temp, self._journal)
+        self._entries = len(keep)
+        self._file = open(self._journal, "at")
@@ -0,0 +1,25 @@
+# dialog_export_image.py
+# Prompt for the size of an exported image.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from PySide import QtGui
+from ui_dialog_export_image import Ui_ExportImageDialog
+
+class ExportImageDialog(QtGui.QDialog):
+    def __init__(self, parent=None):
+        # Initialise the UI
+        super(ExportImageDialog, self).__init__(parent)
+        self.ui = Ui_ExportImageDialog()
+        self.ui.setupUi(self)
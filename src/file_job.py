@@ -0,0 +1,125 @@
+# file_job.py
+# Runs file handlers (importers/exporters) on a worker thread.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# A FileJob calls a handler's load() or save() on its own thread against a
+# VoxelData which nobody else is using. While the job runs, the plugin API
+# hands that VoxelData to the handler instead of the one being displayed.
+# Handlers report progress through the API, which is also where we raise
+# OperationCancelled if the user has asked us to stop.
+
+import threading
+from PySide import QtCore
+
+# Raised inside a handler when its job has been cancelled
+class OperationCancelled(Exception):
+    pass
+
+# The job running on the current thread
+_local = threading.local()
+
+class FileJob(QtCore.QThread):
+
+    # Types of job
+    LOAD = 1
+    SAVE = 2
+
+    # Percentage complete
+    progress = QtCore.Signal(int)
+
+    @property
+    def operation(self):
+        return self._operation
+
+    @property
+    def handler(self):
+        return self._handler
+
+    @property
+    def filename(self):
+        return self._filename
+
+    @property
+    def voxels(self):
+        return self._voxels
+
+    # The exception raised by the handler, if any
+    @property
+    def error(self):
+        return self._error
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    # Warnings raised by the handler, to be displayed once we finish
+    @property
+    def warnings(self):
+        return self._warnings
+
+    @property
+    def succeeded(self):
+        return (self.isFinished() and not self._error
+            and not self._cancelled)
+
+    def __init__(self, operation, handler, filename, voxels, parent = None):
+        super(FileJob, self).__init__(parent)
+        self._operation = operation
+        self._handler = handler
+        self._filename = filename
+        self._voxels = voxels
+        self._error = None
+        self._cancel = False
+        self._cancelled = False
+        self._warnings = []
+        self._percent = -1
+
+    # Return the job running on the calling thread, or None
+    @staticmethod
+    def current():
+        return getattr(_local, "job", None)
+
+    def run(self):
+        _local.job = self
+        try:
+            if self._operation == self.LOAD:
+                self._handler.load(self._filename)
+            else:
+                self._handler.save(self._filename)
+        except OperationCancelled:
+            self._cancelled = True
+        except Exception as Ex:
+            self._error = Ex
+        finally:
+            _local.job = None
+
+    # Ask the job to stop at the next progress report
+    def cancel(self):
+        self._cancel = True
+
+    # Called from the handler (via the plugin API) as it works
+    def set_progress(self, done, total):
+        if self._cancel:
+            raise OperationCancelled()
+        percent = 0
+        if total:
+            percent = min(100, (100 * done) // total)
+        if percent != self._percent:
+            self._percent = percent
+            self.progress.emit(percent)
+
+    def warning(self, message):
+        self._warnings.append(message)
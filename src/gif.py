@@ -0,0 +1,188 @@
+# gif.py
+# Write animated GIF files.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Qt can read GIF files but not write them, so we write them ourselves.
+# Frames are given as raw 32 bit pixels, blue, green, red then alpha, as a
+# QImage of Format_RGB32 stores them. Every frame shares one palette of up
+# to 256 colours, chosen by median cut across all of the frames so colours
+# don't flicker from frame to frame.
+
+import struct
+from itertools import izip
+
+# Colours are reduced to 5 bits per channel before building the palette
+_FIVE_BITS = bytearray(i >> 3 for i in xrange(256))
+
+# Return the 15 bit colour of each pixel in a frame
+def _colours(pixels):
+    pixels = bytearray(pixels)
+    blue = pixels[0::4].translate(_FIVE_BITS)
+    green = pixels[1::4].translate(_FIVE_BITS)
+    red = pixels[2::4].translate(_FIVE_BITS)
+    return [r << 10 | g << 5 | b for r, g, b in izip(red, green, blue)]
+
+# Return (range, shift) of the channel of a box of colours with the widest
+# range of values, shift being the channel's position in the colour.
+def _widest(box):
+    widest = (-1, 0)
+    for shift in (10, 5, 0):
+        values = [colour >> shift & 31 for colour, _ in box]
+        widest = max(widest, (max(values) - min(values), shift))
+    return widest
+
+# Split colours, a list of (colour, count), into at most size boxes by
+# median cut and return a palette of the average colour of each box, and a
+# dictionary mapping each colour to its palette index.
+def _median_cut(colours, size):
+    boxes = [(_widest(colours), colours)]
+    while len(boxes) < size:
+        # Split the box with the widest range of any channel
+        i = max(xrange(len(boxes)), key = lambda i: boxes[i][0])
+        (spread, shift), box = boxes[i]
+        if spread <= 0:
+            break
+        box = sorted(box, key = lambda c: c[0] >> shift & 31)
+        # Split at the median pixel, keeping at least one colour each side
+        half = sum(count for _, count in box) / 2.0
+        total = 0
+        for split, (_, count) in enumerate(box):
+            total += count
+            if total >= half:
+                break
+        split = max(1, min(split, len(box)-1))
+        boxes[i:i+1] = [(_widest(part), part)
+            for part in (box[:split], box[split:])]
+    palette = []
+    lookup = {}
+    for index, (_, box) in enumerate(boxes):
+        total = sum(count for _, count in box)
+        channels = []
+        for shift in (10, 5, 0):
+            value = sum((colour >> shift & 31) * count
+                for colour, count in box) / float(total)
+            # Back to 8 bits, from the middle of the 5 bit range
+            channels.append(min(255, int(value * 8 + 4)))
+        palette.append(tuple(channels))
+        for colour, _ in box:
+            lookup[colour] = index
+    return palette, lookup
+
+# Compress palette indices with GIF's variable length LZW
+def _lzw(indices, min_size):
+    clear = 1 << min_size
+    end = clear + 1
+    out = bytearray()
+    # Bits waiting to be written, and how many
+    buffered = 0
+    count = 0
+    size = min_size + 1
+    codes = dict((chr(i), i) for i in xrange(clear))
+    next_code = end + 1
+    # Start with a clear code
+    buffered |= clear << count
+    count += size
+    word = ""
+    for index in str(indices):
+        extended = word + index
+        if extended in codes:
+            word = extended
+            continue
+        buffered |= codes[word] << count
+        count += size
+        while count >= 8:
+            out.append(buffered & 0xff)
+            buffered >>= 8
+            count -= 8
+        if next_code == 4096:
+            # Table is full, start again
+            buffered |= clear << count
+            count += size
+            codes = dict((chr(i), i) for i in xrange(clear))
+            next_code = end + 1
+            size = min_size + 1
+        else:
+            if next_code >= 1 << size:
+                size += 1
+            codes[extended] = next_code
+            next_code += 1
+        word = index
+    if word:
+        buffered |= codes[word] << count
+        count += size
+    buffered |= end << count
+    count += size
+    while count > 0:
+        out.append(buffered & 0xff)
+        buffered >>= 8
+        count -= 8
+    return out
+
+# Split data into GIF sub-blocks
+def _blocks(data):
+    out = bytearray()
+    for i in xrange(0, len(data), 255):
+        chunk = data[i:i+255]
+        out.append(len(chunk))
+        out += chunk
+    out.append(0)
+    return out
+
+# Write an animated GIF to the file f. frames is a list of raw pixels for
+# each frame, see above, and delay is the time between frames in
+# milliseconds. progress, if given, is called with (done, total) as each
+# frame is written.
+def write_gif(f, width, height, frames, delay, progress = None):
+    total = len(frames) * 2
+    # Build our palette from every frame
+    histogram = {}
+    colours = []
+    for i, pixels in enumerate(frames):
+        if progress:
+            progress(i, total)
+        frame = _colours(pixels)
+        for colour in set(frame):
+            histogram[colour] = 0
+        colours.append(frame)
+    for frame in colours:
+        for colour in frame:
+            histogram[colour] += 1
+    palette, lookup = _median_cut(histogram.items(), 256)
+    # The colour table must have a power of two entries
+    bits = 1
+    while (1 << bits) < len(palette):
+        bits += 1
+    palette += [(0, 0, 0)] * ((1 << bits) - len(palette))
+
+    # Header, screen descriptor and global colour table
+    f.write(b"GIF89a")
+    f.write(struct.pack("<HHBBB", width, height, 0xf0 | (bits-1), 0, 0))
+    f.write(bytearray(channel for colour in palette for channel in colour))
+    # Loop forever
+    f.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00")
+    min_size = max(bits, 2)
+    for i, frame in enumerate(colours):
+        if progress:
+            progress(len(frames) + i, total)
+        # Graphic control extension, for the frame delay
+        f.write(struct.pack("<BBBBHBB", 0x21, 0xf9, 4, 0,
+            int(round(delay / 10.0)), 0, 0))
+        # Image descriptor, then the image
+        f.write(struct.pack("<BHHHHB", 0x2c, 0, 0, width, height, 0))
+        f.write(chr(min_size))
+        indices = bytearray(map(lookup.__getitem__, frame))
+        f.write(_blocks(_lzw(indices, min_size)))
+    f.write(b"\x3b")
@@ -0,0 +1,9 @@
+# Load the file handler (importer/exporter) plugins. These don't need a GUI,
+# so they can also be loaded by zoxel_cli.
+# This could (should) be replaced by dynamic module loading, but we do it
+# this way to support cx-freeze on Windows.
+import plugins.io_zoxel
+import plugins.io_sproxel
+import plugins.io_obj
+import plugins.io_qubicle
+import plugins.io_preview
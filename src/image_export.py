@@ -0,0 +1,59 @@
+# image_export.py
+# Export images of the model at any size.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Images are rendered by GLWidget.render_tiles() a band of rows at a time
+# and each band is compressed into the PNG file before the next is
+# rendered, so poster sized images can be exported without holding them
+# in memory. Rendering needs the GL context, so this runs on the GUI thread.
+
+import sys
+from PySide import QtGui
+from png_writer import PngWriter
+
+# Where red, green, blue and alpha are in the bytes of a Format_ARGB32
+# pixel, which is stored as a native 32 bit integer
+if sys.byteorder == "little":
+    _CHANNELS = (2, 1, 0, 3)
+else:
+    _CHANNELS = (1, 2, 3, 0)
+
+# Return the pixels of a QImage as RGBA bytes, or RGB if not alpha
+def _pixels(image, alpha):
+    image = image.convertToFormat(QtGui.QImage.Format_ARGB32)
+    data = bytearray(image.constBits())
+    channels = 4 if alpha else 3
+    pixels = bytearray(len(data) // 4 * channels)
+    for i in xrange(channels):
+        pixels[i::channels] = data[_CHANNELS[i]::4]
+    return pixels
+
+# Render the display's view at width x height into a PNG file. See
+# GLWidget.render_tiles() for supersample and transparent. progress, if
+# given, is called with (rows done, height) after each band, and may raise
+# an exception to stop.
+def export_image(display, filename, width, height, supersample = 1,
+    transparent = False, progress = None):
+    with open(filename, "wb") as f:
+        writer = PngWriter(f, width, height, transparent)
+        done = 0
+        for band in display.render_tiles(width, height, supersample,
+            transparent):
+            writer.write(_pixels(band, transparent))
+            done += band.height()
+            if progress:
+                progress(done, height)
+        writer.close()
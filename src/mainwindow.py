@@ -19,8 +19,17 @@ from PySide import QtCore
 from PySide import QtGui
 from dialog_about import AboutDialog
 from dialog_resize import ResizeDialog
+from dialog_export_animation import ExportAnimationDialog
+from animation_export import AnimationExport
+from dialog_export_image import ExportImageDialog
+from image_export import export_image
 from ui_mainwindow import Ui_MainWindow
 from voxel_widget import GLWidget
+from voxel import VoxelData
+from file_job import FileJob, OperationCancelled
+from autosave import AutoSave
+from selection import Selection
+from profiler import profiler
 import json
 from palette_widget import PaletteWidget
 import os
@@ -85,6 +94,28 @@ class MainWindow(QtGui.QMainWindow):
             self.ui.action_voxel_edges.setChecked(value)
         else:
             self.ui.action_voxel_edges.setChecked(self.display.voxel_edges)
+        value = self.get_setting("performance_overlay")
+        if value is not None:
+            self.display.performance_overlay = value
+            self.ui.action_performance_overlay.setChecked(value)
+        # Onion skinning choices are exclusive
+        self._onion_skin_group = QtGui.QActionGroup(self)
+        self._onion_skin_actions = (self.ui.action_onion_skin_off,
+            self.ui.action_onion_skin_1, self.ui.action_onion_skin_2,
+            self.ui.action_onion_skin_3)
+        for action in self._onion_skin_actions:
+            self._onion_skin_group.addAction(action)
+        value = self.get_setting("onion_skin")
+        if value is None:
+            value = 0
+        self.display.onion_skin = value
+        self._onion_skin_actions[value].setChecked(True)
+        self.ui.action_delta_frames.setChecked(
+            bool(self.get_setting("delta_frames")))
+        value = self.get_setting("prebake_frames")
+        if value is None:
+            value = True
+        self.ui.action_anim_prebake.setChecked(value)
         value = self.get_setting("occlusion")
         if value is None:
             value = True
@@ -97,11 +128,20 @@ class MainWindow(QtGui.QMainWindow):
             self.display.start_drag_event.connect(self.on_tool_drag_start)
             self.display.end_drag_event.connect(self.on_tool_drag_end)
             self.display.drag_event.connect(self.on_tool_drag)
+            self.display.mesh_changed.connect(self.on_mesh_changed)
         if self.colour_palette:
             self.colour_palette.changed.connect(self.on_colour_changed)
         # Initialise our tools
         self._tool_group = QtGui.QActionGroup(self.ui.toolbar_drawing)
         self._tools = []
+        # Selected voxels and what was last copied
+        self.selection = Selection()
+        self.selection.notify_changed = self.on_selection_changed
+        self._clipboard = None
+        # Crash recovery
+        self._autosave = AutoSave(self)
+        # Keep timings of our hot paths only when asked to
+        self.update_recording()
         # Setup window
         self.update_caption()
         self.refresh_actions()
@@ -140,6 +180,7 @@ class MainWindow(QtGui.QMainWindow):
                 return
         # Clear our data
         self._filename = ""
+        self.selection.clear()
         self.display.clear()
         self.display.voxels.saved()
         self.update_caption()
@@ -177,6 +218,37 @@ class MainWindow(QtGui.QMainWindow):
         self.display.voxels.redo()
         self.display.refresh()
 
+    @QtCore.Slot()
+    def on_action_cut_triggered(self):
+        self._clipboard = self.selection.cut(self.display.voxels)
+        self.display.refresh()
+        self.refresh_actions()
+
+    @QtCore.Slot()
+    def on_action_copy_triggered(self):
+        self._clipboard = self.selection.copy(self.display.voxels)
+        self.refresh_actions()
+
+    @QtCore.Slot()
+    def on_action_paste_triggered(self):
+        # Paste back where it was copied from, the selection tool can then
+        # move it
+        self.selection.paste(self.display.voxels, self._clipboard)
+        self.display.refresh()
+
+    @QtCore.Slot()
+    def on_action_delete_triggered(self):
+        self.selection.delete(self.display.voxels)
+        self.display.refresh()
+
+    @QtCore.Slot()
+    def on_action_select_none_triggered(self):
+        self.selection.clear()
+
+    def on_selection_changed(self):
+        self.display.selection = self.selection.runs
+        self.refresh_actions()
+
     @QtCore.Slot()
     def on_action_resize_triggered(self):
         # Resize model dimensions
@@ -202,6 +274,52 @@ class MainWindow(QtGui.QMainWindow):
         self.set_setting("default_model_height", height)
         self.set_setting("default_model_depth", depth)
 
+    @QtCore.Slot()
+    def on_action_indexed_colour_triggered(self):
+        voxels = self.display.voxels
+        try:
+            if self.ui.action_indexed_colour.isChecked():
+                voxels.to_indexed()
+            else:
+                voxels.to_rgb()
+        except ValueError as Ex:
+            QtGui.QMessageBox.warning(self, "Indexed Colour", str(Ex))
+        self.display.refresh()
+        self.refresh_actions()
+
+    @QtCore.Slot()
+    def on_action_recolour_triggered(self):
+        # Recolour the palette entry of the current colour
+        voxels = self.display.voxels
+        colour = self.colour_palette.colour
+        r, g, b, _ = colour.getRgb()
+        try:
+            index = voxels.palette.index(r<<24 | g<<16 | b<<8 | 0xff)
+        except ValueError:
+            QtGui.QMessageBox.information(self, "Recolour Palette Entry",
+                "No voxels use the current colour.")
+            return
+        colour = QtGui.QColorDialog.getColor(colour)
+        if colour.isValid():
+            voxels.set_palette_colour(index, colour)
+            self.colour_palette.colour = colour
+            # Only the palette changed, the meshes are still good
+            self.display.updateGL()
+
+    @QtCore.Slot()
+    def on_action_replace_colour_triggered(self):
+        # Replace the current colour everywhere with another
+        colour = self.colour_palette.colour
+        replacement = QtGui.QColorDialog.getColor(colour)
+        if not replacement.isValid():
+            return
+        if not self.display.voxels.replace_colour(colour, replacement):
+            QtGui.QMessageBox.information(self, "Replace Colour",
+                "No voxels use the current colour.")
+            return
+        self.colour_palette.colour = replacement
+        self.display.refresh()
+
     @QtCore.Slot()
     def on_action_reset_camera_triggered(self):
         self.display.reset_camera()
@@ -235,14 +353,51 @@ class MainWindow(QtGui.QMainWindow):
 
     @QtCore.Slot()
     def on_action_anim_play_triggered(self):
+        if self.ui.action_anim_prebake.isChecked():
+            self.display.bake_frames()
         self._timer.start(self._anim_speed)
         self.refresh_actions()
 
     @QtCore.Slot()
     def on_action_anim_stop_triggered(self):
         self._timer.stop()
+        self.display.cancel_bake()
         self.refresh_actions()
 
+    @QtCore.Slot()
+    def on_action_onion_skin_off_triggered(self):
+        self.set_onion_skin(0)
+
+    @QtCore.Slot()
+    def on_action_onion_skin_1_triggered(self):
+        self.set_onion_skin(1)
+
+    @QtCore.Slot()
+    def on_action_onion_skin_2_triggered(self):
+        self.set_onion_skin(2)
+
+    @QtCore.Slot()
+    def on_action_onion_skin_3_triggered(self):
+        self.set_onion_skin(3)
+
+    # Show this many frames either side of the current one as ghosts
+    def set_onion_skin(self, frames):
+        self.display.onion_skin = frames
+        self.set_setting("onion_skin", frames)
+
+    @QtCore.Slot()
+    def on_action_delta_frames_triggered(self):
+        value = self.ui.action_delta_frames.isChecked()
+        self.set_setting("delta_frames", value)
+        for handler in self._file_handlers:
+            if hasattr(handler, "delta_frames"):
+                handler.delta_frames = value
+
+    @QtCore.Slot()
+    def on_action_anim_prebake_triggered(self):
+        self.set_setting("prebake_frames",
+            self.ui.action_anim_prebake.isChecked())
+
     @QtCore.Slot()
     def on_action_anim_next_triggered(self):
         self.display.voxels.select_next_frame()
@@ -259,6 +414,70 @@ class MainWindow(QtGui.QMainWindow):
     def on_action_anim_settings_triggered(self):
         pass
 
+    @QtCore.Slot()
+    def on_action_mirror_x_triggered(self):
+        self.display.voxels.mirror(self.display.voxels.X_AXIS)
+        self.display.refresh()
+
+    @QtCore.Slot()
+    def on_action_mirror_y_triggered(self):
+        self.display.voxels.mirror(self.display.voxels.Y_AXIS)
+        self.display.refresh()
+
+    @QtCore.Slot()
+    def on_action_mirror_z_triggered(self):
+        self.display.voxels.mirror(self.display.voxels.Z_AXIS)
+        self.display.refresh()
+
+    @QtCore.Slot()
+    def on_action_symmetric_x_triggered(self):
+        self.display.voxels.make_symmetric(self.display.voxels.X_AXIS)
+        self.display.refresh()
+
+    @QtCore.Slot()
+    def on_action_symmetric_y_triggered(self):
+        self.display.voxels.make_symmetric(self.display.voxels.Y_AXIS)
+        self.display.refresh()
+
+    @QtCore.Slot()
+    def on_action_symmetric_z_triggered(self):
+        self.display.voxels.make_symmetric(self.display.voxels.Z_AXIS)
+        self.display.refresh()
+
+    @QtCore.Slot()
+    def on_action_symmetry_x_triggered(self):
+        self.apply_symmetry(self.display.voxels)
+
+    @QtCore.Slot()
+    def on_action_symmetry_y_triggered(self):
+        self.apply_symmetry(self.display.voxels)
+
+    @QtCore.Slot()
+    def on_action_symmetry_z_triggered(self):
+        self.apply_symmetry(self.display.voxels)
+
+    @QtCore.Slot()
+    def on_action_symmetry_centre_triggered(self):
+        self.apply_symmetry(self.display.voxels)
+
+    # Mirror edits to the model as our symmetry actions say
+    def apply_symmetry(self, voxels):
+        axes = []
+        if self.ui.action_symmetry_x.isChecked():
+            axes.append(voxels.X_AXIS)
+        if self.ui.action_symmetry_y.isChecked():
+            axes.append(voxels.Y_AXIS)
+        if self.ui.action_symmetry_z.isChecked():
+            axes.append(voxels.Z_AXIS)
+        voxels.symmetry = axes
+        centre = None
+        if self.ui.action_symmetry_centre.isChecked():
+            x, y, z, width, height, depth = voxels.get_bounding_box()
+            if width > 0:
+                centre = (x + (width-1) / 2.0, y + (height-1) / 2.0,
+                    z + (depth-1) / 2.0)
+        voxels.symmetry_centre = centre
+
     @QtCore.Slot()
     def on_action_rotate_x_triggered(self):
         self.display.voxels.rotate_about_axis(self.display.voxels.X_AXIS)
@@ -303,33 +522,159 @@ class MainWindow(QtGui.QMainWindow):
         # Save the PNG
         png.save(filename,filetype.split()[0])
 
+    @QtCore.Slot()
+    def on_action_export_large_image_triggered(self):
+        # Ask for the size, starting from the size of our view
+        dialog = ExportImageDialog(self)
+        dialog.ui.width.setValue(self.display.width())
+        dialog.ui.height.setValue(self.display.height())
+        if not dialog.exec_():
+            return
+        directory = self.get_setting("default_directory")
+        filename, _ = QtGui.QFileDialog.getSaveFileName(self,
+            caption = "Export Image As",
+            filter = "PNG Image (*.png)",
+            dir = directory)
+        if not filename:
+            return
+        directory = os.path.dirname(filename)
+        self.set_setting("default_directory", directory)
+
+        # Rendering needs our GL context, so keep the UI alive between the
+        # bands of the image ourselves
+        progress = QtGui.QProgressDialog("Exporting %s"
+            % os.path.basename(filename), "Cancel", 0, 100, self)
+        progress.setWindowTitle("Zoxel")
+        progress.setWindowModality(QtCore.Qt.WindowModal)
+        height = dialog.ui.height.value()
+        def update(done, total):
+            progress.setValue((100 * done) // total)
+            QtGui.QApplication.processEvents()
+            if progress.wasCanceled():
+                raise OperationCancelled()
+        try:
+            export_image(self.display, filename, dialog.ui.width.value(),
+                height, 1 << dialog.ui.supersample.currentIndex(),
+                dialog.ui.transparent.isChecked(), update)
+        except Exception as Ex:
+            # Don't leave a partial image behind
+            if os.path.exists(filename):
+                os.remove(filename)
+            if not isinstance(Ex, OperationCancelled):
+                QtGui.QMessageBox.warning(self, "Export Failed", str(Ex))
+        progress.deleteLater()
+
+    @QtCore.Slot()
+    def on_action_export_animation_triggered(self):
+        # Ask for the size, starting from the size of our view
+        dialog = ExportAnimationDialog(self)
+        dialog.ui.width.setValue(self.display.width())
+        dialog.ui.height.setValue(self.display.height())
+        dialog.ui.delay.setValue(self._anim_speed)
+        if not dialog.exec_():
+            return
+        choices = "Animated GIF (*.gif);;PNG Sequence (*.png)"
+        directory = self.get_setting("default_directory")
+        filename, _ = QtGui.QFileDialog.getSaveFileName(self,
+            caption = "Export Animation As",
+            filter = choices,
+            dir = directory)
+        if not filename:
+            return
+        directory = os.path.dirname(filename)
+        self.set_setting("default_directory", directory)
+
+        # Render every frame from our camera, then encode them in the
+        # background
+        QtGui.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+        try:
+            images = self.display.render_frames(dialog.ui.width.value(),
+                dialog.ui.height.value())
+        except Exception as Ex:
+            QtGui.QMessageBox.warning(self, "Export Failed", str(Ex))
+            return
+        finally:
+            QtGui.QApplication.restoreOverrideCursor()
+        export = AnimationExport(images, dialog.ui.delay.value())
+        job = FileJob(FileJob.SAVE, export, filename, None)
+        self.run_file_job(job, "Exporting %s" % os.path.basename(filename))
+        if job.cancelled or job.error:
+            # Don't leave a partial animation behind
+            for name in export.filenames(filename):
+                if os.path.exists(name):
+                    os.remove(name)
+        if job.error:
+            QtGui.QMessageBox.warning(self, "Export Failed", str(job.error))
+        elif job.cancelled:
+            QtGui.QMessageBox.information(self, "Export Cancelled",
+                "The animation was not exported.")
+
+    @QtCore.Slot()
+    def on_action_performance_overlay_triggered(self):
+        self.display.performance_overlay = (
+            self.ui.action_performance_overlay.isChecked())
+        self.set_setting("performance_overlay",
+            self.display.performance_overlay)
+        self.update_recording()
+
+    @QtCore.Slot()
+    def on_action_record_trace_triggered(self):
+        self.update_recording()
+
+    # Record every timing while the performance overlay is shown or we are
+    # asked to record a trace. A new recording starts afresh.
+    def update_recording(self):
+        recording = (self.ui.action_performance_overlay.isChecked()
+            or self.ui.action_record_trace.isChecked())
+        if recording and not profiler.recording:
+            profiler.clear()
+        profiler.recording = recording
+
+    @QtCore.Slot()
+    def on_action_export_trace_triggered(self):
+        directory = self.get_setting("default_directory")
+        filename, _ = QtGui.QFileDialog.getSaveFileName(self,
+            caption = "Export Performance Trace As",
+            filter = "Trace Files (*.json)",
+            dir = directory)
+        if not filename:
+            return
+        try:
+            profiler.export(filename)
+        except Exception as Ex:
+            QtGui.QMessageBox.warning(self, "Export Failed", str(Ex))
+
     def on_tool_mouse_click(self):
         tool = self.get_active_tool()
         if not tool:
             return
         data = self.display.target
-        tool.on_mouse_click(data)
+        with profiler.span("on_mouse_click"):
+            tool.on_mouse_click(data)
 
     def on_tool_drag_start(self):
         tool = self.get_active_tool()
         if not tool:
             return
         data = self.display.target
-        tool.on_drag_start(data)
+        with profiler.span("on_drag_start"):
+            tool.on_drag_start(data)
 
     def on_tool_drag(self):
         tool = self.get_active_tool()
         if not tool:
             return
         data = self.display.target
-        tool.on_drag(data)
+        with profiler.span("on_drag"):
+            tool.on_drag(data)
 
     def on_tool_drag_end(self):
         tool = self.get_active_tool()
         if not tool:
             return
         data = self.display.target
-        tool.on_drag_end(data)
+        with profiler.span("on_drag_end"):
+            tool.on_drag_end(data)
 
     # Confirm if user wants to save before doing something drastic.
     # returns True if we should continue
@@ -350,6 +695,12 @@ class MainWindow(QtGui.QMainWindow):
         self.update_caption()
         self.refresh_actions()
 
+    # The display shows new voxel data, show its colours in the palette
+    def on_mesh_changed(self):
+        if self.colour_palette:
+            self.colour_palette.used_colours = \
+                self.display.voxels.get_colour_counts().items()
+
     # Colour selection changed handler
     def on_colour_changed(self):
         self.display.voxel_colour = self.colour_palette.colour
@@ -371,8 +722,33 @@ class MainWindow(QtGui.QMainWindow):
             if not self.confirm_save():
                 event.ignore()
                 return
+        # We exited cleanly, so no need to recover anything next time
+        self._autosave.detach()
+        self._autosave.discard()
         event.accept()
 
+    # Offer to recover the model from a previous session which did not exit
+    # cleanly, then start autosaving
+    def start_autosave(self):
+        if self._autosave.can_recover():
+            responce = QtGui.QMessageBox.question(self, "Recover model?",
+                "Zoxel did not exit cleanly. Recover the unsaved model?",
+                buttons = (QtGui.QMessageBox.Yes | QtGui.QMessageBox.No))
+            if responce == QtGui.QMessageBox.StandardButton.Yes:
+                try:
+                    voxels = self._autosave.recover()
+                    voxels.occlusion = self.display.voxels.occlusion
+                    self.selection.clear()
+                    self.apply_symmetry(voxels)
+                    self.display.set_voxels(voxels)
+                    self.display.reset_camera()
+                except Exception as E:
+                    QtGui.QMessageBox.warning(self, "Recovery Failed",
+                        str(E))
+        self._autosave.attach(self.display.voxels)
+        self.update_caption()
+        self.refresh_actions()
+
     # Save our state
     def save_state(self):
         try:
@@ -454,13 +830,15 @@ class MainWindow(QtGui.QMainWindow):
                 if filetype == ourtype:
                     handler =  exporter
 
-        # Call the save handler
-        try:
-            handler.save(filename)
-            saved = True
-        except Exception as Ex:
+        # Call the save handler, in the background on a copy of our data
+        job = FileJob(FileJob.SAVE, handler, filename,
+            self.display.voxels.copy())
+        self.run_file_job(job, "Saving %s" % os.path.basename(filename),
+            False)
+        if job.error:
             QtGui.QMessageBox.warning(self, "Save Failed",
-            str(Ex))
+            str(job.error))
+        saved = job.succeeded
 
         # If we saved, clear edited state
         if saved:
@@ -474,6 +852,8 @@ class MainWindow(QtGui.QMainWindow):
     # Registers an file handler (importer/exporter) with the system
     def register_file_handler(self, handler):
         self._file_handlers.append(handler)
+        if hasattr(handler, "delta_frames"):
+            handler.delta_frames = bool(self.get_setting("delta_frames"))
 
     # load a file
     def load(self):
@@ -513,28 +893,58 @@ class MainWindow(QtGui.QMainWindow):
             ourtype = "%s (%s)" % (importer.description, importer.filetype)
             if filetype == ourtype:
                 handler =  importer
-                self._last_file_handler = handler
 
-        # Load the file
-        self.display.clear()
-        self.display.voxels.disable_undo()
-        self._filename = None
-        try:
-            handler.load(filename)
-            self._filename = filename
-        except Exception as Ex:
-            self.display.voxels.enable_undo()
+        # Load the file into a new model in the background. Our current model
+        # is left alone unless the load succeeds.
+        voxels = VoxelData()
+        voxels.occlusion = self.display.voxels.occlusion
+        voxels.disable_undo()
+        job = FileJob(FileJob.LOAD, handler, filename, voxels)
+        self.run_file_job(job, "Loading %s" % os.path.basename(filename))
+        if job.error:
             QtGui.QMessageBox.warning(self, "Could not load file",
-            str(Ex))
+            str(job.error))
+        if not job.succeeded:
+            return
 
-        self.display.build_grids()
-        #self.display.voxels.resize()
-        self.display.voxels.saved()
+        # Swap in the new model
+        self._filename = filename
+        self._last_file_handler = handler
+        voxels.enable_undo()
+        voxels.saved()
+        self.selection.clear()
+        self.apply_symmetry(voxels)
+        self.display.set_voxels(voxels)
+        self._autosave.attach(voxels)
         self.display.reset_camera()
         self.update_caption()
         self.refresh_actions()
-        self.display.voxels.enable_undo()
-        self.display.refresh()
+
+    # Run a file job, displaying its progress. Returns once the job has
+    # finished, but keeps the UI alive while it runs.
+    def run_file_job(self, job, caption, cancellable = True):
+        dialog = QtGui.QProgressDialog(caption, "Cancel", 0, 100, self)
+        dialog.setWindowTitle("Zoxel")
+        dialog.setWindowModality(QtCore.Qt.WindowModal)
+        dialog.setAutoClose(False)
+        dialog.setAutoReset(False)
+        if not cancellable:
+            dialog.setCancelButton(None)
+        job.progress.connect(dialog.setValue)
+        job.finished.connect(dialog.accept)
+        # Closing the dialog cancels it too, so only listen when we can stop
+        if cancellable:
+            dialog.canceled.connect(job.cancel)
+        job.start()
+        # Don't flash up a dialog for quick jobs
+        if not job.wait(250):
+            dialog.exec_()
+        job.wait()
+        dialog.deleteLater()
+        # Display any warnings the handler gave us
+        for message in job.warnings:
+            QtGui.QMessageBox.warning(self, "Warning", message)
+        return job
 
     # Registers a tool in the drawing toolbar
     def register_tool(self, tool, activate = False):
@@ -568,4 +978,13 @@ class MainWindow(QtGui.QMainWindow):
         self.ui.action_anim_play.setEnabled(num_frames > 1 
             and not self._timer.isActive())
         self.ui.action_anim_stop.setEnabled(self._timer.isActive())
+        selected = bool(self.selection)
+        self.ui.action_cut.setEnabled(selected)
+        self.ui.action_copy.setEnabled(selected)
+        self.ui.action_delete.setEnabled(selected)
+        self.ui.action_select_none.setEnabled(selected)
+        self.ui.action_paste.setEnabled(bool(self._clipboard))
+        indexed = self.display.voxels.indexed
+        self.ui.action_indexed_colour.setChecked(indexed)
+        self.ui.action_recolour.setEnabled(indexed)
         self.update_caption()
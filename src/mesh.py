@@ -0,0 +1,181 @@
+# mesh.py
+# Meshes of voxel frames, and a cache of them for animation playback.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Meshes are cached by frame revision (VoxelData.get_revision()). A
+# revision changes whenever its frame does and is never reused, so a cached
+# mesh is never out of date, it just stops being asked for and eventually
+# falls out of the cache.
+#
+# Meshes of indexed models are coloured by palette index (see
+# VoxelData.to_indexed()) rather than by colour, so changing the palette
+# needs no new meshes.
+
+import array
+import threading
+from collections import OrderedDict
+
+# Default memory budget of a MeshCache, in bytes
+DEFAULT_BUDGET = 256 * 1024 * 1024
+
+# The arrays needed to draw a model, ready to hand to OpenGL
+class Mesh(object):
+
+    # Memory used by the mesh, in bytes
+    @property
+    def size(self):
+        return (len(self.vertices) + len(self.colours) + len(self.normals)
+            + len(self.colour_ids) + len(self.uvs) + len(self.indices or ""))
+
+    # Build the mesh of the current frame of voxels. The colours of an
+    # indexed model are only its occlusion shading, and indices holds the
+    # palette index plus one of each vertex, otherwise indices is None.
+    def __init__(self, voxels):
+        self.indices = None
+        if voxels.indexed:
+            vertices, colours, normals, colour_ids, uvs, indices = \
+                voxels.get_indexed_vertices()
+            self.indices = array.array("f", indices).tostring()
+        else:
+            vertices, colours, normals, colour_ids, uvs = \
+                voxels.get_vertices()
+        self.count = len(vertices) // 3
+        self.vertices = array.array("f", vertices).tostring()
+        self.colours = array.array("B", colours).tostring()
+        self.colour_ids = array.array("B", colour_ids).tostring()
+        self.normals = array.array("f", normals).tostring()
+        self.uvs = array.array("f", uvs).tostring()
+
+# Least recently used cache of meshes, keyed by frame revision, which
+# throws away old meshes to stay within its memory budget. Safe to use
+# from more than one thread.
+class MeshCache(object):
+
+    # Memory budget in bytes
+    @property
+    def budget(self):
+        return self._budget
+    @budget.setter
+    def budget(self, value):
+        with self._lock:
+            self._budget = value
+            self._trim()
+
+    # Memory used by the cached meshes in bytes
+    @property
+    def size(self):
+        return self._size
+
+    def __init__(self, budget = DEFAULT_BUDGET):
+        self._lock = threading.Lock()
+        self._meshes = OrderedDict()
+        self._size = 0
+        self._budget = budget
+
+    def __contains__(self, revision):
+        return revision in self._meshes
+
+    def __len__(self):
+        return len(self._meshes)
+
+    # Return the mesh for the revision, or None if we don't have it
+    def get(self, revision):
+        with self._lock:
+            mesh = self._meshes.pop(revision, None)
+            if mesh is not None:
+                # Now the most recently used
+                self._meshes[revision] = mesh
+            return mesh
+
+    def add(self, revision, mesh):
+        with self._lock:
+            old = self._meshes.pop(revision, None)
+            if old is not None:
+                self._size -= old.size
+            self._meshes[revision] = mesh
+            self._size += mesh.size
+            self._trim()
+
+    # Return the mesh of a frame of voxels, the current frame if None,
+    # building it if needed
+    def mesh(self, voxels, frame = None):
+        revision = voxels.get_revision(frame)
+        mesh = self.get(revision)
+        if mesh is None:
+            if frame is not None:
+                voxels = voxels.frame_view(frame)
+            mesh = Mesh(voxels)
+            self.add(revision, mesh)
+        return mesh
+
+    def clear(self):
+        with self._lock:
+            self._meshes.clear()
+            self._size = 0
+
+    # Throw away the least recently used meshes until we are within budget,
+    # always keeping the newest.
+    def _trim(self):
+        while self._size > self._budget and len(self._meshes) > 1:
+            _, mesh = self._meshes.popitem(last = False)
+            self._size -= mesh.size
+
+# Builds the meshes of every frame of a model on a background thread, ready
+# for animation playback.
+class MeshBaker(object):
+
+    def __init__(self, cache):
+        self._cache = cache
+        self._thread = None
+        self._cancel = None
+
+    # Is a bake running?
+    def busy(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # Start building any meshes missing from the cache for the frames of
+    # voxels, cancelling any bake already running.
+    def bake(self, voxels):
+        self.cancel()
+        # Start with the frames played next
+        count = voxels.get_frame_count()
+        current = voxels.get_frame_number()
+        frames = [(current + i) % count for i in xrange(count)]
+        # Take our views of the frames now, the model may change later
+        views = [voxels.frame_view(frame) for frame in frames
+            if voxels.get_revision(frame) not in self._cache]
+        if not views:
+            return
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target = self._bake,
+            args = (views, self._cancel))
+        self._thread.daemon = True
+        self._thread.start()
+
+    # Stop baking after the mesh being built now, without waiting for it
+    def cancel(self):
+        if self._cancel:
+            self._cancel.set()
+        self._thread = None
+        self._cancel = None
+
+    def _bake(self, views, cancel):
+        for voxels in views:
+            if cancel.is_set():
+                return
+            # Playback may have got here first
+            if voxels.get_revision() not in self._cache:
+                self._cache.add(voxels.get_revision(), Mesh(voxels))
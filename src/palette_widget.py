@@ -16,6 +16,36 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from PySide import QtCore, QtGui
 from PySide.QtCore import QRect, QPoint
+import sys
+
+# Where red, green, blue and alpha are in the bytes of a Format_RGB32 pixel,
+# which is stored as a native 32 bit integer
+if sys.byteorder == "little":
+    _RGB = (2, 1, 0)
+    _ALPHA = 3
+else:
+    _RGB = (1, 2, 3)
+    _ALPHA = 0
+
+# Tables scaling a byte by level/255, for each level
+_SCALES = [bytearray((i*level + 127) // 255 for i in xrange(256))
+    for level in xrange(256)]
+
+# Return the bytes of a Format_RGB32 pixel
+def _pixel(r, g, b):
+    pixel = bytearray(4)
+    pixel[_ALPHA] = 0xff
+    for offset, channel in zip(_RGB, (r, g, b)):
+        pixel[offset] = channel
+    return pixel
+
+# Return a Format_RGB32 QImage of the given pixels
+def _image(pixels, width, height):
+    if width <= 0 or height <= 0:
+        return QtGui.QImage()
+    # Copy, as the image would otherwise share our buffer
+    return QtGui.QImage(bytes(pixels), width, height,
+        QtGui.QImage.Format.Format_RGB32).copy()
 
 class PaletteWidget(QtGui.QWidget):
 
@@ -35,6 +65,26 @@ class PaletteWidget(QtGui.QWidget):
             value = QtGui.QColor.fromRgb(r,g,b)
         self._set_colour(value)
 
+    # The colours of the model, a list of (colour, count) where colour is
+    # RGBA and count the number of voxels of that colour. The most used are
+    # shown as swatches under the palette.
+    @property
+    def used_colours(self):
+        return self._used
+    @used_colours.setter
+    def used_colours(self, value):
+        value = sorted(value, key = lambda c: (-c[1], c[0]))
+        if value == self._used:
+            return
+        resize = bool(value) != bool(self._used)
+        self._used = value
+        if resize:
+            self._calculate_bounds()
+            self._hue_image = None
+            self._shades_hue = None
+        self._draw_palette()
+        self.update()
+
     def __init__(self, parent = None):
         super(PaletteWidget, self).__init__(parent)
         self._hue = 1.0
@@ -42,7 +92,13 @@ class PaletteWidget(QtGui.QWidget):
         self._value = 1.0
         self._hue_width = 24
         self._gap = 8
+        self._swatch_size = 16
+        self._used = []
         self._colour = QtGui.QColor.fromHslF(self._hue, 1.0, 1.0)
+        # Cached images of our hues, and the shades of one hue
+        self._hue_image = None
+        self._shades_image = None
+        self._shades_hue = None
         self._calculate_bounds()
         self._draw_palette()
 
@@ -50,6 +106,11 @@ class PaletteWidget(QtGui.QWidget):
     def _calculate_bounds(self):
         width = self.width()
         height = self.height()
+        # Swatches of the colours in use, along the bottom
+        self._swatch_rect = QRect(0, height-self._swatch_size, width,
+            self._swatch_size)
+        if self._used:
+            height -= self._swatch_size + self._gap
         # Hue palette
         self._hue_rect = QRect(
             width-self._hue_width, 0, self._hue_width, height)
@@ -57,8 +118,12 @@ class PaletteWidget(QtGui.QWidget):
         self._shades_rect = QRect(
             0, 0, width-(self._hue_width+self._gap), height)
 
-    # Render our palette to an image
+    # Render our palette to an image, from images of the hues and shades
     def _draw_palette(self):
+        if self._hue_image is None:
+            self._draw_hues()
+        if self._shades_hue != self._hue:
+            self._draw_shades()
 
         # Create an image with a white background
         self._image = QtGui.QImage(QtCore.QSize(self.width(), self.height()),
@@ -72,14 +137,7 @@ class PaletteWidget(QtGui.QWidget):
 
         # Render hues
         rect = self._hue_rect
-        for x in xrange(rect.x(), rect.x()+rect.width()):
-            for y in xrange(rect.y(), rect.y()+rect.height(), 8):
-                h = float(y)/rect.height()
-                s = 1.0
-                v = 1.0
-                c = QtGui.QColor.fromHsvF(h, s, v)
-                qp.setBrush(c)
-                qp.drawRect(x, y, 8, 8)
+        qp.drawImage(rect.topLeft(), self._hue_image)
 
         # Render hue selection marker
         qp.setBrush(QtGui.QColor.fromRgb(0xff, 0xff, 0xff))
@@ -88,32 +146,72 @@ class PaletteWidget(QtGui.QWidget):
 
         # Render shades
         rect = self._shades_rect
-        width = float(rect.width())
-        steps = int(round(width / 8.0))
-        step_size = width / steps
-        x = rect.x()
-        while x < rect.width()+rect.x():
-            w = int(round(step_size))
-            for y in xrange(rect.y(), rect.y()+rect.height(), 8):
-                h = self._hue
-                s = 1-float(y)/rect.height()
-                v = float(x)/rect.width()
-                c = QtGui.QColor.fromHsvF(h, s, v)
-                qp.setBrush(c)
-                qp.drawRect(x, y, w, 8)
-            x += w
-            width -= w
-            steps -= 1
-            if steps > 0:
-                step_size = width / steps
+        qp.drawImage(rect.topLeft(), self._shades_image)
 
         # Render colour selection marker
         qp.setBrush(QtGui.QColor.fromRgb(0xff, 0xff, 0xff))
         qp.drawRect(rect.x(), (1-self._saturation)*rect.height(), rect.width(), 1)
         qp.drawRect(self._value*rect.width(), rect.y(), 1, rect.height())
 
+        # Render swatches of the colours in use, marking the current colour
+        current = self.colour.rgb() & 0xffffff
+        for rect, colour, _ in self._swatches():
+            qp.setBrush(QtGui.QColor.fromRgb(colour >> 8))
+            qp.drawRect(rect)
+            if colour >> 8 == current:
+                qp.setBrush(QtGui.QColor.fromRgb(0xff, 0xff, 0xff))
+                qp.drawRect(rect.x(), rect.bottom()-1, rect.width(), 2)
+
         qp.end()
 
+    # Return (rect, colour, count) of each swatch that fits
+    def _swatches(self):
+        size = self._swatch_size
+        area = self._swatch_rect
+        fits = max(area.width() // size, 0)
+        return [(QRect(area.x() + i*size, area.y(), size-1, size), colour, n)
+            for i, (colour, n) in enumerate(self._used[:fits])]
+
+    # Return the swatch (rect, colour, count) at a position, or None
+    def _swatch_at(self, pos):
+        for swatch in self._swatches():
+            if swatch[0].contains(pos):
+                return swatch
+        return None
+
+    # Render the strip of hues, which only changes when we resize. Each row
+    # is a single colour.
+    def _draw_hues(self):
+        rect = self._hue_rect
+        pixels = bytearray()
+        for y in xrange(rect.height()):
+            c = QtGui.QColor.fromHsvF(float(y)/rect.height(), 1.0, 1.0)
+            pixels += _pixel(c.red(), c.green(), c.blue()) * rect.width()
+        self._hue_image = _image(pixels, rect.width(), rect.height())
+
+    # Render the shades of the current hue. Saturation falls down the image
+    # and value rises across it, so every pixel of a row is the row's fully
+    # bright colour scaled by its column's value. We scale whole rows at a
+    # time with lookup tables rather than converting each pixel.
+    def _draw_shades(self):
+        rect = self._shades_rect
+        width = rect.width()
+        height = rect.height()
+        self._shades_hue = self._hue
+        hue = QtGui.QColor.fromHsvF(self._hue, 1.0, 1.0).getRgbF()[:3]
+        # Value of each column, 0-255
+        values = bytearray(int(255.0*x/width + 0.5) for x in xrange(width))
+        pixels = bytearray(width * height * 4)
+        row = bytearray(width * 4)
+        row[_ALPHA::4] = b"\xff" * width
+        for y in xrange(height):
+            s = 1-float(y)/height
+            for offset, channel in zip(_RGB, hue):
+                level = int((1 - s*(1 - channel)) * 255 + 0.5)
+                row[offset::4] = values.translate(_SCALES[level])
+            pixels[y*width*4:(y+1)*width*4] = row
+        self._shades_image = _image(pixels, width, height)
+
     def paintEvent(self, event):
         # Render our palette image to the screen
         qp = QtGui.QPainter()
@@ -127,8 +225,8 @@ class PaletteWidget(QtGui.QWidget):
             # Click on hues?
             if self._hue_rect.contains(mouse.x(), mouse.y()):
                 y = mouse.y()
-                c = QtGui.QColor.fromHsvF(
-                    float(y)/self.height(), self._saturation, self._value)
+                c = QtGui.QColor.fromHsvF(float(y)/self._hue_rect.height(),
+                    self._saturation, self._value)
                 self.colour = c
             # Click on colours?
             elif self._shades_rect.contains(mouse.x(), mouse.y()):
@@ -139,13 +237,35 @@ class PaletteWidget(QtGui.QWidget):
                     self._hue, 1-float(y)/self._shades_rect.height(),
                     float(x)/self._shades_rect.width())
                 self.colour = c
+            # Click on a colour in use?
+            else:
+                swatch = self._swatch_at(mouse)
+                if swatch:
+                    self.colour = swatch[1]
 
     def mouseMoveEvent(self, event):
         if event.buttons() & QtCore.Qt.LeftButton:
             self.mousePressEvent(event)
 
+    # Show how many voxels are the colour of a swatch
+    def event(self, event):
+        if event.type() == QtCore.QEvent.ToolTip:
+            swatch = self._swatch_at(event.pos())
+            if swatch:
+                _, colour, count = swatch
+                QtGui.QToolTip.showText(event.globalPos(),
+                    "#%06x: %i voxel%s" % (colour >> 8, count,
+                    "" if count == 1 else "s"))
+            else:
+                QtGui.QToolTip.hideText()
+                event.ignore()
+            return True
+        return super(PaletteWidget, self).event(event)
+
     def resizeEvent(self, event):
         self._calculate_bounds()
+        self._hue_image = None
+        self._shades_hue = None
         self._draw_palette()
 
     # Set the current colour
@@ -14,18 +14,25 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import sys
 from PySide import QtGui
+from file_job import FileJob
 
 class PluginManager(object):
     plugins = []
+    # What plugins talk to when there is no QApplication (e.g. zoxel_cli)
+    host = None
 
 class PluginAPI(object):
 
     def __init__(self):
         # All plugins get a reference to our application
         self.application = QtGui.QApplication.instance()
-        # And our main window
-        self.mainwindow = self.application.mainwindow
+        # And our main window, or our host if we are running headless
+        if self.application:
+            self.mainwindow = self.application.mainwindow
+        else:
+            self.mainwindow = PluginManager.host
 
     # Register a drawing tool with the system
     def register_tool(self, tool, activate = False):
@@ -45,16 +52,38 @@ class PluginAPI(object):
     def set_palette_colour(self, colour):
         self.mainwindow.colour_palette.colour = colour
 
-    # Returns the current voxel data
+    # Returns the current voxel data. When called by a file handler which is
+    # loading or saving, this is the model the handler is working on.
     def get_voxel_data(self):
+        job = FileJob.current()
+        if job:
+            return job.voxels
         return self.mainwindow.display.voxels
 
     # Returns the current voxel model mesh data
     # vertices, colours, normals
     def get_voxel_mesh(self):
-        vert, col, norm, _, _ = self.mainwindow.display.voxels.get_vertices()
+        vert, col, norm, _, _ = self.get_voxel_data().get_vertices()
         return (vert, col, norm)
 
+    # Show an outline of the given runs of voxels (x, y, z0, z1) in the
+    # display, or pass None to remove it. Tools use this to preview what
+    # they are about to do.
+    def set_preview(self, runs):
+        self.mainwindow.display.preview = runs
+
+    # Returns the current Selection, see selection.py
+    def get_selection(self):
+        return self.mainwindow.selection
+
+    # File handlers should call this regularly while loading or saving to
+    # report how far through they are. Raises OperationCancelled if the user
+    # has cancelled the operation, handlers should let this propagate.
+    def set_progress(self, done, total):
+        job = FileJob.current()
+        if job:
+            job.set_progress(done, total)
+
     # Get and set persistent config values. value can be any serialisable type.
     # name should be a hashable type, like a simple string.
     def set_config(self, name, value):
@@ -62,8 +91,16 @@ class PluginAPI(object):
     def get_config(self, name):
         return self.api.mainwindow.get_setting(name)
     
-    # Display a warning message
+    # Display a warning message. Warnings from file handlers are displayed
+    # once the load or save has finished.
     def warning(self, message):
+        job = FileJob.current()
+        if job:
+            job.warning(message)
+            return
+        if not self.application:
+            sys.stderr.write("Warning: %s\n" % message)
+            return
         QtGui.QMessageBox.warning(self.mainwindow, "Warning", message)
 
 # Plugin registration
@@ -5,9 +5,8 @@ import plugins.tool_draw
 import plugins.tool_paint
 import plugins.tool_erase
 import plugins.tool_drag
-import plugins.io_zoxel
-import plugins.io_sproxel
 import plugins.tool_fill
+import plugins.tool_shape
+import plugins.tool_select
 import plugins.tool_colourpick
-import plugins.io_obj
-import plugins.io_qubicle
+import handler_loader
@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import os
+from itertools import izip
 from plugin_api import register_plugin
 
 class ObjFile(object):
@@ -25,8 +26,13 @@ class ObjFile(object):
     # File type filter
     filetype = "*.obj"
 
+    # Size of our output buffer in bytes
+    buffer_size = 1 << 16
+
     def __init__(self, api):
         self.api = api
+        # Write "v x y z r g b" vertex colours as well as materials
+        self.vertex_colours = False
         # Register our exporter
         self.api.register_file_handler(self)
 
@@ -36,64 +42,78 @@ class ObjFile(object):
         # grab the voxel data
         vertices, colours, _ = self.api.get_voxel_mesh()
 
-        # Open our file
-        f = open(filename,"wt")
-
-        # Use materials
+        # Work out our file names
         mat_pathname, mat_filename = os.path.split(filename)
         name, ext = os.path.splitext(mat_filename)
         if not ext:
             filename = filename+'.obj'
         mat_filename = os.path.join(mat_pathname, name)+".mtl"
-        f.write("mtllib %s\r\n" % mat_filename)
 
-        # Export vertices
-        i = 0
-        while i < len(vertices):
-            f.write("v %f %f %f\r\n" %
-                (vertices[i], vertices[i+1], vertices[i+2]))
-            i += 3
+        # Build our shared vertex list. Vertices are keyed on their position
+        # (and colour if we are writing vertex colours) so each corner is
+        # written once rather than once for every face which touches it.
+        index = {}
+        shared = []
+        # Faces grouped by material, in the order we first see each colour
+        mats = []
+        groups = {}
+        corners = izip(izip(*[iter(vertices)]*3), izip(*[iter(colours)]*3))
+        vertex_colours = self.vertex_colours
+        # Each voxel face is 6 vertices (two triangles)
+        for face in izip(*[corners]*6):
+            ids = []
+            for position, colour in face:
+                key = position + colour if vertex_colours else position
+                n = index.get(key)
+                if n is None:
+                    shared.append(key)
+                    n = index[key] = len(shared)
+                ids.append(n)
+            # Material is the colour of the first vertex in the face
+            colour = face[0][1]
+            group = groups.get(colour)
+            if group is None:
+                mats.append(colour)
+                group = groups[colour] = []
+            group.append((ids[0], ids[2], ids[1]))
+            group.append((ids[5], ids[4], ids[3]))
 
-        # Build a list of unique colours we use so we can assign materials
-        mats = {}
-        i = 0
-        while i < len(colours):
-            r = colours[i]
-            g = colours[i+1]
-            b = colours[i+2]
-            colour = r<<24 | g<<16 | b<<8
-            if colour not in mats:
-                mats[colour] = "material_%i" % len(mats)
-            i += 3
+        # Open our file
+        f = open(filename, "wb", self.buffer_size)
+        try:
+            # Use materials
+            f.write("mtllib %s\r\n" % os.path.basename(mat_filename))
 
-        # Export faces
-        faces = (len(vertices)//(3*3))//2
-        for i in xrange(faces):
-            n = 1+(i * 6)
-            r = colours[(i*18)]
-            g = colours[(i*18)+1]
-            b = colours[(i*18)+2]
-            colour = r<<24 | g<<16 | b<<8
-            f.write("usemtl %s\r\n" % mats[colour])
-            f.write("f %i %i %i\r\n" % (n, n+2, n+1))
-            f.write("f %i %i %i\r\n" % (n+5, n+4, n+3))
+            # Export vertices
+            if vertex_colours:
+                f.writelines("v %f %f %f %f %f %f\r\n" %
+                    (x, y, z, r / 255.0, g / 255.0, b / 255.0)
+                    for x, y, z, r, g, b in shared)
+            else:
+                f.writelines("v %f %f %f\r\n" % v for v in shared)
 
-        # Tidy up
-        f.close()
+            # Export faces, one group per material
+            for i, colour in enumerate(mats):
+                self.api.set_progress(i, len(mats))
+                f.write("usemtl material_%i\r\n" % i)
+                f.writelines("f %i %i %i\r\n" % face
+                    for face in groups[colour])
+        finally:
+            # Tidy up
+            f.close()
 
         # Create our material file
-        f = open(mat_filename,"wt")
-        for colour, material in mats.items():
-            f.write("newmtl %s\r\n" % material)
-            r = (colour & 0xff000000) >> 24
-            g = (colour & 0xff0000) >> 16
-            b = (colour & 0xff00) >> 8
-            r = r / 255.0
-            g = g / 255.0
-            b = b / 255.0
-            f.write("Ka %f %f %f\r\n" % (r, g, b))
-            f.write("Kd %f %f %f\r\n" % (r, g, b))
-        f.close()
+        f = open(mat_filename, "wb")
+        try:
+            for i, (r, g, b) in enumerate(mats):
+                f.write("newmtl material_%i\r\n" % i)
+                r = r / 255.0
+                g = g / 255.0
+                b = b / 255.0
+                f.write("Ka %f %f %f\r\n" % (r, g, b))
+                f.write("Kd %f %f %f\r\n" % (r, g, b))
+        finally:
+            f.close()
 
 
 register_plugin(ObjFile, "OBJ exporter", "1.0")
@@ -0,0 +1,52 @@
+# io_preview.py
+# Preview image exporter, rendered without OpenGL.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Saves a picture of the model, so previews can be made by zoxel_cli.py on
+# machines with no display, e.g. "zoxel_cli.py --to png models". Needs
+# NumPy, without which we don't register.
+
+from plugin_api import register_plugin
+try:
+    import software_render
+except ImportError:
+    software_render = None
+
+class PreviewFile(object):
+
+    # Description of file type
+    description = "Preview Images"
+
+    # File type filter
+    filetype = "*.png"
+
+    # Image size in pixels
+    size = 256
+
+    def __init__(self, api):
+        self.api = api
+        if software_render:
+            self.api.register_file_handler(self)
+
+    # Called when we need to save. Should raise an exception if there is a
+    # problem saving.
+    def save(self, filename):
+        image = software_render.render(self.api.get_voxel_data(),
+            self.size, self.size)
+        with open(filename, "wb") as f:
+            software_render.write_png(f, image)
+
+register_plugin(PreviewFile, "Preview image exporter", "1.0")
@@ -86,6 +86,7 @@ class QubicleFile(object):
 
         # Data
         for z in xrange(voxels.depth):
+            self.api.set_progress(z, voxels.depth)
             for y in xrange(voxels.height):
                 for x in xrange(voxels.width):
                     vox = voxels.get(x, y, z)
@@ -167,6 +168,7 @@ class QubicleFile(object):
     
             # Data
             for z in xrange(depth):
+                self.api.set_progress(i * depth + z, matrix_count * depth)
                 for y in xrange(height):
                     for x in xrange(width):
                         vox = self.uint32(f)
@@ -16,6 +16,23 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from plugin_api import register_plugin
 
+# Sproxel colour strings for voxel values, built as they are first needed
+class _ColourNames(dict):
+    def __missing__(self, voxel):
+        name = "#%08X" % ((voxel & 0xffffff00) | 0xff)
+        self[voxel] = name
+        return name
+
+# Voxel values for Sproxel colour strings, built as they are first needed
+class _ColourValues(dict):
+    def __missing__(self, name):
+        if name == "#00000000":
+            voxel = 0
+        else:
+            voxel = int(name[1:7], 16)<<8 | 0xff
+        self[name] = voxel
+        return voxel
+
 class SproxelFile(object):
 
     # Description of file type
@@ -24,6 +41,9 @@ class SproxelFile(object):
     # File type filter
     filetype = "*.csv"
 
+    # Size of our output buffer in bytes
+    buffer_size = 1 << 16
+
     def __init__(self, api):
         self.api = api
         # Register our exporter
@@ -34,30 +54,27 @@ class SproxelFile(object):
     def save(self, filename):
         # grab the voxel data
         voxels = self.api.get_voxel_data()
+        data = voxels.get_data()
+        width = voxels.width
+        names = _ColourNames({0: "#00000000"})
 
         # Open our file
-        f = open(filename,"wt")
+        f = open(filename, "wt", self.buffer_size)
+        try:
+            # First Sproxel line is model dimenstions
+            f.write("%i,%i,%i\n" % (voxels.width, voxels.height,
+                voxels.depth))
 
-        # First Sproxel line is model dimenstions
-        f.write("%i,%i,%i\n" % (voxels.width, voxels.height, voxels.depth))
-
-        # Then we save from the top of the model
-        for y in xrange(voxels.height-1, -1, -1):
-            for z in xrange(voxels.depth-1, -1, -1):
-                line = []
-                for x in xrange(voxels.width):
-                    voxel = voxels.get(x, y, z)
-                    if voxel == 0:
-                        line.append("#00000000")
-                    else:
-                        voxel = (voxel & 0xffffff00) | 0xff
-                        voxel = "%x" % voxel
-                        line.append("#"+voxel.upper().rjust(8,"0"))
-                f.write(",".join(line)+"\n")
-            f.write("\n")
-
-        # Tidy up
-        f.close()
+            # Then we save from the top of the model, a row at a time
+            for y in xrange(voxels.height-1, -1, -1):
+                self.api.set_progress(voxels.height-y, voxels.height)
+                f.writelines(",".join([names[data[x][y][z]]
+                    for x in xrange(width)]) + "\n"
+                    for z in xrange(voxels.depth-1, -1, -1))
+                f.write("\n")
+        finally:
+            # Tidy up
+            f.close()
 
     # Load a Sproxel file
     def load(self, filename):
@@ -66,31 +83,28 @@ class SproxelFile(object):
 
         # Open our file
         f = open(filename,"rt")
-        size = f.readline().strip()
-        x,y,z = size.split(",")
-        x = int(x)
-        y = int(y)
-        z = int(z)
-        voxels.resize(x, y, z)
-        # Parse the file
-        for fy in xrange(y-1,-1,-1):
-            for fz in xrange(z-1,-1,-1):
-                line = f.readline().strip().split(",")
-                for fx in xrange(0, x):
-                    if line[fx] == "#00000000":
-                        continue
-                    colour = line[fx][1:]
-                    r = colour[:2]
-                    g = colour[2:4]
-                    b = colour[4:6]
-                    r = int(r, 16)
-                    g = int(g, 16)
-                    b = int(b, 16)
-                    a = 0xff
-                    v = r<<24 | g<<16 | b<<8 | a
-                    voxels.set(fx, fy, fz, v)
-
-            f.readline() # discard empty line
-        f.close()
+        try:
+            size = f.readline().strip()
+            x,y,z = size.split(",")
+            x = int(x)
+            y = int(y)
+            z = int(z)
+            voxels.resize(x, y, z)
+            # Parse the file into a complete frame
+            data = voxels.blank_data()
+            values = _ColourValues()
+            for fy in xrange(y-1,-1,-1):
+                self.api.set_progress(y-fy, y)
+                for fz in xrange(z-1,-1,-1):
+                    line = f.readline().strip().split(",")
+                    row = [values[cell] for cell in line[:x]]
+                    for fx, v in enumerate(row):
+                        if v:
+                            data[fx][fy][fz] = v
+                f.readline() # discard empty line
+        finally:
+            f.close()
+        # Then store it in one go
+        voxels.set_data(data)
 
 register_plugin(SproxelFile, "Sproxel file format IO", "1.0")
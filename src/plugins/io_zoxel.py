@@ -15,9 +15,16 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import json
+from itertools import izip
 from plugin_api import register_plugin
 from constants import ZOXEL_VERSION
 
+# Frames are stored as lists of voxels, [x, y, z, colour]. Files of version 2
+# can also store a frame as the changes from the frame before it, under
+# "delta<n>" rather than "frame<n>", with a colour of 0 for voxels which
+# have been removed. Every so often a complete keyframe is stored anyway so
+# a damaged delta doesn't ruin the rest of the animation.
+
 class ZoxelFile(object):
 
     # Description of file type
@@ -26,49 +33,89 @@ class ZoxelFile(object):
     # File type filter
     filetype = "*.zox"
 
+    # Store a complete frame at least this often when writing deltas
+    keyframe_interval = 30
+
     def __init__(self, api):
         self.api = api
+        # Store frames as changes from the previous frame where smaller
+        self.delta_frames = False
         # Register our exporter
         self.api.register_file_handler(self)
         # File version format we support
-        self._file_version = 1
+        self._file_version = 2
+
+    # Return the voxels in a frame of data
+    def _frame(self, data):
+        frame = []
+        for x, plane in enumerate(data):
+            for y, column in enumerate(plane):
+                if column.count(0) == len(column):
+                    continue
+                frame.extend([x, y, z, v] for z, v in enumerate(column) if v)
+        return frame
+
+    # Return the voxels which differ between two frames of data
+    def _delta(self, previous, data):
+        delta = []
+        for x, (old_plane, plane) in enumerate(izip(previous, data)):
+            if old_plane == plane:
+                continue
+            for y, (old, column) in enumerate(izip(old_plane, plane)):
+                if old == column:
+                    continue
+                delta.extend([x, y, z, v] for z, (o, v)
+                    in enumerate(izip(old, column)) if o != v)
+        return delta
 
     # Called when we need to save. Should raise an exception if there is a
     # problem saving.
     def save(self, filename):
         # grab the voxel data
         voxels = self.api.get_voxel_data()
-
-        # File version
-        version = self._file_version
+        frames = voxels.get_frame_count()
 
         # Build data structure
-        data = {'version': version, 'frames': voxels.get_frame_count(),
+        data = {'frames': frames,
                 "creator": "Zoxel Version "+ZOXEL_VERSION}
-        
-        for f in xrange(voxels.get_frame_count()):
-            frame = []
-            voxels.select_frame(f)
-            for y in range(voxels.height):
-                for z in range(voxels.depth):
-                    for x in range(voxels.width):
-                        v = voxels.get(x, y, z)
-                        if v:
-                            frame.append((x,y,z,v))
-    
-            data['frame{0}'.format(f+1)] = frame
 
+        # Version 1 files are all keyframes, only use version 2 if we need to
+        version = 1
+        previous = None
+        last_key = 0
+        for f in xrange(frames):
+            self.api.set_progress(f, frames)
+            frame = voxels.get_frame_data(f)
+            if (self.delta_frames and previous is not None
+                and f - last_key < self.keyframe_interval):
+                delta = self._delta(previous, frame)
+                if len(delta) < voxels.get_voxel_count(f):
+                    data['delta{0}'.format(f+1)] = delta
+                    version = 2
+                    previous = frame
+                    continue
+            data['frame{0}'.format(f+1)] = self._frame(frame)
+            last_key = f
+            previous = frame
+
+        # Frames are always stored in colours, so older versions can still
+        # read indexed models
+        if voxels.indexed:
+            data['palette'] = list(voxels.palette)
+
+        data['version'] = version
         data['width'] = voxels.width
         data['height'] = voxels.height
         data['depth'] = voxels.depth
 
         # Open our file
         f = open(filename,"wt")
-
-        f.write(json.dumps(data))
-
-        # Tidy up
-        f.close()
+        try:
+            # dumps() is much faster than dump()
+            f.write(json.dumps(data, separators = (",", ":")))
+        finally:
+            # Tidy up
+            f.close()
 
     # Called when we need to load a file. Should raise an exception if there
     # is a problem.
@@ -113,11 +160,20 @@ class ZoxelFile(object):
             # Resize
             voxels.resize(maxX+1, maxY+1, maxZ+1)
         
-        # Read the voxel data
+        # Build each frame in full then store it in one go
+        model = None
         for f in xrange(frames):
-            frame = data['frame{0}'.format(f+1)]
-            for x, y, z, v in frame:
-                voxels.set(x, y, z, v)
+            self.api.set_progress(f, frames)
+            key = 'frame{0}'.format(f+1)
+            if key in data:
+                model = voxels.blank_data()
+                changes = data[key]
+            else:
+                # Changes to the previous frame
+                changes = data['delta{0}'.format(f+1)]
+            for x, y, z, v in changes:
+                model[x][y][z] = v
+            voxels.set_data(model)
             # Add another frame if required
             if f < frames-1:
                 voxels.add_frame(False)
@@ -126,4 +182,8 @@ class ZoxelFile(object):
         if frames > 1:
             voxels.select_frame(0)
 
+        # Indexed model, keeping the order of its palette
+        if 'palette' in data:
+            voxels.to_indexed(data['palette'])
+
 register_plugin(ZoxelFile, "Zoxel file format IO", "1.0")
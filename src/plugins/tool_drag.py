@@ -28,6 +28,14 @@ class DragTool(Tool):
             "Move Model", None)
         self.action.setStatusTip("Move Model")
         self.action.setCheckable(True)
+        # Our options, in a menu on the action
+        self.menu = QtGui.QMenu()
+        self._wrap = self.menu.addAction("Wrap Around")
+        self._wrap.setStatusTip("Voxels moved off one side of the model "
+            "appear on the other")
+        self._wrap.setCheckable(True)
+        self._wrap.setChecked(True)
+        self.action.setMenu(self.menu)
         # Register the tool
         self.api.register_tool(self)
 
@@ -83,6 +91,7 @@ class DragTool(Tool):
             if ty != 0 or tx != 0 or tz != 0:
                 self._mouse = (target.mouse_x, target.mouse_y)
             
-            target.voxels.translate(tx, ty, tz)
+            target.voxels.translate(tx, ty, tz,
+                wrap = self._wrap.isChecked())
             
 register_plugin(DragTool, "Drag Tool", "1.0")
\ No newline at end of file
@@ -17,9 +17,18 @@
 from PySide import QtGui
 from tool import Tool, EventData, MouseButtons, KeyModifiers, Face
 from plugin_api import register_plugin
+from voxel import VoxelData
 
 class FillTool(Tool):
 
+    # Fill modes
+    EXACT = 0
+    SIMILAR = 1
+    INTERIOR = 2
+
+    # How far each of red, green and blue may differ in SIMILAR mode
+    TOLERANCE = 32
+
     def __init__(self, api):
         super(FillTool, self).__init__(api)
         # Create our action / icon
@@ -28,6 +37,32 @@ class FillTool(Tool):
             "Fill", None)
         self.action.setStatusTip("Flood fill with colour")
         self.action.setCheckable(True)
+        # Our options, in a menu on the action
+        self.menu = QtGui.QMenu()
+        self._modes = QtGui.QActionGroup(self.menu)
+        for mode, text, tip in (
+            (self.EXACT, "Same Colour", "Fill connected voxels of the same "
+                "colour"),
+            (self.SIMILAR, "Similar Colour", "Fill connected voxels of a "
+                "similar colour"),
+            (self.INTERIOR, "Enclosed Space", "Fill the empty space enclosed "
+                "by the model")):
+            action = self.menu.addAction(text)
+            action.setStatusTip(tip)
+            action.setCheckable(True)
+            action.setChecked(mode == self.EXACT)
+            action.setData(mode)
+            self._modes.addAction(action)
+        self.menu.addSeparator()
+        self._diagonal = self.menu.addAction("Include Diagonals")
+        self._diagonal.setStatusTip("Also fill voxels touching by an edge "
+            "or corner")
+        self._diagonal.setCheckable(True)
+        self._slice = self.menu.addAction("Clicked Slice Only")
+        self._slice.setStatusTip("Only fill the slice parallel to the "
+            "clicked face")
+        self._slice.setCheckable(True)
+        self.action.setMenu(self.menu)
         # Register the tool
         self.api.register_tool(self)
 
@@ -37,36 +72,28 @@ class FillTool(Tool):
         voxel = target.voxels.get(target.world_x, target.world_y, target.world_z)
         if not voxel:
             return
-        # Grab the target colour
-        search_colour = voxel
-        # Don't allow invalid fills
         c = self.colour.getRgb()
         fill_colour = c[0]<<24 | c[1]<<16 | c[2]<<8 | 0xff
-        if search_colour == fill_colour:
+        mode = self._modes.checkedAction().data()
+        if mode == self.INTERIOR:
+            target.voxels.fill_interior(fill_colour)
+            return
+        # Don't allow invalid fills
+        if mode == self.EXACT and voxel == fill_colour:
             return
-        # Initialise our search list
-        search = []
-        search.append((target.world_x, target.world_y, target.world_z))
-        # Keep iterating over the search list until no more to do
-        while len(search):
-            x,y,z = search.pop()
-            voxel = target.voxels.get(x, y, z)
-            if not voxel or voxel != search_colour:
-                continue
-            # Add all likely neighbours into our search list
-            if target.voxels.get(x-1,y,z) == search_colour:
-                search.append((x-1,y,z))
-            if target.voxels.get(x+1,y,z) == search_colour:
-                search.append((x+1,y,z))
-            if target.voxels.get(x,y+1,z) == search_colour:
-                search.append((x,y+1,z))
-            if target.voxels.get(x,y-1,z) == search_colour:
-                search.append((x,y-1,z))
-            if target.voxels.get(x,y,z+1) == search_colour:
-                search.append((x,y,z+1))
-            if target.voxels.get(x,y,z-1) == search_colour:
-                search.append((x,y,z-1))
-            # Set the colour of the current voxel
-            target.voxels.set(x, y, z, self.colour)
+        tolerance = self.TOLERANCE if mode == self.SIMILAR else 0
+        connectivity = 26 if self._diagonal.isChecked() else 6
+        plane = None
+        if self._slice.isChecked():
+            if target.face in Face.FACES_PLANE_X:
+                plane = VoxelData.X_AXIS
+            elif target.face in Face.FACES_PLANE_Y:
+                plane = VoxelData.Y_AXIS
+            elif target.face in Face.FACES_PLANE_Z:
+                plane = VoxelData.Z_AXIS
+        # Fill the connected region in one step
+        target.voxels.fill(target.world_x, target.world_y, target.world_z,
+            fill_colour, tolerance = tolerance, connectivity = connectivity,
+            plane = plane)
 
 register_plugin(FillTool, "Fill Tool", "1.0")
\ No newline at end of file
@@ -0,0 +1,132 @@
+# tool_select.py
+# Select, move and stamp voxels.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from PySide import QtCore, QtGui
+from tool import Tool, EventData, MouseButtons, KeyModifiers, Face
+from plugin_api import register_plugin
+import shapes
+
+# Click a voxel to select all connected voxels of the same colour, or drag
+# out a box to select everything in it. Dragging from a selected voxel
+# moves the selection across the face you started on, hold CTRL to leave
+# the original in place (stamp). Right click clears the selection.
+class SelectTool(Tool):
+
+    def __init__(self, api):
+        super(SelectTool, self).__init__(api)
+        # Create our action / icon
+        self.action = QtGui.QAction(
+            QtGui.QPixmap(":/images/gfx/icons/layer-select.png"),
+            "Select", None)
+        self.action.setStatusTip("Select, move and stamp voxels")
+        self.action.setCheckable(True)
+        self._start = None
+        self._moving = False
+        # Register the tool
+        self.api.register_tool(self)
+
+    def _position(self, target):
+        if target.world_x is None:
+            return None
+        return (target.world_x, target.world_y, target.world_z)
+
+    # Is the voxel at pos selected?
+    def _selected(self, pos):
+        x, y, z = pos
+        for sx, sy, z0, z1 in self.api.get_selection().runs:
+            if sx == x and sy == y and z0 <= z < z1:
+                return True
+        return False
+
+    # The offset of a move from the start of the drag to target. We only
+    # move across the face the drag started on.
+    def _offset(self, target):
+        end = self._position(target)
+        if not end:
+            return None
+        offset = [end[i] - self._start[i] for i in xrange(3)]
+        if self._face in Face.FACES_PLANE_X:
+            offset[0] = 0
+        elif self._face in Face.FACES_PLANE_Y:
+            offset[1] = 0
+        elif self._face in Face.FACES_PLANE_Z:
+            offset[2] = 0
+        return offset
+
+    def _preview(self, target):
+        if self._moving:
+            offset = self._offset(target)
+            if not offset:
+                return []
+            dx, dy, dz = offset
+            runs = [(x+dx, y+dy, z0+dz, z1+dz)
+                for x, y, z0, z1 in self.api.get_selection().runs]
+        else:
+            end = self._position(target)
+            if not end:
+                return []
+            runs = shapes.box(*(self._start + end))
+        voxels = target.voxels
+        return shapes.clip(runs, voxels.width, voxels.height, voxels.depth)
+
+    def on_mouse_click(self, target):
+        selection = self.api.get_selection()
+        pos = self._position(target)
+        if (target.mouse_button == MouseButtons.RIGHT or not pos
+            or target.face is None):
+            selection.clear()
+            return
+        selection.select_region(target.voxels, *pos)
+
+    def on_drag_start(self, target):
+        # Leave drags which turn the camera alone
+        if not target.is_tool_drag():
+            self._start = None
+            return
+        self._start = self._position(target)
+        self._face = target.face
+        if not self._start:
+            return
+        self._moving = (target.face is not None
+            and self._selected(self._start))
+        self.api.set_preview(self._preview(target))
+
+    def on_drag(self, target):
+        if self._start:
+            self.api.set_preview(self._preview(target))
+
+    def on_drag_end(self, target):
+        self.api.set_preview(None)
+        if not self._start:
+            return
+        selection = self.api.get_selection()
+        if self._moving:
+            offset = self._offset(target)
+            if offset and any(offset):
+                stamp = bool(target.key_modifiers
+                    & QtCore.Qt.KeyboardModifier.ControlModifier)
+                selection.move(target.voxels, *offset, stamp = stamp)
+        else:
+            end = self._position(target)
+            if end:
+                selection.select_box(target.voxels, self._start, end)
+        self._start = None
+
+    def on_cancel(self, target):
+        self._start = None
+        self.api.set_preview(None)
+
+register_plugin(SelectTool, "Selection Tool", "1.0")
@@ -0,0 +1,139 @@
+# tool_shape.py
+# Tools for drawing boxes, lines, spheres and cylinders.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from PySide import QtGui
+from tool import Tool, EventData, MouseButtons, KeyModifiers, Face
+from plugin_api import register_plugin
+import shapes
+
+# Drag out a shape between two voxels. The shape is previewed while
+# dragging and drawn in one go when the drag ends. Drag with the right
+# mouse button to erase the shape instead.
+class ShapeTool(Tool):
+
+    # Override these
+    icon = ":/images/gfx/icons/wrench.png"
+    text = "Shape"
+    tip = "Draw a shape"
+
+    def __init__(self, api):
+        super(ShapeTool, self).__init__(api)
+        # Create our action / icon
+        self.action = QtGui.QAction(QtGui.QPixmap(self.icon), self.text, None)
+        self.action.setStatusTip(self.tip)
+        self.action.setCheckable(True)
+        self._start = None
+        # Register the tool
+        self.api.register_tool(self)
+
+    # Return the runs of voxels making up the shape between the two corner
+    # voxels, see shapes.py
+    def shape(self, start, end):
+        return []
+
+    # The voxel a shape corner goes in, next to the clicked face or on the
+    # grid if we missed the model
+    def _corner(self, target):
+        if target.world_x is None:
+            return None
+        pos = target.get_neighbour()
+        if pos:
+            return pos
+        return (target.world_x, target.world_y, target.world_z)
+
+    # Return the runs for the shape from the start of the drag to target
+    def _runs(self, target):
+        end = self._corner(target)
+        if not self._start or not end:
+            return []
+        voxels = target.voxels
+        return shapes.clip(self.shape(self._start, end),
+            voxels.width, voxels.height, voxels.depth)
+
+    def on_drag_start(self, target):
+        # Leave drags which turn the camera alone
+        if not target.is_tool_drag():
+            self._start = None
+            return
+        self._start = self._corner(target)
+        self._face = target.face
+        self.api.set_preview(self._runs(target))
+
+    def on_drag(self, target):
+        if self._start:
+            self.api.set_preview(self._runs(target))
+
+    def on_drag_end(self, target):
+        self.api.set_preview(None)
+        runs = self._runs(target)
+        self._start = None
+        if not runs:
+            return
+        if target.mouse_button == MouseButtons.RIGHT:
+            state = 0
+        else:
+            c = self.colour.getRgb()
+            state = c[0]<<24 | c[1]<<16 | c[2]<<8 | 0xff
+        # A single write and a single undo step for the whole shape
+        target.voxels.fill_runs(runs, state)
+
+    def on_cancel(self, target):
+        self._start = None
+        self.api.set_preview(None)
+
+class BoxTool(ShapeTool):
+    icon = ":/images/gfx/icons/border-outside.png"
+    text = "Box"
+    tip = "Draw a box"
+
+    def shape(self, start, end):
+        return shapes.box(*(start + end))
+
+class LineTool(ShapeTool):
+    icon = ":/images/gfx/icons/layer-shape-line.png"
+    text = "Line"
+    tip = "Draw a line"
+
+    def shape(self, start, end):
+        return shapes.line(*(start + end))
+
+class SphereTool(ShapeTool):
+    icon = ":/images/gfx/icons/weather-clear-2.png"
+    text = "Sphere"
+    tip = "Draw a sphere or ellipsoid"
+
+    def shape(self, start, end):
+        return shapes.ellipsoid(*(start + end))
+
+class CylinderTool(ShapeTool):
+    icon = ":/images/gfx/icons/layers-alignment-center.png"
+    text = "Cylinder"
+    tip = "Draw a cylinder standing on the clicked face"
+
+    def shape(self, start, end):
+        # The cylinder stands out from the face the drag started on
+        if self._face in Face.FACES_PLANE_X:
+            axis = shapes.X_AXIS
+        elif self._face in Face.FACES_PLANE_Z:
+            axis = shapes.Z_AXIS
+        else:
+            axis = shapes.Y_AXIS
+        return shapes.cylinder(*(start + end), axis = axis)
+
+register_plugin(BoxTool, "Box Tool", "1.0")
+register_plugin(LineTool, "Line Tool", "1.0")
+register_plugin(SphereTool, "Sphere Tool", "1.0")
+register_plugin(CylinderTool, "Cylinder Tool", "1.0")
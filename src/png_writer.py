@@ -0,0 +1,78 @@
+# png_writer.py
+# Write PNG files a few rows at a time.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# QImage can only save an image it holds in memory all at once, which at
+# poster sizes is hundreds of megabytes. A PngWriter instead compresses rows
+# as they are given to it, so only the rows being rendered need to be held.
+
+import struct
+import zlib
+
+# Bytes of compressed data written per IDAT chunk
+CHUNK_SIZE = 1 << 16
+
+class PngWriter(object):
+
+    # Write a width x height image to the file f, with an alpha channel if
+    # alpha is True
+    def __init__(self, f, width, height, alpha = True):
+        self._file = f
+        self._width = width
+        self._height = height
+        self._channels = 4 if alpha else 3
+        self._rows = 0
+        self._compress = zlib.compressobj(6)
+        self._pending = bytearray()
+        f.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8,
+            6 if alpha else 2, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        data = bytes(data)
+        self._file.write(struct.pack(">I", len(data)) + kind + data)
+        self._file.write(struct.pack(">I",
+            zlib.crc32(kind + data) & 0xffffffff))
+
+    def _flush(self, final = False):
+        while len(self._pending) >= CHUNK_SIZE or (final and self._pending):
+            self._chunk(b"IDAT", self._pending[:CHUNK_SIZE])
+            del self._pending[:CHUNK_SIZE]
+
+    # Add the next rows of the image, given as RGB or RGBA bytes, top first
+    def write(self, pixels):
+        stride = self._width * self._channels
+        if len(pixels) % stride:
+            raise ValueError("Pixels must be whole rows.")
+        rows = len(pixels) // stride
+        if self._rows + rows > self._height:
+            raise ValueError("Too many rows for the image.")
+        data = bytearray(rows * (stride + 1))
+        for row in xrange(rows):
+            # Each row begins with its filter type, 0 for none
+            start = row * (stride + 1) + 1
+            data[start:start+stride] = pixels[row*stride:(row+1)*stride]
+        self._pending += self._compress.compress(bytes(data))
+        self._rows += rows
+        self._flush()
+
+    # Finish the image. Every row must have been written.
+    def close(self):
+        if self._rows != self._height:
+            raise ValueError("Image is missing rows.")
+        self._pending += self._compress.flush()
+        self._flush(True)
+        self._chunk(b"IEND", b"")
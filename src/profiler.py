@@ -0,0 +1,99 @@
+# profiler.py
+# Lightweight timing of our hot paths.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Wrap code to be timed in a span:
+#
+#   with profiler.span("build_mesh"):
+#       ...
+#
+# The duration of the most recent span of each name is always kept, which
+# is what the GLWidget performance overlay displays. While recording, every
+# span is also kept (up to a limit) so they can be exported as a trace file
+# viewable in Chrome's about:tracing.
+
+import json
+import time
+import threading
+from collections import deque
+
+# Most spans we keep while recording
+MAX_SPANS = 100000
+
+class _Span(object):
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.time()
+        self._profiler.add(self._name, self._start, end - self._start)
+        return False
+
+class Profiler(object):
+
+    # Are we keeping every span for export?
+    @property
+    def recording(self):
+        return self._recording
+    @recording.setter
+    def recording(self, value):
+        self._recording = value
+
+    def __init__(self):
+        self._recording = False
+        self._spans = deque(maxlen = MAX_SPANS)
+        self._last = {}
+        self._epoch = time.time()
+
+    # Return a context manager which times its body
+    def span(self, name):
+        return _Span(self, name)
+
+    # Record a span, start and duration in seconds
+    def add(self, name, start, duration):
+        self._last[name] = duration
+        if self._recording:
+            self._spans.append((name, start, duration,
+                threading.current_thread().ident))
+
+    # Duration of the last span with the given name, in milliseconds
+    def last(self, name):
+        return self._last.get(name, 0.0) * 1000.0
+
+    def clear(self):
+        self._spans.clear()
+        self._last = {}
+
+    # Write recorded spans to filename in Chrome trace event format
+    def export(self, filename):
+        events = [{"name": name, "ph": "X", "pid": 1, "tid": tid,
+            "ts": int((start - self._epoch) * 1000000),
+            "dur": int(duration * 1000000)}
+            for name, start, duration, tid in self._spans]
+        f = open(filename, "wt")
+        try:
+            f.write(json.dumps({"traceEvents": events}))
+        finally:
+            f.close()
+
+# The profiler everyone shares
+profiler = Profiler()
@@ -0,0 +1,145 @@
+# selection.py
+# A selection of voxels and the operations on it.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# A selection is stored as runs of voxels along the z axis, (x, y, z0, z1)
+# with z1 exclusive, the same as VoxelData.get_region() and the shapes
+# module use. Copied voxels are stored as runs of states, (x, y, z, states),
+# as VoxelData.set_region() uses, with empty voxels left out so pasting
+# doesn't erase whatever is around the pasted voxels.
+#
+# Every operation which changes the model does so with a single call to
+# set_region(), so it is a single undo step.
+
+import shapes
+from voxel import EMPTY
+
+# Return the voxels in runs as runs of states, leaving out empty voxels
+def copy_runs(voxels, runs):
+    copied = []
+    for x, y, z0, states in voxels.get_runs(runs):
+        if EMPTY not in states:
+            copied.append((x, y, z0, states))
+            continue
+        # Split around the empty voxels
+        start = None
+        for z, state in enumerate(states, z0):
+            if state == EMPTY:
+                if start is not None:
+                    copied.append((x, y, start, states[start-z0:z-z0]))
+                    start = None
+            elif start is None:
+                start = z
+        if start is not None:
+            copied.append((x, y, start, states[start-z0:]))
+    return copied
+
+# Move runs of states by dx, dy, dz, dropping anything which falls outside
+# of the voxel space.
+def offset_states(runs, dx, dy, dz, width, height, depth):
+    moved = []
+    for x, y, z, states in runs:
+        x += dx
+        y += dy
+        if x < 0 or x >= width or y < 0 or y >= height:
+            continue
+        z += dz
+        if z < 0:
+            states = states[-z:]
+            z = 0
+        states = states[:depth-z]
+        if states:
+            moved.append((x, y, z, states))
+    return moved
+
+class Selection(object):
+
+    # Runs of selected voxels
+    @property
+    def runs(self):
+        return self._runs
+    @runs.setter
+    def runs(self, value):
+        self._runs = value
+        if self.notify_changed:
+            self.notify_changed()
+
+    def __init__(self):
+        self._runs = []
+        # Callback when the selection changes
+        self.notify_changed = None
+
+    def __nonzero__(self):
+        return bool(self._runs)
+
+    def clear(self):
+        self.runs = []
+
+    # Select everything in the box between two voxels
+    def select_box(self, voxels, start, end):
+        self.runs = shapes.clip(shapes.box(*(start + end)),
+            voxels.width, voxels.height, voxels.depth)
+
+    # Select the region connected to the given voxel, see
+    # VoxelData.get_region() for the options.
+    def select_region(self, voxels, x, y, z, **options):
+        if voxels.get(x, y, z) == EMPTY:
+            self.runs = []
+            return
+        self.runs = voxels.get_region(x, y, z, **options)
+
+    # Our runs clipped to the model, which may have changed size
+    def _clipped(self, voxels):
+        return shapes.clip(self._runs, voxels.width, voxels.height,
+            voxels.depth)
+
+    # Return a copy of the selected voxels, for paste()
+    def copy(self, voxels):
+        return copy_runs(voxels, self._clipped(voxels))
+
+    # Empty the selected voxels
+    def delete(self, voxels):
+        voxels.fill_runs(self._clipped(voxels), EMPTY)
+
+    # Copy then delete the selected voxels
+    def cut(self, voxels):
+        copied = self.copy(voxels)
+        self.delete(voxels)
+        return copied
+
+    # Write copied voxels into the model offset by dx, dy, dz and select them
+    def paste(self, voxels, copied, dx = 0, dy = 0, dz = 0):
+        pasted = offset_states(copied, dx, dy, dz,
+            voxels.width, voxels.height, voxels.depth)
+        voxels.set_region(pasted)
+        self.runs = [(x, y, z, z+len(states)) for x, y, z, states in pasted]
+
+    # Move the selected voxels by dx, dy, dz. If stamp is True a copy is
+    # moved and the originals are left in place.
+    def move(self, voxels, dx, dy, dz, stamp = False):
+        runs = self._clipped(voxels)
+        copied = copy_runs(voxels, runs)
+        moved = offset_states(copied, dx, dy, dz,
+            voxels.width, voxels.height, voxels.depth)
+        if stamp:
+            erase = []
+        else:
+            erase = [(x, y, z0, [EMPTY] * (z1-z0)) for x, y, z0, z1 in runs]
+        # Erase then write in one step
+        voxels.set_region(erase + moved)
+        self.runs = shapes.clip([(x+dx, y+dy, z0+dz, z1+dz)
+            for x, y, z0, z1 in runs],
+            voxels.width, voxels.height, voxels.depth)
@@ -0,0 +1,155 @@
+# shapes.py
+# Rasterise simple shapes into voxels.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Shapes are described by two opposite corner voxels (inclusive) and are
+# returned as runs of voxels along the z axis, (x, y, z0, z1) with z1
+# exclusive, ready for VoxelData.fill_runs(). Runs are not clipped, use
+# clip() to fit them to a voxel space.
+
+import math
+
+# Constants for referring to axis, as VoxelData
+X_AXIS = 1
+Y_AXIS = 2
+Z_AXIS = 3
+
+# Return the corners in order, smallest first
+def _order(x0, y0, z0, x1, y1, z1):
+    return (min(x0, x1), min(y0, y1), min(z0, z1),
+        max(x0, x1), max(y0, y1), max(z0, z1))
+
+# Return the centre and radius of the span from a to b inclusive
+def _span(a, b):
+    return (a + b) / 2.0, (b - a + 1) / 2.0
+
+# Return the z range (z0, z1) of voxels centred within half of centre
+def _z_range(centre, half):
+    return int(math.ceil(centre - half)), int(math.floor(centre + half)) + 1
+
+# A solid box
+def box(x0, y0, z0, x1, y1, z1):
+    x0, y0, z0, x1, y1, z1 = _order(x0, y0, z0, x1, y1, z1)
+    return [(x, y, z0, z1+1) for x in xrange(x0, x1+1)
+        for y in xrange(y0, y1+1)]
+
+# A line between the centres of the two voxels, using a 3D Bresenham
+def line(x0, y0, z0, x1, y1, z1):
+    dx = abs(x1 - x0)
+    dy = abs(y1 - y0)
+    dz = abs(z1 - z0)
+    sx = 1 if x1 >= x0 else -1
+    sy = 1 if y1 >= y0 else -1
+    sz = 1 if z1 >= z0 else -1
+    runs = [(x0, y0, z0, z0+1)]
+    # Step along the axis with the largest change
+    if dx >= dy and dx >= dz:
+        ey = 2*dy - dx
+        ez = 2*dz - dx
+        for _ in xrange(dx):
+            if ey >= 0:
+                y0 += sy
+                ey -= 2*dx
+            if ez >= 0:
+                z0 += sz
+                ez -= 2*dx
+            ey += 2*dy
+            ez += 2*dz
+            x0 += sx
+            runs.append((x0, y0, z0, z0+1))
+    elif dy >= dx and dy >= dz:
+        ex = 2*dx - dy
+        ez = 2*dz - dy
+        for _ in xrange(dy):
+            if ex >= 0:
+                x0 += sx
+                ex -= 2*dy
+            if ez >= 0:
+                z0 += sz
+                ez -= 2*dy
+            ex += 2*dx
+            ez += 2*dz
+            y0 += sy
+            runs.append((x0, y0, z0, z0+1))
+    else:
+        ex = 2*dx - dz
+        ey = 2*dy - dz
+        for _ in xrange(dz):
+            if ex >= 0:
+                x0 += sx
+                ex -= 2*dz
+            if ey >= 0:
+                y0 += sy
+                ey -= 2*dz
+            ex += 2*dx
+            ey += 2*dy
+            z0 += sz
+            runs.append((x0, y0, z0, z0+1))
+    return runs
+
+# A solid ellipsoid filling the box, a sphere if the box is a cube
+def ellipsoid(x0, y0, z0, x1, y1, z1):
+    x0, y0, z0, x1, y1, z1 = _order(x0, y0, z0, x1, y1, z1)
+    cx, rx = _span(x0, x1)
+    cy, ry = _span(y0, y1)
+    cz, rz = _span(z0, z1)
+    runs = []
+    for x in xrange(x0, x1+1):
+        for y in xrange(y0, y1+1):
+            d = ((x - cx) / rx) ** 2 + ((y - cy) / ry) ** 2
+            if d > 1:
+                continue
+            start, end = _z_range(cz, rz * math.sqrt(1 - d))
+            if start < end:
+                runs.append((x, y, start, end))
+    return runs
+
+# A solid cylinder filling the box, with its length along the given axis
+def cylinder(x0, y0, z0, x1, y1, z1, axis = Y_AXIS):
+    x0, y0, z0, x1, y1, z1 = _order(x0, y0, z0, x1, y1, z1)
+    cx, rx = _span(x0, x1)
+    cy, ry = _span(y0, y1)
+    cz, rz = _span(z0, z1)
+    runs = []
+    for x in xrange(x0, x1+1):
+        for y in xrange(y0, y1+1):
+            if axis == Z_AXIS:
+                # Runs are along our length, each circle is a column
+                if ((x - cx) / rx) ** 2 + ((y - cy) / ry) ** 2 <= 1:
+                    runs.append((x, y, z0, z1+1))
+                continue
+            if axis == X_AXIS:
+                d = ((y - cy) / ry) ** 2
+            else:
+                d = ((x - cx) / rx) ** 2
+            if d > 1:
+                continue
+            start, end = _z_range(cz, rz * math.sqrt(1 - d))
+            if start < end:
+                runs.append((x, y, start, end))
+    return runs
+
+# Clip runs to a voxel space of the given dimensions
+def clip(runs, width, height, depth):
+    clipped = []
+    for x, y, z0, z1 in runs:
+        if x < 0 or x >= width or y < 0 or y >= height:
+            continue
+        z0 = max(z0, 0)
+        z1 = min(z1, depth)
+        if z0 < z1:
+            clipped.append((x, y, z0, z1))
+    return clipped
@@ -0,0 +1,231 @@
+# software_render.py
+# Render models without OpenGL, using NumPy.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# A z-buffered triangle rasteriser for previews on machines without a
+# display. It uses the same orthographic cameras as sprites.py and the
+# editor's lighting, with vertex colours (the occlusion shading)
+# interpolated across each triangle.
+#
+# Nothing here loops over voxels or pixels in Python. mesh_arrays() finds
+# the faces of a model with whole-array operations and rasterise() tests
+# every triangle against the pixels of its bounding box at once, a chunk of
+# triangles at a time.
+#
+# NumPy is only needed by this module, which is only imported by the
+# preview exporter (plugins/io_preview.py) when NumPy is installed.
+
+import struct
+import zlib
+import numpy as np
+from voxel import OCCLUSION
+from sprites import view_matrix, AMBIENT, DEFAULT_PITCH
+
+# Default preview camera, looking at a front corner of the model
+DEFAULT_YAW = 45
+
+# Most (triangle, pixel) pairs tested at once by rasterise()
+CHUNK = 1 << 20
+
+# Index of each corner of a face, in the order we draw them
+_CORNERS = ((-1, -1), (1, -1), (1, 1), (-1, 1))
+
+# Return a triangle mesh of the current frame of voxels, the same mesh as
+# get_vertices() gives us, as arrays of vertices (n, 3, 3), vertex colours
+# (n, 3, 3) and face normals (n, 3).
+def mesh_arrays(voxels):
+    width, height, depth = voxels.width, voxels.height, voxels.depth
+    data = np.array(voxels.get_frame_data(voxels.get_frame_number()),
+        dtype = np.uint32).reshape(width, height, depth)
+    filled = data != 0
+    padded = np.pad(filled, 1, "constant").astype(np.uint8)
+    # Voxels next to each voxel, offset by (dx, dy, dz)
+    def neighbours(offset):
+        x, y, z = [1 + d for d in offset]
+        return padded[x:x+width, y:y+height, z:z+depth]
+    rgb = np.stack([data >> 24, data >> 16 & 0xff, data >> 8 & 0xff], -1)
+    shades = OCCLUSION ** np.arange(5)
+    origin = np.array([width // 2 + 0.5, height // 2 + 0.5,
+        depth // 2 + 0.5])
+
+    vertices = []
+    colours = []
+    normals = []
+    for axis in xrange(3):
+        u, v = [a for a in xrange(3) if a != axis]
+        for side in (-1, 1):
+            normal = [0, 0, 0]
+            normal[axis] = side
+            exposed = filled & (neighbours(normal) == 0)
+            where = np.nonzero(exposed)
+            count = len(where[0])
+            if not count:
+                continue
+            position = np.stack(where, -1).astype(np.float32)
+            colour = rgb[where]
+            corners = np.empty((count, 4, 3), np.float32)
+            corner_colours = np.empty((count, 4, 3), np.float32)
+            for i, (su, sv) in enumerate(_CORNERS):
+                corner = position.copy()
+                corner[:, axis] += side > 0
+                corner[:, u] += su > 0
+                corner[:, v] += sv > 0
+                corners[:, i] = corner
+                # Occlusion from the voxels in front of this corner
+                occluded = np.zeros(count, np.int32)
+                if voxels.occlusion:
+                    for du, dv in ((su, 0), (0, sv), (su, sv)):
+                        offset = list(normal)
+                        offset[u] += du
+                        offset[v] += dv
+                        occluded += neighbours(offset)[where]
+                # Truncated like get_vertices()
+                corner_colours[:, i] = np.floor(
+                    colour * shades[occluded][:, None])
+            # Two triangles per face
+            for a, b, c in ((0, 1, 2), (0, 2, 3)):
+                vertices.append(corners[:, (a, b, c)])
+                colours.append(corner_colours[:, (a, b, c)])
+                normals.append(np.tile(normal, (count, 1)))
+    if not vertices:
+        return (np.zeros((0, 3, 3), np.float32),
+            np.zeros((0, 3, 3), np.float32), np.zeros((0, 3), np.float32))
+    vertices = np.concatenate(vertices) - origin
+    normals = np.concatenate(normals).astype(np.float32)
+    # World space has z towards the viewer
+    vertices[..., 2] *= -1
+    normals[:, 2] *= -1
+    return vertices, np.concatenate(colours), normals
+
+# Convert the lists returned by VoxelData.get_vertices() into arrays like
+# those of mesh_arrays()
+def from_vertices(vertices, colours, normals):
+    return (np.asarray(vertices, np.float32).reshape(-1, 3, 3),
+        np.asarray(colours, np.float32).reshape(-1, 3, 3),
+        np.asarray(normals, np.float32).reshape(-1, 3, 3)[:, 0])
+
+# Rasterise a triangle mesh (as from mesh_arrays()) with the given view
+# matrix (see sprites.view_matrix()) into an RGBA image of width x height.
+# World space is scaled by scale pixels per unit and the world origin is
+# drawn at centre (x, y). Returns an array of shape (height, width, 4).
+def rasterise(mesh, view, scale, centre, width, height,
+    background = (0, 0, 0, 0)):
+    vertices, colours, normals = mesh
+    image = np.empty((height * width, 4), np.uint8)
+    image[:] = background
+    view = np.asarray(view, np.float32)
+    # Triangles facing the camera, lit as OpenGL would
+    facing = normals.dot(view[2])
+    keep = facing > 0
+    eye = vertices[keep].dot(view.T)
+    light = np.minimum(1.0, AMBIENT + facing[keep])
+    colours = colours[keep] * light[:, None, None]
+    screen = np.empty(eye.shape[:2] + (2,), np.float32)
+    screen[..., 0] = eye[..., 0] * scale + centre[0]
+    screen[..., 1] = centre[1] - eye[..., 1] * scale
+    depth = eye[..., 2]
+
+    # The pixels of each triangle's bounding box, whose centres we test
+    low = np.floor(screen.min(1) - 0.5).astype(np.int32)
+    span = 0
+    if len(screen):
+        span = int(np.ceil((screen.max(1) - screen.min(1)).max())) + 2
+    grid = np.arange(span)
+    gx, gy = [g.ravel() for g in np.meshgrid(grid, grid)]
+    zbuffer = np.empty(height * width, np.float32)
+    zbuffer[:] = -np.inf
+    step = max(1, CHUNK // max(1, span * span))
+    for start in xrange(0, len(screen), step):
+        tri = screen[start:start+step]
+        px = low[start:start+step, 0, None] + gx
+        py = low[start:start+step, 1, None] + gy
+        cx = px + 0.5
+        cy = py + 0.5
+        # Edge functions, which are barycentric weights scaled by area
+        x0, y0 = tri[:, 0, 0, None], tri[:, 0, 1, None]
+        x1, y1 = tri[:, 1, 0, None], tri[:, 1, 1, None]
+        x2, y2 = tri[:, 2, 0, None], tri[:, 2, 1, None]
+        w0 = (x2 - x1) * (cy - y1) - (y2 - y1) * (cx - x1)
+        w1 = (x0 - x2) * (cy - y2) - (y0 - y2) * (cx - x2)
+        w2 = (x1 - x0) * (cy - y0) - (y1 - y0) * (cx - x0)
+        area = w0 + w1 + w2
+        # Either winding will do, back faces are already gone
+        sign = np.where(area < 0, -1, 1)
+        inside = ((w0 * sign >= 0) & (w1 * sign >= 0) & (w2 * sign >= 0)
+            & (area != 0) & (px >= 0) & (px < width)
+            & (py >= 0) & (py < height))
+        t, s = np.nonzero(inside)
+        if not len(t):
+            continue
+        area = area[t, s]
+        weights = np.stack([w0[t, s], w1[t, s], w2[t, s]], -1)
+        weights /= area[:, None]
+        z = (weights * depth[start + t]).sum(-1)
+        pixel = py[t, s] * width + px[t, s]
+        # Nearest fragment of each pixel in this chunk, then against the
+        # z-buffer
+        order = np.lexsort((-z, pixel))
+        pixel = pixel[order]
+        first = np.ones(len(pixel), bool)
+        first[1:] = pixel[1:] != pixel[:-1]
+        order = order[first]
+        pixel = pixel[first]
+        z = z[order]
+        nearer = z > zbuffer[pixel]
+        order = order[nearer]
+        pixel = pixel[nearer]
+        zbuffer[pixel] = z[nearer]
+        colour = (weights[order, :, None]
+            * colours[start + t[order]]).sum(1)
+        image[pixel, :3] = np.clip(colour, 0, 255)
+        image[pixel, 3] = 255
+    return image.reshape(height, width, 4)
+
+# Render the current frame of voxels into an image of width x height
+# pixels, fitting the whole model in the view. Returns an array of shape
+# (height, width, 4) of red, green, blue and alpha.
+def render(voxels, width, height, yaw = DEFAULT_YAW, pitch = DEFAULT_PITCH,
+    background = (0, 0, 0, 0), margin = 2):
+    mesh = mesh_arrays(voxels)
+    view = np.asarray(view_matrix(yaw, pitch), np.float32)
+    if not len(mesh[0]):
+        image = np.empty((height, width, 4), np.uint8)
+        image[:] = background
+        return image
+    eye = mesh[0].reshape(-1, 3).dot(view[:2].T)
+    low = eye.min(0)
+    high = eye.max(0)
+    size = np.maximum(high - low, 1e-6)
+    scale = min((width - margin * 2) / size[0],
+        (height - margin * 2) / size[1])
+    middle = (low + high) / 2
+    centre = (width / 2.0 - middle[0] * scale,
+        height / 2.0 + middle[1] * scale)
+    return rasterise(mesh, view, scale, centre, width, height, background)
+
+# Write an image array from render() to the file f as a PNG
+def write_png(f, image):
+    height, width = image.shape[:2]
+    def chunk(kind, data):
+        f.write(struct.pack(">I", len(data)) + kind + data)
+        f.write(struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+    # Every row starts with filter type 0, none
+    rows = np.zeros((height, width * 4 + 1), np.uint8)
+    rows[:, 1:] = image.reshape(height, width * 4)
+    f.write(b"\x89PNG\r\n\x1a\n")
+    chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+    chunk(b"IDAT", zlib.compress(rows.tostring(), 6))
+    chunk(b"IEND", b"")
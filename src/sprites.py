@@ -0,0 +1,205 @@
+# sprites.py
+# Render models from several angles into packed sprite sheets.
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Sprites are drawn with an orthographic camera into QImages by QPainter,
+# sorting triangles back to front, so no OpenGL context or QApplication is
+# needed and sheets can be built by worker processes (see
+# zoxel_sprites.py). Lighting matches the editor's: a light at the camera
+# plus a little ambient, over the mesh's occlusion shading.
+#
+# Every view of the model is trimmed to what was drawn and the sprites are
+# packed onto shelves. The frame map is in the JSON hash format most game
+# engines and sprite tools read; spriteSourceSize places a trimmed sprite
+# within its sourceSize, which is the same for every frame seen from one
+# angle, so frames line up when played back.
+
+import math
+from PySide import QtCore, QtGui
+
+# Default camera
+DEFAULT_ANGLES = 8
+DEFAULT_PITCH = 30
+# Default pixels per voxel
+DEFAULT_SCALE = 2
+# Transparent pixels left between sprites on the sheet
+PADDING = 1
+
+# As OpenGL's default lighting model
+AMBIENT = 0.2
+
+# Return the rows of the matrix rotating world space into camera space, for
+# a camera turned yaw degrees around the model and looking down on it by
+# pitch degrees.
+def view_matrix(yaw, pitch):
+    yaw = math.radians(yaw)
+    pitch = math.radians(pitch)
+    cy, sy = math.cos(yaw), math.sin(yaw)
+    cp, sp = math.cos(pitch), math.sin(pitch)
+    return ((cy, 0, sy),
+        (sp * sy, cp, -sp * cy),
+        (-cp * sy, sp, cp * cy))
+
+# Return the screen bounds (left, top, right, bottom) of the given world
+# space points, in pixels relative to the world origin
+def _screen_bounds(points, view, scale):
+    (ax, ay, az), (bx, by, bz), _ = view
+    xs = [(ax*x + ay*y + az*z) * scale for x, y, z in points]
+    ys = [-(bx*x + by*y + bz*z) * scale for x, y, z in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+# Project a mesh, as returned by VoxelData.get_vertices(), into screen
+# space. Returns a list of (depth, polygon, colour) for each triangle facing
+# the camera, furthest first, with polygons relative to the world origin.
+def _triangles(mesh, view, scale):
+    vertices, colours, normals = mesh[:3]
+    (ax, ay, az), (bx, by, bz), (cx, cy, cz) = view
+    triangles = []
+    for i in xrange(0, len(vertices), 9):
+        # All three vertices share a normal
+        nx, ny, nz = normals[i:i+3]
+        facing = cx*nx + cy*ny + cz*nz
+        if facing <= 0:
+            continue
+        light = min(1.0, AMBIENT + facing)
+        points = []
+        depth = 0
+        for j in xrange(i, i+9, 3):
+            x, y, z = vertices[j:j+3]
+            points.append(QtCore.QPointF((ax*x + ay*y + az*z) * scale,
+                -(bx*x + by*y + bz*z) * scale))
+            depth += cx*x + cy*y + cz*z
+        # Flat shade with the average of the vertex colours
+        r = sum(colours[i:i+9:3]) * light / 3
+        g = sum(colours[i+1:i+9:3]) * light / 3
+        b = sum(colours[i+2:i+9:3]) * light / 3
+        triangles.append((depth, QtGui.QPolygonF(points),
+            QtGui.QColor(int(r), int(g), int(b))))
+    triangles.sort(key = lambda t: t[0])
+    return triangles
+
+# Draw a mesh from the given view. Returns the QImage and its offset from
+# the world origin in pixels, or (None, None) if nothing was drawn.
+def render_view(mesh, view, scale):
+    triangles = _triangles(mesh, view, scale)
+    if not triangles:
+        return None, None
+    bounds = QtCore.QRectF()
+    for _, polygon, _ in triangles:
+        bounds = bounds.united(polygon.boundingRect())
+    bounds = bounds.toAlignedRect()
+    image = QtGui.QImage(bounds.width(), bounds.height(),
+        QtGui.QImage.Format_ARGB32_Premultiplied)
+    image.fill(0)
+    painter = QtGui.QPainter(image)
+    painter.setPen(QtCore.Qt.NoPen)
+    painter.translate(-bounds.left(), -bounds.top())
+    for _, polygon, colour in triangles:
+        painter.setBrush(colour)
+        painter.drawPolygon(polygon)
+    painter.end()
+    return image, (bounds.left(), bounds.top())
+
+# Pack rectangles, a list of (width, height), onto shelves. Returns the
+# sheet size (width, height) and the position (x, y) of each rectangle.
+def pack(sizes, padding = PADDING):
+    area = sum((w + padding) * (h + padding) for w, h in sizes)
+    width = 1
+    while width * width < area:
+        width *= 2
+    width = max([width] + [w for w, _ in sizes])
+    positions = [None] * len(sizes)
+    x = y = shelf = 0
+    # Tallest first, so shelves waste little space
+    for i in sorted(xrange(len(sizes)), key = lambda i: -sizes[i][1]):
+        w, h = sizes[i]
+        if x + w > width:
+            y += shelf + padding
+            x = shelf = 0
+        positions[i] = (x, y)
+        x += w + padding
+        shelf = max(shelf, h)
+    return (width, y + shelf), positions
+
+# Render every frame of voxels from angles evenly spaced cameras around the
+# model and pack them into one sheet. name is used to name the sprites in
+# the frame map, and image the sheet filename recorded there. Returns the
+# sheet QImage and the frame map, ready to write as JSON.
+def build_sheet(voxels, name, image = None, angles = DEFAULT_ANGLES,
+    pitch = DEFAULT_PITCH, scale = DEFAULT_SCALE, progress = None):
+    # The model's bounds over all frames, in world space
+    x, y, z, width, height, depth = voxels.get_bounding_box()
+    corners = []
+    if width > 0:
+        x0, y0, z0 = voxels.voxel_to_world(x, y, z)
+        x1, y1, z1 = voxels.voxel_to_world(x + width, y + height, z + depth)
+        corners = [(cx, cy, cz) for cx in (x0, x1) for cy in (y0, y1)
+            for cz in (z0, z1)]
+    frames = voxels.get_frame_count()
+    meshes = [voxels.frame_view(f).get_vertices() for f in xrange(frames)]
+    sprites = []
+    for a in xrange(angles):
+        yaw = 360.0 * a / angles
+        view = view_matrix(yaw, pitch)
+        if corners:
+            left, top, right, bottom = [int(math.floor(v)) if i < 2
+                else int(math.ceil(v)) for i, v
+                in enumerate(_screen_bounds(corners, view, scale))]
+        else:
+            left = top = right = bottom = 0
+        for f, mesh in enumerate(meshes):
+            if progress:
+                progress(a * frames + f, angles * frames)
+            sprite, offset = render_view(mesh, view, scale)
+            sprites.append((yaw, f, sprite, offset,
+                (left, top, right - left, bottom - top)))
+
+    sizes = [(s.width(), s.height()) if s else (0, 0)
+        for _, _, s, _, _ in sprites]
+    (width, height), positions = pack(sizes)
+    sheet = QtGui.QImage(max(width, 1), max(height, 1),
+        QtGui.QImage.Format_ARGB32_Premultiplied)
+    sheet.fill(0)
+    painter = QtGui.QPainter(sheet)
+    result = {}
+    for (yaw, f, sprite, offset, cell), (w, h), (px, py) in zip(sprites,
+        sizes, positions):
+        left, top, cell_width, cell_height = cell
+        if sprite:
+            painter.drawImage(px, py, sprite)
+            sx, sy = offset[0] - left, offset[1] - top
+        else:
+            sx = sy = 0
+        result["%s_%03i_%04i" % (name, int(round(yaw)), f + 1)] = {
+            "frame": {"x": px, "y": py, "w": w, "h": h},
+            "rotated": False,
+            "trimmed": True,
+            "spriteSourceSize": {"x": sx, "y": sy, "w": w, "h": h},
+            "sourceSize": {"w": cell_width, "h": cell_height},
+            # Where the centre of the model's space is in the source
+            "pivot": {"x": -left, "y": -top},
+            "angle": yaw,
+            "animationFrame": f + 1}
+    painter.end()
+    meta = {"app": "Zoxel",
+        "image": image or name + ".png",
+        "format": "RGBA8888",
+        "size": {"w": sheet.width(), "h": sheet.height()},
+        "scale": scale,
+        "angles": angles,
+        "pitch": pitch,
+        "animationFrames": frames}
+    return sheet, {"frames": result, "meta": meta}
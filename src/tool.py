@@ -15,7 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from PySide import QtGui
+from PySide import QtCore, QtGui
 
 # Enumeration type
 def enum(*sequential, **named):
@@ -135,6 +135,15 @@ class EventData(object):
             (self._face == other._face ) and
             (self._voxels == other._voxels ) )
 
+    # Is this a drag tools should act on? Middle drags and right drags with
+    # CTRL held turn the camera instead.
+    def is_tool_drag(self):
+        if self._mouse_button == MouseButtons.LEFT:
+            return True
+        ctrl = (self._key_modifiers and self._key_modifiers
+            & QtCore.Qt.KeyboardModifier.ControlModifier)
+        return self._mouse_button == MouseButtons.RIGHT and not ctrl
+
     # Returns the coordinates of the voxel next to the selected face.
     # Or None if there is not one.
     def get_neighbour(self):
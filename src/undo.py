@@ -39,6 +39,10 @@ class Undo(object):
     # Types of operation
     SET_VOXEL = 1
     TRANSLATE = 2
+    SET_REGION = 3
+    SHIFT = 4
+    PALETTE = 5
+    REPLACE = 6
     
     @property 
     def enabled(self):
@@ -66,14 +70,17 @@ class Undo(object):
         del self._buffer[pos]
         del self._ptr[pos] 
 
-    def add(self, item):
+    # Add an item to the history of the given frame, the current frame if None
+    def add(self, item, frame = None):
         if not self._enabled:
             return
+        if frame is None:
+            frame = self._frame
         # Clear future if we're somewhere in the middle of the undo history
-        if self._ptr[self._frame] < len(self._buffer[self._frame])-1:
-            self._buffer[self._frame] = self._buffer[self._frame][:self._ptr[self._frame]+1]
-        self._buffer[self._frame].append(item)
-        self._ptr[self._frame] = len(self._buffer[self._frame])-1
+        if self._ptr[frame] < len(self._buffer[frame])-1:
+            self._buffer[frame] = self._buffer[frame][:self._ptr[frame]+1]
+        self._buffer[frame].append(item)
+        self._ptr[frame] = len(self._buffer[frame])-1
     
     def _valid_buffer(self):
         return len(self._buffer[self._frame]) > 0
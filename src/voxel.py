@@ -23,9 +23,16 @@
 #
 # get_vertices() returns a list of vertices, along with normals and colours
 # which describes the current state of the voxel world.
+#
+# Voxel states are 0xRRGGBBAA colours. A model can instead be indexed (see
+# to_indexed()), where each voxel holds its position in a palette, plus one,
+# and recolouring means changing a palette entry. Only our storage changes:
+# states passed to and returned by our public methods are still colours.
 
 import math
-import copy
+import operator
+from functools import partial
+from itertools import count, izip
 from undo import Undo, UndoItem
 
 # Default world dimensions (in voxels)
@@ -43,6 +50,316 @@ FULL = 1
 # Occlusion factor
 OCCLUSION = 0.7
 
+# Most colours an indexed model can have
+MAX_PALETTE_SIZE = 1024
+
+# Source of frame revisions, unique across all models, see get_revision()
+_revisions = count(1)
+
+# Shift a list n places towards its end, in place. Items moved off the end
+# wrap around to the start, unless wrap is False in which case they are lost
+# and new items are created by calling blank().
+def _shift_list(items, n, wrap, blank):
+    length = len(items)
+    if wrap:
+        n %= length
+        if n:
+            items[:] = items[-n:] + items[:-n]
+        return
+    n = max(-length, min(length, n))
+    if n > 0:
+        items[:] = [blank() for _ in xrange(n)] + items[:length-n]
+    elif n < 0:
+        items[:] = items[-n:] + [blank() for _ in xrange(-n)]
+
+# Swap the x and z axes of voxel data, returning new data
+def _swap_xz(data):
+    swapped = [[None] * len(data[0]) for _ in xrange(len(data[0][0]))]
+    for y in xrange(len(data[0])):
+        for z, row in enumerate(zip(*[plane[y] for plane in data])):
+            swapped[z][y] = list(row)
+    return swapped
+
+# Swap the y and z axes of voxel data, returning new data
+def _swap_yz(data):
+    return [[list(row) for row in zip(*plane)] for plane in data]
+
+# Swap the x and y axes of voxel data, returning new data. The columns are
+# reused rather than copied.
+def _swap_xy(data):
+    return [list(plane) for plane in zip(*data)]
+
+# Replace the upper half of a list with a mirror image of the lower half,
+# or the other way around. copy() copies a slice of the list.
+def _symmetric_list(items, from_lower, copy):
+    half = len(items) // 2
+    if from_lower:
+        items[len(items)-half:] = copy(items[half-1::-1] if half else [])
+    else:
+        items[:half] = copy(items[:len(items)-half-1:-1])
+
+# Clip runs of states (x, y, z, states) to a voxel space of the given
+# dimensions
+def _clip_states(runs, width, height, depth):
+    clipped = []
+    for x, y, z, states in runs:
+        if x < 0 or x >= width or y < 0 or y >= height:
+            continue
+        if z < 0:
+            states = states[-z:]
+            z = 0
+        states = states[:depth-z]
+        if states:
+            clipped.append((x, y, z, states))
+    return clipped
+
+# Is state within tolerance of colour on each of red, green and blue?
+def _similar(colour, tolerance, state):
+    if state == EMPTY:
+        return False
+    return (abs((colour >> 24) - (state >> 24)) <= tolerance and
+        abs((colour >> 16 & 0xff) - (state >> 16 & 0xff)) <= tolerance and
+        abs((colour >> 8 & 0xff) - (state >> 8 & 0xff)) <= tolerance)
+
+# Return the red, green and blue of a colour
+def _rgb(colour):
+    return colour >> 24, colour >> 16 & 0xff, colour >> 8 & 0xff
+
+# Yield the (start, end) of each run of set bytes in mask between low and
+# high, although runs may extend beyond them.
+def _mask_runs(mask, low = 0, high = None):
+    if high is None:
+        high = len(mask)
+    start = mask.find(b'\1', low, high)
+    while start >= 0:
+        end = mask.find(b'\0', start)
+        if end < 0:
+            end = len(mask)
+        yield start, end
+        start = mask.find(b'\1', end, high)
+
+# Masks of the voxels in each (x, y) column which belong to a region,
+# created as they are first needed. Used by VoxelData._flood() which clears
+# voxels from the masks as it visits them.
+class _ColumnMasks(dict):
+
+    # palette is the palette of an indexed model, when data holds indices
+    def __init__(self, data, search, tolerance = 0, palette = None):
+        self._data = data
+        self._search = search
+        if tolerance and search != EMPTY:
+            if palette:
+                # Compare the colours of each index just once
+                colour = palette[search-1]
+                similar = set(i+1 for i, c in enumerate(palette)
+                    if _similar(colour, tolerance, c))
+                self._matches = similar.__contains__
+            else:
+                self._matches = partial(_similar, search, tolerance)
+        else:
+            self._matches = None
+
+    def __missing__(self, key):
+        x, y = key
+        column = self._data[x][y]
+        count = column.count(self._search)
+        # Columns entirely in or out of the region are common
+        if count == len(column):
+            mask = bytearray(b'\1' * count)
+        elif self._matches:
+            mask = bytearray(map(self._matches, column))
+        elif count == 0:
+            mask = bytearray(len(column))
+        else:
+            mask = bytearray(map(partial(operator.eq, self._search), column))
+        self[key] = mask
+        return mask
+
+# The bounding box of one frame, kept up to date as voxels are added and
+# removed. We count the occupied voxels in every plane along each axis, so
+# the box only needs recalculating from the counts when the last voxel in
+# one of its boundary planes is removed. We also count the voxels of each
+# state, which writers keep up to date with recount().
+class _Bounds(object):
+
+    # The number of voxels in the frame
+    @property
+    def count(self):
+        return sum(self._counts[0])
+
+    # Count the voxels in data, a blank frame if None
+    def __init__(self, width, height, depth, data = None):
+        self._counts = ([0] * width, [0] * height, [0] * depth)
+        self._box = None
+        self._stale = False
+        # Number of voxels of each state, other than EMPTY
+        self.states = {}
+        if data is None:
+            return
+        xs, ys, zs = self._counts
+        states = self.states
+        for x, plane in enumerate(data):
+            for y, column in enumerate(plane):
+                n = depth - column.count(EMPTY)
+                if not n:
+                    continue
+                xs[x] += n
+                ys[y] += n
+                if n == depth:
+                    zs[:] = [c+1 for c in zs]
+                else:
+                    for z, state in enumerate(column):
+                        if state != EMPTY:
+                            zs[z] += 1
+                # Columns rarely hold more than a few states
+                for state in set(column):
+                    states[state] = states.get(state, 0) + column.count(state)
+        states.pop(EMPTY, None)
+        self._stale = True
+
+    def copy(self):
+        bounds = _Bounds(0, 0, 0)
+        bounds._counts = tuple(counts[:] for counts in self._counts)
+        bounds._box = self._box
+        bounds._stale = self._stale
+        bounds.states = dict(self.states)
+        return bounds
+
+    # The voxels which held the states in the sequence previous now hold
+    # those in states
+    def recount(self, previous, states):
+        counts = self.states
+        for state in set(previous):
+            if state != EMPTY:
+                n = counts[state] - previous.count(state)
+                if n:
+                    counts[state] = n
+                else:
+                    del counts[state]
+        for state in set(states):
+            if state != EMPTY:
+                counts[state] = counts.get(state, 0) + states.count(state)
+
+    # Voxels in column x, y at each of the ascending zs have been filled
+    def add(self, x, y, zs):
+        xs, ys, counts = self._counts
+        xs[x] += len(zs)
+        ys[y] += len(zs)
+        for z in zs:
+            counts[z] += 1
+        if self._stale:
+            return
+        box = self._box
+        if box is None:
+            self._box = (x, y, zs[0], x, y, zs[-1])
+        else:
+            self._box = (min(box[0], x), min(box[1], y), min(box[2], zs[0]),
+                max(box[3], x), max(box[4], y), max(box[5], zs[-1]))
+
+    # Voxels in column x, y at each of the zs have been emptied
+    def remove(self, x, y, zs):
+        xs, ys, counts = self._counts
+        xs[x] -= len(zs)
+        ys[y] -= len(zs)
+        for z in zs:
+            counts[z] -= 1
+        if self._stale:
+            return
+        box = self._box
+        # Did we just empty a boundary plane?
+        if ((not xs[x] and x in (box[0], box[3])) or
+            (not ys[y] and y in (box[1], box[4])) or
+            any(not counts[z] and z in (box[2], box[5]) for z in zs)):
+            self._stale = True
+
+    # Reverse the given axis (0, 1 or 2)
+    def mirror(self, axis):
+        self._counts[axis].reverse()
+        self._stale = True
+
+    # Swap two axes
+    def swap(self, a, b):
+        counts = list(self._counts)
+        counts[a], counts[b] = counts[b], counts[a]
+        self._counts = tuple(counts)
+        self._stale = True
+
+    # Move along each axis with wrap around
+    def translate(self, x, y, z):
+        for counts, n in zip(self._counts, (x, y, z)):
+            _shift_list(counts, n, True, None)
+        self._stale = True
+
+    # Return the box (minx, miny, minz, maxx, maxy, maxz), inclusive, or
+    # None if the frame is empty
+    def get(self):
+        if self._stale:
+            box = []
+            for counts in self._counts:
+                occupied = [i for i, n in enumerate(counts) if n]
+                if not occupied:
+                    box = None
+                    break
+                box.append((occupied[0], occupied[-1]))
+            if box:
+                box = tuple([low for low, _ in box] + [high for _, high in box])
+            self._box = box
+            self._stale = False
+        return self._box
+
+# The coordinates of the occupied voxels of a frame. Translating a frame
+# only moves our origin, rather than every coordinate. Coordinates are kept
+# relative to the origin, wrapped around the frame, and converted on the
+# way in and out.
+class _Occupancy(object):
+
+    def __init__(self, width, height, depth, coordinates = ()):
+        self._size = (width, height, depth)
+        self._origin = (0, 0, 0)
+        self._coordinates = set(coordinates)
+
+    def copy(self):
+        return _Occupancy(*self._size, coordinates = self)
+
+    def __len__(self):
+        return len(self._coordinates)
+
+    def __iter__(self):
+        if self._origin == (0, 0, 0):
+            return iter(self._coordinates)
+        (ox, oy, oz), (width, height, depth) = self._origin, self._size
+        return (((x+ox) % width, (y+oy) % height, (z+oz) % depth)
+            for x, y, z in self._coordinates)
+
+    def __contains__(self, coordinate):
+        return self._local(coordinate) in self._coordinates
+
+    # Return a coordinate relative to our origin
+    def _local(self, coordinate):
+        if self._origin == (0, 0, 0):
+            return coordinate
+        (x, y, z), (ox, oy, oz) = coordinate, self._origin
+        width, height, depth = self._size
+        return ((x-ox) % width, (y-oy) % height, (z-oz) % depth)
+
+    def add(self, coordinate):
+        self._coordinates.add(self._local(coordinate))
+
+    def discard(self, coordinate):
+        self._coordinates.discard(self._local(coordinate))
+
+    def update(self, coordinates):
+        self._coordinates.update(map(self._local, coordinates))
+
+    def difference_update(self, coordinates):
+        self._coordinates.difference_update(map(self._local, coordinates))
+
+    # Move every coordinate, wrapping around the frame. Voxels which
+    # shouldn't wrap must be removed first.
+    def translate(self, x, y, z):
+        self._origin = tuple((o + d) % n
+            for o, d, n in zip(self._origin, (x, y, z), self._size))
+
 class VoxelData(object):
 
     # Constants for referring to axis
@@ -73,12 +390,59 @@ class VoxelData(object):
                 self.notify_changed()
         self._changed = value
 
+    # The set of axes (X_AXIS, Y_AXIS, Z_AXIS) edits are mirrored along
+    @property
+    def symmetry(self):
+        return self._symmetry
+    @symmetry.setter
+    def symmetry(self, value):
+        self._symmetry = set(value)
+
+    # Voxel coordinates (x, y, z) of the centre of the mirror planes, which
+    # may be half way between voxels. None for the centre of the voxel space.
+    @property
+    def symmetry_centre(self):
+        return self._symmetry_centre
+    @symmetry_centre.setter
+    def symmetry_centre(self, value):
+        self._symmetry_centre = value
+
     @property
     def occlusion(self):
         return self._occlusion
     @occlusion.setter
     def occlusion(self, value):
         self._occlusion = value
+        # Occlusion changes the mesh of every frame
+        self._modified(True)
+
+    # Is our data palette indices rather than colours?
+    @property
+    def indexed(self):
+        return self._palette is not None
+
+    # The colours of an indexed model, or None
+    @property
+    def palette(self):
+        if self._palette is None:
+            return None
+        return tuple(self._palette)
+
+    # Changes whenever our palette does, like get_revision()
+    @property
+    def palette_revision(self):
+        return self._palette_revision
+
+    # Our cache of non-empty voxels (coordinate groups), rebuilt when first
+    # needed after changing frames.
+    @property
+    def _cache(self):
+        if self._occupied is None:
+            self._cache_rebuild()
+        return self._occupied
+    @_cache.setter
+    def _cache(self, value):
+        self._occupied = value
 
     def __init__(self):
         # Default size
@@ -87,6 +451,15 @@ class VoxelData(object):
         self._depth = _WORLD_DEPTH
         # Our undo buffer
         self._undo = Undo()
+        # Callback for every edit, see _edited()
+        self.notify_edit = None
+        # Axes edits are mirrored in, and the centre of the mirror planes
+        self._symmetry = set()
+        self._symmetry_centre = None
+        # Colours of an indexed model, and the state of each colour
+        self._palette = None
+        self._palette_states = None
+        self._palette_revision = next(_revisions)
         # Init data
         self._initialise_data()
         # Callback when our data changes
@@ -96,10 +469,14 @@ class VoxelData(object):
 
     # Initialise our data
     def _initialise_data(self):
-        # Our scene data
+        # Our scene data, in colours
         self._data = self.blank_data()
+        if self._palette is not None:
+            self._palette = None
+            self._palette_states = None
+            self._palette_revision = next(_revisions)
         # Our cache of non-empty voxels (coordinate groups)
-        self._cache = []
+        self._cache = _Occupancy(self.width, self.height, self.depth)
         # Flag indicating if our data has changed
         self._changed = False
         # Reset undo buffer
@@ -108,12 +485,24 @@ class VoxelData(object):
         self._frame_count = 1
         self._current_frame = 0
         self._frames = [self._data]
+        # Bounding box of each frame
+        self._bounds = [_Bounds(self.width, self.height, self.depth)]
+        # Revision of each frame
+        self._revisions = [next(_revisions)]
+        self._edited()
+
+    # Forget our undo history, keeping a history for each of our frames
+    def _reset_undo(self):
+        self._undo.clear()
+        for _ in xrange(self._frame_count-1):
+            self._undo.add_frame(0)
+        self._undo.frame = self._current_frame
 
     # Return an empty voxel space
     def blank_data(self):
-        return [[[0 for _ in xrange(self.depth)]
-            for _ in xrange(self.height)]
-                for _ in xrange(self.width)]
+        depth = self.depth
+        return [[[0] * depth for _ in xrange(self.height)]
+            for _ in xrange(self.width)]
 
     def is_valid_bounds(self, x, y, z):
         return (
@@ -137,19 +526,26 @@ class VoxelData(object):
         self._data = self._frames[frame_number]
         self._current_frame = frame_number
         self._undo.frame = self._current_frame
-        self._cache_rebuild()
+        # Don't rebuild our cache until it is needed, playing an animation
+        # from cached meshes never needs it.
+        self._cache = None
         self.changed = True
 
     # Add a new frame by copying the current one
     def add_frame(self, copy_current = True):
         if copy_current:
-            data = self.get_data()
+            data = self._copy_data(self._data)
+            bounds = self._bounds[self._current_frame].copy()
         else:
             data = self.blank_data()
+            bounds = _Bounds(self.width, self.height, self.depth)
         self._frames.insert(self._current_frame+1, data)
+        self._bounds.insert(self._current_frame+1, bounds)
+        self._revisions.insert(self._current_frame+1, next(_revisions))
         self._undo.add_frame(self._current_frame+1)
         self._frame_count += 1
         self.select_frame(self._current_frame+1)
+        self._edited()
 
     # Delete the current frame
     def delete_frame(self):
@@ -162,6 +558,8 @@ class VoxelData(object):
         self.select_previous_frame()
         # Remove the old frame
         del self._frames[killframe]
+        del self._bounds[killframe]
+        del self._revisions[killframe]
         self._undo.delete_frame(killframe)
         self._frame_count -= 1
         # If we only have one frame left, must be first frame
@@ -170,6 +568,7 @@ class VoxelData(object):
         # If we wrapped around, fix the frame pointer
         if self._current_frame > killframe:
             self._current_frame -= 1
+        self._edited()
 
     # Change to the next frame (with wrap)
     def select_next_frame(self):
@@ -199,38 +598,216 @@ class VoxelData(object):
         # Check bounds
         if ( not self.is_valid_bounds(x, y, z ) ):
             return False
+        # Mirrored edits are a single undo step
+        if self._symmetry:
+            self.set_region([(x, y, z, [state])], undo)
+        else:
+            self._set(x, y, z, self._state(state), undo)
+        return True
+
+    # Set a single voxel, ignoring symmetry
+    def _set(self, x, y, z, state, undo):
         # Set the voxel
         if ( self.is_valid_bounds(x, y, z ) ):
             # Add to undo
-            if undo:
-                self._undo.add(UndoItem(Undo.SET_VOXEL, 
-                (x, y, z, self._data[x][y][z]), (x, y, z, state)))
+            if undo or self.notify_edit:
+                item = UndoItem(Undo.SET_VOXEL,
+                (x, y, z, self._data[x][y][z]), (x, y, z, state))
+                if undo:
+                    self._undo.add(item)
+                self._edited(item)
+            previous = self._data[x][y][z]
             self._data[x][y][z] = state
+            self._bounds[self._current_frame].recount((previous,), (state,))
             if state != EMPTY:
-                if (x,y,z) not in self._cache:
-                    self._cache.append((x,y,z))
+                if previous == EMPTY:
+                    self._cache.add((x,y,z))
+                    self._bounds[self._current_frame].add(x, y, (z,))
+            elif previous != EMPTY:
+                self._cache.discard((x,y,z))
+                self._bounds[self._current_frame].remove(x, y, (z,))
+        self._modified()
+        self.changed = True
+
+    # Set many voxels at once. runs is a list of (x, y, z, states) where
+    # states is a list of voxel states to write along the z axis starting at
+    # z. Runs are written in order, so later runs win where they overlap.
+    # The whole change, including any mirrored copy, is a single undo step.
+    # Runs must be within bounds.
+    def set_region(self, runs, undo = True):
+        if self._palette is not None:
+            runs = [(x, y, z, self._states(states))
+                for x, y, z, states in runs]
+        if self._symmetry:
+            runs = self._mirror_runs(runs)
+        self._set_runs(runs, undo)
+
+    # Return runs of states along with their mirror images in each of our
+    # symmetry planes
+    def _mirror_runs(self, runs):
+        centre = self._symmetry_centre
+        if centre is None:
+            centre = ((self.width-1) / 2.0, (self.height-1) / 2.0,
+                (self.depth-1) / 2.0)
+        for axis in sorted(self._symmetry):
+            # A coordinate c mirrors to twice the centre less c
+            c2 = int(round(centre[axis-1] * 2))
+            if axis == self.X_AXIS:
+                mirrored = [(c2-x, y, z, states) for x, y, z, states in runs]
+            elif axis == self.Y_AXIS:
+                mirrored = [(x, c2-y, z, states) for x, y, z, states in runs]
             else:
-                if (x,y,z) in self._cache:
-                    self._cache.remove((x,y,z))
+                mirrored = [(x, y, c2-(z+len(states)-1), states[::-1])
+                    for x, y, z, states in runs]
+            runs = runs + _clip_states(mirrored,
+                self.width, self.height, self.depth)
+        return runs
+
+    # Write runs of states, ignoring symmetry
+    def _set_runs(self, runs, undo):
+        if not runs:
+            return
+        data = self._data
+        cache = self._cache
+        bounds = self._bounds[self._current_frame]
+        old = []
+        for x, y, z, states in runs:
+            column = data[x][y]
+            end = z+len(states)
+            previous = column[z:end]
+            old.append((x, y, z, previous))
+            column[z:end] = states
+            bounds.recount(previous, states)
+            # Recolouring doesn't change which voxels are occupied
+            if EMPTY in previous or EMPTY in states:
+                added = []
+                removed = []
+                for i, was, state in izip(count(z), previous, states):
+                    if state != EMPTY:
+                        if was == EMPTY:
+                            added.append(i)
+                    elif was != EMPTY:
+                        removed.append(i)
+                if added:
+                    cache.update([(x,y,i) for i in added])
+                    bounds.add(x, y, added)
+                if removed:
+                    cache.difference_update([(x,y,i) for i in removed])
+                    bounds.remove(x, y, removed)
+        # Undo restores in reverse order in case runs overlap
+        old.reverse()
+        # Add to undo
+        if undo or self.notify_edit:
+            item = UndoItem(Undo.SET_REGION, old, runs)
+            if undo:
+                self._undo.add(item)
+            self._edited(item)
+        self._modified()
         self.changed = True
-        return True
 
     # Get the state of the given voxel
     def get(self, x, y, z):
         if ( not self.is_valid_bounds(x, y, z ) ):
             return EMPTY
-        return self._data[x][y][z]
+        state = self._data[x][y][z]
+        if self._palette is not None and state != EMPTY:
+            return self._palette[state-1]
+        return state
+
+    # Return the states of the voxels in runs (x, y, z0, z1) as runs of
+    # states (x, y, z0, states), as set_region() takes.
+    def get_runs(self, runs):
+        data = self._data
+        if self._palette is not None:
+            return [(x, y, z0, self._colours(data[x][y][z0:z1]))
+                for x, y, z0, z1 in runs]
+        return [(x, y, z0, data[x][y][z0:z1]) for x, y, z0, z1 in runs]
+
+    # Return a copy of the given voxel data. Our data is only ever lists
+    # of integers so slicing each column is much cheaper than a deepcopy.
+    def _copy_data(self, data):
+        return [[column[:] for column in plane] for plane in data]
 
     # Return a copy of the voxel data
     def get_data(self):
-        return copy.deepcopy(self._data)
+        if self._palette is not None:
+            return self._colour_data(self._data)
+        return self._copy_data(self._data)
+
+    # Return the voxel data of the given frame. This is our data rather than
+    # a copy, so must not be changed. Indexed models return a copy in
+    # colours.
+    def get_frame_data(self, frame):
+        if frame == self._current_frame:
+            data = self._data
+        else:
+            data = self._frames[frame]
+        if self._palette is not None:
+            return self._colour_data(data)
+        return data
+
+    # Return the number of voxels in the given frame, the current frame if
+    # None
+    def get_voxel_count(self, frame = None):
+        if frame is None:
+            frame = self._current_frame
+        return self._bounds[frame].count
+
+    # Return a dictionary of the number of voxels of each colour in the given
+    # frame, the current frame if None. These are counted as we are edited,
+    # so this is cheap enough to call after every edit.
+    def get_colour_counts(self, frame = None):
+        if frame is None:
+            frame = self._current_frame
+        counts = self._bounds[frame].states
+        if self._palette is None:
+            return dict(counts)
+        # Palette entries may share a colour
+        colours = {}
+        for state, n in counts.iteritems():
+            colour = self._palette[state-1]
+            colours[colour] = colours.get(colour, 0) + n
+        return colours
 
     # Set all of our data at once
     def set_data(self, data):
-        self._data = copy.deepcopy(data)
-        self._cache_rebuild()
+        if self._palette is not None:
+            self._data = [[self._states(column) for column in plane]
+                for plane in data]
+        else:
+            self._data = self._copy_data(data)
+        self._frames[self._current_frame] = self._data
+        self._bounds[self._current_frame] = _Bounds(self.width, self.height,
+            self.depth, self._data)
+        self._cache = None
+        self._modified()
+        self._edited()
         self.changed = True
 
+    # Return a detached copy of the model, including all animation frames.
+    # The copy has an empty undo buffer and no change notification.
+    def copy(self):
+        voxels = VoxelData()
+        voxels._width = self._width
+        voxels._height = self._height
+        voxels._depth = self._depth
+        voxels._occlusion = self._occlusion
+        voxels._frames = [self._copy_data(frame) for frame in self._frames]
+        voxels._frame_count = self._frame_count
+        voxels._current_frame = self._current_frame
+        voxels._reset_undo()
+        voxels._data = voxels._frames[self._current_frame]
+        voxels._cache = self._cache.copy()
+        voxels._bounds = [bounds.copy() for bounds in self._bounds]
+        # The copy's frames look the same so they share revisions
+        voxels._revisions = self._revisions[:]
+        if self._palette is not None:
+            voxels._palette = self._palette[:]
+            voxels._palette_states = dict(self._palette_states)
+            voxels._palette_revision = self._palette_revision
+        voxels._changed = self._changed
+        return voxels
+
     # Clear our voxel data
     def clear(self):
         self._initialise_data()
@@ -251,6 +828,80 @@ class VoxelData(object):
             uvs += uv
         return (vertices, colours, normals, colour_ids, uvs)
 
+    # Return the vertex lists of get_vertices() for an indexed model, with
+    # the colours only shaded by occlusion, from white, and a list of the
+    # palette index plus one of each vertex. The colours are then multiplied
+    # by the palette when drawn.
+    def get_indexed_vertices(self):
+        vertices = []
+        colours = []
+        colour_ids = []
+        normals = []
+        uvs = []
+        indices = []
+        data = self._data
+        for x,y,z in self._cache:
+            v, c, n, cid, uv = self._get_voxel_vertices(x, y, z, 0xffffffff)
+            vertices += v
+            colours += c
+            normals += n
+            colour_ids += cid
+            uvs += uv
+            indices += [data[x][y][z]] * (len(v) // 3)
+        return (vertices, colours, normals, colour_ids, uvs, indices)
+
+    # Return a read only model showing just the given frame, which shares
+    # our voxel data rather than copying it. Used to build the meshes of
+    # frames other than the current one, see mesh.py.
+    def frame_view(self, frame):
+        voxels = VoxelData()
+        voxels._width = self._width
+        voxels._height = self._height
+        voxels._depth = self._depth
+        voxels._occlusion = self._occlusion
+        voxels._data = self._frames[frame]
+        voxels._frames = [voxels._data]
+        voxels._bounds = [self._bounds[frame]]
+        voxels._revisions = [self._revisions[frame]]
+        voxels._cache = None
+        # Share our palette, so recolouring shows in the view
+        voxels._palette = self._palette
+        voxels._palette_states = self._palette_states
+        voxels._palette_revision = self._palette_revision
+        return voxels
+
+    # Return the revision of a frame, the current frame if None. Revisions
+    # change whenever the frame changes and are never reused, by any model,
+    # so they can be used as keys for anything built from a frame.
+    def get_revision(self, frame = None):
+        if frame is None:
+            frame = self._current_frame
+        return self._revisions[frame]
+
+    # Give the current frame, or every frame, a new revision
+    def _modified(self, all_frames = False):
+        if all_frames:
+            self._revisions = [next(_revisions) for _ in self._frames]
+        else:
+            self._revisions[self._current_frame] = next(_revisions)
+
+    # Let whoever is watching our edits know about one. item is the UndoItem
+    # describing a change to the current frame, or None if the change can't
+    # be described that way (resizing, rotating, adding frames, etc.)
+    def _edited(self, item = None):
+        if self.notify_edit:
+            # Watchers see colours, like the rest of our interface
+            if self._palette is not None and item:
+                if item.operation == Undo.SET_VOXEL:
+                    x, y, z, state = item.newdata
+                    item = UndoItem(item.operation, None,
+                        (x, y, z, self._colour(state)))
+                elif item.operation == Undo.SET_REGION:
+                    item = UndoItem(item.operation, None,
+                        [(x, y, z, self._colours(states))
+                        for x, y, z, states in item.newdata])
+            self.notify_edit(self._current_frame, item)
+
     # Called to notify us that our data has been saved. i.e. we can set
     # our "changed" status back to False.
     def saved(self):
@@ -265,7 +916,8 @@ class VoxelData(object):
         return count
 
     # Return the verticies for the given voxel. We center our vertices at the origin
-    def _get_voxel_vertices(self, x, y, z):
+    # The voxel's colour is used unless another is given.
+    def _get_voxel_vertices(self, x, y, z, colour = None):
         vertices = []
         colours = []
         normals = []
@@ -284,7 +936,7 @@ class VoxelData(object):
         bottom = self.get(x, y-1, z) == EMPTY
 
         # Get our colour
-        c = self.get(x, y, z)
+        c = self.get(x, y, z) if colour is None else colour
         r = (c & 0xff000000)>>24
         g = (c & 0xff0000)>>16
         b = (c & 0xff00)>>8
@@ -624,50 +1276,152 @@ class VoxelData(object):
 
     # Rebuild our cache
     def _cache_rebuild(self):
-        self._cache = []
-        for x in range(self.width):
-            for z in range(self.depth):
-                for y in range(self.height):
-                    if self._data[x][y][z] != EMPTY:
-                        self._cache.append((x, y, z))
+        self._cache = cache = _Occupancy(self.width, self.height, self.depth)
+        for x, plane in enumerate(self._data):
+            for y, column in enumerate(plane):
+                # Skip empty columns without looking at each voxel
+                if column.count(EMPTY) != len(column):
+                    cache.update((x, y, z) for z, state in enumerate(column)
+                        if state != EMPTY)
+
+    # Find the region of voxels connected to x, y, z which share its state.
+    # Returns a list of runs (x, y, z0, z1) along the z axis, z1 exclusive.
+    #
+    #   tolerance       also include voxels whose red, green and blue each
+    #                   differ by no more than this
+    #   connectivity    6 to connect voxels through faces, 26 to also connect
+    #                   them through edges and corners
+    #   plane           X_AXIS, Y_AXIS or Z_AXIS to only search the slice
+    #                   through x, y, z perpendicular to that axis
+    def get_region(self, x, y, z, tolerance = 0, connectivity = 6,
+        plane = None):
+        if not self.is_valid_bounds(x, y, z):
+            return []
+        masks = _ColumnMasks(self._data, self._data[x][y][z], tolerance,
+            self._palette)
+        return self._flood(masks, [(x, y, z)], connectivity, plane)
+
+    # Find the empty space enclosed by the model, i.e. empty voxels which
+    # can't be reached through faces from outside of the voxel space.
+    # Returns runs as get_region().
+    def get_interior(self):
+        masks = _ColumnMasks(self._data, EMPTY)
+        width = self.width
+        height = self.height
+        depth = self.depth
+        # Flood the outside from every empty voxel on our boundary
+        seeds = []
+        for x in xrange(width):
+            for y in xrange(height):
+                mask = masks[(x, y)]
+                if x in (0, width-1) or y in (0, height-1):
+                    seeds.extend((x, y, z0) for z0, _ in _mask_runs(mask))
+                else:
+                    seeds.extend((x, y, z) for z in (0, depth-1) if mask[z])
+        self._flood(masks, seeds)
+        # Whatever empty space is left unvisited is enclosed
+        return [(x, y, z0, z1) for x in xrange(width)
+            for y in xrange(height)
+                for z0, z1 in _mask_runs(masks[(x, y)])]
+
+    # This is a scanline fill. Each column of voxels along z is turned into
+    # a mask of unvisited candidate voxels, so finding the extent of a run
+    # and the runs touching it in neighbouring columns are simple byte
+    # searches rather than a lookup per voxel.
+    def _flood(self, masks, seeds, connectivity = 6, plane = None):
+        width = self.width
+        height = self.height
+        if connectivity == 26:
+            neighbours = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                if dx or dy]
+            extend = 1
+        else:
+            neighbours = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+            extend = 0
+        if plane == self.X_AXIS:
+            neighbours = [(dx, dy) for dx, dy in neighbours if not dx]
+        elif plane == self.Y_AXIS:
+            neighbours = [(dx, dy) for dx, dy in neighbours if not dy]
+        runs = []
+        while seeds:
+            x, y, z = seeds.pop()
+            mask = masks[(x, y)]
+            if not mask[z]:
+                continue
+            if plane == self.Z_AXIS:
+                low, high = z, z+1
+            else:
+                low, high = 0, len(mask)
+            # Extend the run in both directions
+            z0 = max(mask.rfind(b'\0', low, z)+1, low)
+            z1 = mask.find(b'\0', z, high)
+            if z1 < 0:
+                z1 = high
+            mask[z0:z1] = b'\0' * (z1-z0)
+            runs.append((x, y, z0, z1))
+            # Seed every run touching this one in the neighbouring columns
+            low = max(z0-extend, low)
+            high = min(z1+extend, high)
+            for dx, dy in neighbours:
+                nx = x+dx
+                ny = y+dy
+                if nx < 0 or nx >= width or ny < 0 or ny >= height:
+                    continue
+                seeds.extend((nx, ny, start) for start, _
+                    in _mask_runs(masks[(nx, ny)], low, high))
+        return runs
+
+    # Set every voxel in the given runs (x, y, z0, z1), as returned by
+    # get_region(), to state. Returns the number of voxels changed.
+    def fill_runs(self, runs, state, undo = True):
+        # Runs of the same length can share a list of states
+        states = {}
+        for n in set(z1-z0 for _, _, z0, z1 in runs):
+            states[n] = [state] * n
+        self.set_region([(x, y, z0, states[z1-z0])
+            for x, y, z0, z1 in runs], undo)
+        return sum(z1-z0 for _, _, z0, z1 in runs)
+
+    # Flood fill the region connected to x, y, z with the given state. See
+    # get_region() for the options. Returns the number of voxels changed.
+    def fill(self, x, y, z, state, undo = True, tolerance = 0,
+        connectivity = 6, plane = None):
+        if not tolerance and self.get(x, y, z) == state:
+            return 0
+        return self.fill_runs(self.get_region(x, y, z, tolerance,
+            connectivity, plane), state, undo)
+
+    # Fill the empty space enclosed by the model with the given state.
+    # Returns the number of voxels changed.
+    def fill_interior(self, state, undo = True):
+        return self.fill_runs(self.get_interior(), state, undo)
 
     # Calculate the actual bounding box of the model in voxel space
     # Consider all animation frames
     def get_bounding_box(self):
-        minx = 999
-        miny = 999
-        minz = 999
-        maxx = -999
-        maxy = -999
-        maxz = -999
-        for data in self._frames:
-            for x in range(self.width):
-                for z in range(self.depth):
-                    for y in range(self.height):
-                        if data[x][y][z] != EMPTY:
-                            if x < minx:
-                                minx = x
-                            if x > maxx:
-                                maxx = x
-                            if y < miny:
-                                miny = y
-                            if y > maxy:
-                                maxy = y
-                            if z < minz:
-                                minz = z
-                            if z > maxz:
-                                maxz = z
+        boxes = [box for box in (bounds.get() for bounds in self._bounds)
+            if box]
+        if not boxes:
+            # As if we had searched and found nothing
+            return 999, 999, 999, -1997, -1997, -1997
+        minx, miny, minz, maxx, maxy, maxz = [f(values) for f, values
+            in zip((min, min, min, max, max, max), zip(*boxes))]
         width = (maxx-minx)+1
         height = (maxy-miny)+1
         depth = (maxz-minz)+1
         return minx, miny, minz, width, height, depth
 
+    # Recount the bounding boxes of all frames
+    def _bounds_rebuild(self):
+        self._bounds = [_Bounds(self.width, self.height, self.depth, frame)
+            for frame in self._frames]
+
     # Resize the voxel space. If no dimensions given, adjust to bounding box.
     # We offset all voxels on all axis by the given amount.
     # Resize all animation frames
     def resize(self, width = None, height = None, depth = None, shift = 0):
         # Reset undo buffer
-        self._undo.clear()
+        self._reset_undo()
         # No dimensions, use bounding box
         mx, my, mz, cwidth, cheight, cdepth = self.get_bounding_box()
         if not width:
@@ -698,88 +1452,382 @@ class VoxelData(object):
         self._depth = depth
         # Rebuild our cache
         self._cache_rebuild()
+        self._bounds_rebuild()
+        self._modified(True)
+        self._edited()
         self.changed = True
 
-    # Rotate voxels in voxel space 90 degrees
-    def rotate_about_axis(self, axis):
+    # Rotate voxels in voxel space 90 degrees, turns times. Rotates all
+    # animation frames.
+    def rotate_about_axis(self, axis, turns = 1):
+        turns %= 4
+        if not turns:
+            return
         # Reset undo buffer
-        self._undo.clear()
+        self._reset_undo()
 
-        if axis == self.Y_AXIS:
-            width = self.depth # note swap
-            height = self.height
-            depth = self.width
-        elif axis == self.X_AXIS:
-            width = self.width
-            height = self.depth
-            depth = self.height
-        elif axis == self.Z_AXIS:
-            width = self.height
-            height = self.width
-            depth = self.depth
+        # Half a turn is a mirror in both of the other axes
+        if turns >= 2:
+            for other in (self.X_AXIS, self.Y_AXIS, self.Z_AXIS):
+                if other != axis:
+                    self._mirror_frames(other)
+        if turns != 2:
+            if axis == self.Y_AXIS:
+                self._frames = [_swap_xz(frame) for frame in self._frames]
+                self._width, self._depth = self._depth, self._width
+                swapped = (0, 2)
+            elif axis == self.X_AXIS:
+                self._frames = [_swap_yz(frame) for frame in self._frames]
+                self._height, self._depth = self._depth, self._height
+                swapped = (1, 2)
+            elif axis == self.Z_AXIS:
+                self._frames = [_swap_xy(frame) for frame in self._frames]
+                self._width, self._height = self._height, self._width
+                swapped = (0, 1)
+            for bounds in self._bounds:
+                bounds.swap(*swapped)
+            # Swapping two axes is a mirror, turn it into a rotation
+            rotated = {self.X_AXIS: self.Y_AXIS, self.Y_AXIS: self.X_AXIS,
+                self.Z_AXIS: self.Y_AXIS}[axis]
+            self._mirror_frames(rotated)
 
-        for i, frame in enumerate(self._frames):
-                    
-            # Create new temporary data structure
-            data = [[[0 for _ in xrange(depth)]
-                for _ in xrange(height)]
-                    for _ in xrange(width)]
-            
-            # Copy data over at new location
-            for tx in xrange(0, self.width):
-                for ty in xrange(0, self.height):
-                    for tz in xrange(0, self.depth):
-                        if axis == self.Y_AXIS:
-                            dx = (-tz)-1
-                            dy = ty
-                            dz = tx
-                        elif axis == self.X_AXIS:
-                            dx = tx
-                            dy = (-tz)-1
-                            dz = ty
-                        elif axis == self.Z_AXIS:
-                            dx = ty
-                            dy = (-tx)-1
-                            dz = tz
-                        data[dx][dy][dz] = frame[tx][ty][tz]
-            self._frames[i] = data
-        
-        self._width = width
-        self._height = height
-        self._depth = depth
-        
         self._data = self._frames[self._current_frame]
         # Rebuild our cache
         self._cache_rebuild()
+        self._modified(True)
+        self._edited()
         self.changed = True
-    
-    # Translate the voxel data.
-    def translate(self, x, y, z, undo = True):
+
+    # Mirror all frames in place along the given axis
+    def _mirror_frames(self, axis):
+        for bounds in self._bounds:
+            bounds.mirror(axis-1)
+        for frame in self._frames:
+            if axis == self.X_AXIS:
+                frame.reverse()
+            elif axis == self.Y_AXIS:
+                for plane in frame:
+                    plane.reverse()
+            elif axis == self.Z_AXIS:
+                for plane in frame:
+                    for column in plane:
+                        column.reverse()
+
+    # Mirror voxels along the given axis. Mirrors all animation frames.
+    def mirror(self, axis):
+        # Reset undo buffer
+        self._reset_undo()
+        self._mirror_frames(axis)
+        # Mirror our cache rather than rebuilding it
+        if self._occupied is None:
+            pass
+        elif axis == self.X_AXIS:
+            self._cache = _Occupancy(self.width, self.height, self.depth,
+                ((self.width-1-x, y, z) for x, y, z in self._cache))
+        elif axis == self.Y_AXIS:
+            self._cache = _Occupancy(self.width, self.height, self.depth,
+                ((x, self.height-1-y, z) for x, y, z in self._cache))
+        elif axis == self.Z_AXIS:
+            self._cache = _Occupancy(self.width, self.height, self.depth,
+                ((x, y, self.depth-1-z) for x, y, z in self._cache))
+        self._modified(True)
+        self._edited()
+        self.changed = True
+
+    # Make the model symmetric along the given axis by replacing the upper
+    # half with a mirror image of the lower half, or the other way around
+    # if from_lower is False. Changes all animation frames.
+    def make_symmetric(self, axis, from_lower = True):
+        # Reset undo buffer
+        self._reset_undo()
+        for frame in self._frames:
+            if axis == self.X_AXIS:
+                _symmetric_list(frame, from_lower, self._copy_data)
+            elif axis == self.Y_AXIS:
+                for plane in frame:
+                    _symmetric_list(plane, from_lower,
+                        lambda rows: [row[:] for row in rows])
+            elif axis == self.Z_AXIS:
+                for plane in frame:
+                    for column in plane:
+                        _symmetric_list(column, from_lower, list)
+        self._cache_rebuild()
+        self._bounds_rebuild()
+        self._modified(True)
+        self._edited()
+        self.changed = True
+
+    # Translate the voxel data. Voxels moved off one side wrap around onto
+    # the other unless wrap is False, in which case they are lost.
+    def translate(self, x, y, z, undo = True, wrap = True):
         # Sanity
         if x == 0 and y == 0 and z == 0:
             return
-        
+
+        # The voxels we are about to lose
+        if not wrap:
+            lost = self._shifted_out(x, y, z)
+
         # Add to undo
-        if undo:
-            self._undo.add(UndoItem(Undo.TRANSLATE, 
-            (-x, -y, -z), (x, y, z)))
-        
-        # Create new temporary data structure
-        data = [[[0 for _ in xrange(self.depth)]
-            for _ in xrange(self.height)]
-                for _ in xrange(self.width)]
-        # Copy data over at new location
-        for tx in xrange(0, self.width):
-            for ty in xrange(0, self.height):
-                for tz in xrange(0, self.depth):
-                    dx = (tx+x) % self.width
-                    dy = (ty+y) % self.height
-                    dz = (tz+z) % self.depth
-                    data[dx][dy][dz] = self._data[tx][ty][tz]
-        self._data = data
+        if undo or self.notify_edit:
+            if wrap:
+                item = UndoItem(Undo.TRANSLATE, (-x, -y, -z), (x, y, z))
+            else:
+                # Undo needs the voxels we are about to lose
+                item = UndoItem(Undo.SHIFT, (-x, -y, -z, lost), (x, y, z))
+            if undo:
+                self._undo.add(item)
+            self._edited(item)
+
+        # Shift our data in place, whole planes, then rows, then columns
+        width = self.width
+        height = self.height
+        depth = self.depth
+        data = self._data
+        _shift_list(data, x, wrap,
+            lambda: [[0] * depth for _ in xrange(height)])
+        for plane in data:
+            _shift_list(plane, y, wrap, lambda: [0] * depth)
+            if z:
+                for column in plane:
+                    _shift_list(column, z, wrap, int)
+        # Move our cache and counts rather than rebuilding them. Once the
+        # voxels shifted off the edge are forgotten, the rest can wrap.
+        cache = self._occupied
+        bounds = self._bounds[self._current_frame]
+        if not wrap:
+            for cx, cy, cz, states in lost:
+                zs = [cz+i for i, state in enumerate(states)
+                    if state != EMPTY]
+                if not zs:
+                    continue
+                bounds.remove(cx, cy, zs)
+                bounds.recount(states, ())
+                if cache is not None:
+                    cache.difference_update([(cx, cy, i) for i in zs])
+        if cache is not None:
+            cache.translate(x, y, z)
+        bounds.translate(x, y, z)
+        self._modified()
+        self.changed = True
+
+    # Return runs of states (x, y, z, states) of the voxels which would be
+    # lost by translating x, y, z without wrapping.
+    def _shifted_out(self, dx, dy, dz):
+        runs = []
+        depth = self.depth
+        for x, plane in enumerate(self._data):
+            for y, column in enumerate(plane):
+                if column.count(EMPTY) == depth:
+                    continue
+                if not (0 <= x+dx < self.width and 0 <= y+dy < self.height):
+                    runs.append((x, y, 0, column[:]))
+                elif dz > 0:
+                    start = max(depth-dz, 0)
+                    runs.append((x, y, start, column[start:]))
+                elif dz < 0:
+                    runs.append((x, y, 0, column[:-dz]))
+        return runs
+
+    # Return the state to store for a colour. For indexed models this is
+    # its palette index plus one, adding the colour to the palette if need
+    # be, or the index of the nearest colour if the palette is full.
+    def _state(self, colour):
+        if self._palette is None or colour == EMPTY:
+            return colour
+        state = self._palette_states.get(colour)
+        if state is None:
+            if len(self._palette) < MAX_PALETTE_SIZE:
+                self._palette.append(colour)
+                state = self._palette_states[colour] = len(self._palette)
+                self._palette_revision = next(_revisions)
+            else:
+                state = min(xrange(len(self._palette)), key = lambda i:
+                    sum((a-b)**2 for a, b in izip(_rgb(colour),
+                    _rgb(self._palette[i])))) + 1
+        return state
+
+    def _states(self, colours):
+        return [self._state(colour) for colour in colours]
+
+    # Return the colour of a stored state
+    def _colour(self, state):
+        if self._palette is None or state == EMPTY:
+            return state
+        return self._palette[state-1]
+
+    def _colours(self, states):
+        if EMPTY in states:
+            return [self._colour(state) for state in states]
+        return map(self._palette.__getitem__, [state-1 for state in states])
+
+    # Return a copy of indexed data in colours
+    def _colour_data(self, data):
+        return [[self._colours(column) for column in plane]
+            for plane in data]
+
+    # Store palette indices rather than colours. Every colour used by any
+    # frame goes into the palette, after the colours of palette if given,
+    # and there must be no more than MAX_PALETTE_SIZE. Clears our undo
+    # history.
+    def to_indexed(self, palette = None):
+        if self._palette is not None:
+            return
         self._frames[self._current_frame] = self._data
-        # Rebuild our cache
-        self._cache_rebuild()
+        palette = list(palette or [])
+        used = set()
+        for frame in self._frames:
+            for plane in frame:
+                for column in plane:
+                    used.update(column)
+        used.difference_update(palette + [EMPTY])
+        palette += sorted(used)
+        if len(palette) > MAX_PALETTE_SIZE:
+            raise ValueError("The model has %i colours, a palette can only "
+                "have %i." % (len(palette), MAX_PALETTE_SIZE))
+        states = dict((colour, i+1) for i, colour
+            in reversed(list(enumerate(palette))))
+        states[EMPTY] = EMPTY
+        self._convert_frames(states.__getitem__)
+        del states[EMPTY]
+        self._palette = palette
+        self._palette_states = states
+        self._converted()
+
+    # Store colours rather than palette indices. Clears our undo history.
+    def to_rgb(self):
+        if self._palette is None:
+            return
+        self._frames[self._current_frame] = self._data
+        self._convert_frames(self._colour)
+        self._palette = None
+        self._palette_states = None
+        self._converted()
+
+    # Replace every state of every frame with function(state)
+    def _convert_frames(self, function):
+        for frame in self._frames:
+            for plane in frame:
+                for y, column in enumerate(plane):
+                    plane[y] = map(function, column)
+
+    # After changing between colours and indices
+    def _converted(self):
+        self._bounds_rebuild()
+        self._reset_undo()
+        self._palette_revision = next(_revisions)
+        # Meshes now need building the other way
+        self._modified(True)
+        self._edited()
+        self.changed = True
+
+    # Change colour index of an indexed model's palette, recolouring every
+    # voxel of that colour in every frame. Frame revisions don't change,
+    # only our palette_revision.
+    def set_palette_colour(self, index, colour, undo = True):
+        if hasattr(colour, "getRgb"):
+            c = colour.getRgb()
+            colour = c[0]<<24 | c[1]<<16 | c[2]<<8 | 0xff
+        old = self._palette[index]
+        if colour == old:
+            return
+        item = UndoItem(Undo.PALETTE, (index, old), (index, colour))
+        if undo:
+            self._undo.add(item)
+        self._set_palette_colour(index, colour)
+
+    def _set_palette_colour(self, index, colour):
+        self._palette[index] = colour
+        # Other entries may share a colour, so look states up again
+        self._palette_states = dict((c, i+1) for i, c
+            in reversed(list(enumerate(self._palette))))
+        self._palette_revision = next(_revisions)
+        self._edited()
+        self.changed = True
+
+    # Replace every voxel of colour old with colour new, in every frame.
+    # Undo is per frame, so each frame gets a single undo step of its own and
+    # undoing in one frame never touches another. Returns the number of
+    # voxels changed.
+    def replace_colour(self, old, new, undo = True):
+        # Convert QT Colors, like set()
+        colours = []
+        for colour in (old, new):
+            if hasattr(colour, "getRgb"):
+                c = colour.getRgb()
+                colour = c[0]<<24 | c[1]<<16 | c[2]<<8 | 0xff
+            colours.append(colour)
+        old, new = colours
+        if old == EMPTY or new == EMPTY:
+            raise ValueError("Can only replace one colour with another.")
+        if old == new:
+            return 0
+        # The states to replace, more than one if palette entries are shared
+        if self._palette is None:
+            olds = set([old])
+        else:
+            olds = set(i+1 for i, c in enumerate(self._palette) if c == old)
+        if all(olds.isdisjoint(bounds.states) for bounds in self._bounds):
+            return 0
+        new = self._state(new)
+        olds.discard(new)
+        changed = 0
+        for frame in xrange(self._frame_count):
+            if frame == self._current_frame:
+                data = self._data
+            else:
+                data = self._frames[frame]
+            counts = self._bounds[frame].states
+            remaining = sum(counts.get(state, 0) for state in olds)
+            if not remaining:
+                continue
+            changed += remaining
+            # (x, y, z, expected state, state) of each voxel to recolour
+            voxels = []
+            # Our counts tell us when we have found them all
+            for x, plane in enumerate(data):
+                for y, column in enumerate(plane):
+                    if olds.isdisjoint(column):
+                        continue
+                    for z, state in enumerate(column):
+                        if state in olds:
+                            voxels.append((x, y, z, state, new))
+                            remaining -= 1
+                    if not remaining:
+                        break
+                if not remaining:
+                    break
+            if undo:
+                restore = [(x, y, z, state, previous)
+                    for x, y, z, previous, state in voxels]
+                self._undo.add(UndoItem(Undo.REPLACE, restore, voxels), frame)
+            self._recolour(frame, voxels)
+        return changed
+
+    # Recolour voxels of a frame, voxels being a list of (x, y, z, expected
+    # state, state). Voxels no longer in their expected state have been
+    # edited since, so are left alone.
+    def _recolour(self, frame, voxels):
+        if frame == self._current_frame:
+            data = self._data
+        else:
+            data = self._frames[frame]
+        voxels = [(x, y, z, state) for x, y, z, expected, state in voxels
+            if data[x][y][z] == expected]
+        if not voxels:
+            return
+        if frame == self._current_frame:
+            self._set_runs([(x, y, z, [state]) for x, y, z, state in voxels],
+                False)
+            return
+        # Only the colours of other frames change, not which voxels are
+        # occupied, so only their colour counts need updating
+        bounds = self._bounds[frame]
+        for x, y, z, state in voxels:
+            bounds.recount((data[x][y][z],), (state,))
+            data[x][y][z] = state
+        self._revisions[frame] = next(_revisions)
+        self._edited()
         self.changed = True
 
     # Undo previous operation
@@ -788,11 +1836,25 @@ class VoxelData(object):
         # Voxel edit
         if op and op.operation == Undo.SET_VOXEL:
             data = op.olddata
-            self.set(data[0], data[1], data[2], data[3], False)
+            self._set(data[0], data[1], data[2], data[3], False)
         # Translation
         elif op and op.operation == Undo.TRANSLATE:
             data = op.olddata
             self.translate(data[0], data[1], data[2], False)
+        # Translation without wrapping, then restore what was lost
+        elif op and op.operation == Undo.SHIFT:
+            data = op.olddata
+            self.translate(data[0], data[1], data[2], False, False)
+            self._set_runs(data[3], False)
+        # Bulk edit
+        elif op and op.operation == Undo.SET_REGION:
+            self._set_runs(op.olddata, False)
+        # Palette change
+        elif op and op.operation == Undo.PALETTE:
+            self._set_palette_colour(op.olddata[0], op.olddata[1])
+        # Colour replaced
+        elif op and op.operation == Undo.REPLACE:
+            self._recolour(self._current_frame, op.olddata)
             
     # Redo an undone operation
     def redo(self):
@@ -800,11 +1862,23 @@ class VoxelData(object):
         # Voxel edit
         if op and op.operation == Undo.SET_VOXEL:
             data = op.newdata
-            self.set(data[0], data[1], data[2], data[3], False)
+            self._set(data[0], data[1], data[2], data[3], False)
         # Translation
         elif op and op.operation == Undo.TRANSLATE:
             data = op.newdata
             self.translate(data[0], data[1], data[2], False)
+        elif op and op.operation == Undo.SHIFT:
+            data = op.newdata
+            self.translate(data[0], data[1], data[2], False, False)
+        # Bulk edit
+        elif op and op.operation == Undo.SET_REGION:
+            self._set_runs(op.newdata, False)
+        # Palette change
+        elif op and op.operation == Undo.PALETTE:
+            self._set_palette_colour(op.newdata[0], op.newdata[1])
+        # Colour replaced
+        elif op and op.operation == Undo.REPLACE:
+            self._recolour(self._current_frame, op.newdata)
 
     # Enable/Disable undo buffer
     def disable_undo(self):
@@ -173,6 +173,7 @@ class VoxelGrid(object):
             return None
 
     def update_grid_plane(self, voxels):
+        self._voxels = voxels
         for plane in self._planes.itervalues():
             plane.voxels = voxels
             if plane.plane == GridPlanes.Z:
@@ -17,6 +17,7 @@
 
 import math
 import array
+import struct
 import sys
 from PySide import QtCore, QtGui, QtOpenGL
 from OpenGL.GL import *
@@ -26,6 +27,8 @@ from euclid import LineSegment3, Plane, Point3, Vector3
 from tool import EventData, MouseButtons, KeyModifiers
 from voxel_grid import GridPlanes
 from voxel_grid import VoxelGrid
+from profiler import profiler
+from mesh import MeshCache, MeshBaker
 import time
 
 class GLWidget(QtOpenGL.QGLWidget):
@@ -40,6 +43,9 @@ class GLWidget(QtOpenGL.QGLWidget):
     DRAG_END = 2
     DRAG = 3
 
+    # Size of the offscreen tiles large images are rendered in, in pixels
+    TILE_SIZE = 512
+
     @property
     def axis_grids(self):
         return self._display_axis_grids
@@ -83,11 +89,58 @@ class GLWidget(QtOpenGL.QGLWidget):
     def grids(self):
         return self._grids
 
+    # Runs of voxels (x, y, z0, z1) to outline, or None
+    @property
+    def preview(self):
+        return self._preview
+    @preview.setter
+    def preview(self, value):
+        self._preview = value
+        self._preview_vertices, self._num_preview_vertices = (
+            self._build_outline(value))
+        self.updateGL()
+
+    # Runs of selected voxels (x, y, z0, z1) to outline, or None
+    @property
+    def selection(self):
+        return self._selection
+    @selection.setter
+    def selection(self, value):
+        self._selection = value
+        self._selection_vertices, self._num_selection_vertices = (
+            self._build_outline(value))
+        self.updateGL()
+
+    @property
+    def performance_overlay(self):
+        return self._performance_overlay
+    @performance_overlay.setter
+    def performance_overlay(self, value):
+        self._performance_overlay = value
+        self.updateGL()
+
+    # Number of frames either side of the current one to show as ghosts
+    @property
+    def onion_skin(self):
+        return self._onion_skin
+    @onion_skin.setter
+    def onion_skin(self, value):
+        self._onion_skin = value
+        self.build_mesh()
+        self.updateGL()
+
+    # Meshes of animation frames, see mesh.py
+    @property
+    def mesh_cache(self):
+        return self._mesh_cache
+
     # Our signals
     mouse_click_event = QtCore.Signal()
     start_drag_event = QtCore.Signal()
     drag_event = QtCore.Signal()
     end_drag_event = QtCore.Signal()
+    # Emitted whenever we show new voxel data, edited or another frame
+    mesh_changed = QtCore.Signal()
 
     def __init__(self, parent = None):
         glformat = QtOpenGL.QGLFormat()
@@ -103,6 +156,22 @@ class GLWidget(QtOpenGL.QGLWidget):
         self._display_wireframe = False
         self._voxel_colour = QtGui.QColor.fromHsvF(0, 1.0, 1.0)
         self._voxeledges = True
+        self._performance_overlay = False
+        self._num_vertices = 0
+        self._preview = None
+        self._num_preview_vertices = 0
+        self._selection = None
+        self._num_selection_vertices = 0
+        # Meshes of the frames we have displayed, or baked ready to display
+        self._mesh_cache = MeshCache()
+        self._baker = MeshBaker(self._mesh_cache)
+        # Onion skinning, ghosts are (mesh, colour)
+        self._onion_skin = 0
+        self._ghosts = []
+        # Texture of the palette of indexed models, see _bind_palette()
+        self._palette_texture = None
+        self._palette_revision = None
+        self._palette_size = 1
         # Mouse position
         self._mouse = QtCore.QPoint()
         self._mouse_absolute = QtCore.QPoint()
@@ -139,6 +208,11 @@ class GLWidget(QtOpenGL.QGLWidget):
         self.voxels.clear()
         self.refresh()
 
+    # Replace the model we are displaying
+    def set_voxels(self, voxels):
+        self.voxels = voxels
+        self.refresh()
+
     # Force an update of our internal data
     def refresh(self):
         self.build_mesh()
@@ -180,7 +254,67 @@ class GLWidget(QtOpenGL.QGLWidget):
 
     # Render our scene
     def paintGL(self):
-        self.qglClearColor(self._background_colour)
+        with profiler.span("paintGL"):
+            self._paint()
+        if self._performance_overlay:
+            self._paint_overlay()
+
+    def _paint(self):
+        self._draw_model(self._mesh)
+
+        # Draw ghosts of the neighbouring frames over the top. Anything
+        # which hasn't changed is hidden by the current frame.
+        if self._ghosts:
+            glDisable(GL_TEXTURE_2D)
+            glEnable(GL_BLEND)
+            glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+            glDepthMask(GL_FALSE)
+            glEnableClientState(GL_VERTEX_ARRAY)
+            glEnableClientState(GL_NORMAL_ARRAY)
+            for mesh, colour in self._ghosts:
+                glColor4f(*colour)
+                glVertexPointer(3, GL_FLOAT, 0, mesh.vertices)
+                glNormalPointer(GL_FLOAT, 0, mesh.normals)
+                glDrawArrays(GL_TRIANGLES, 0, mesh.count)
+            glDisableClientState(GL_VERTEX_ARRAY)
+            glDisableClientState(GL_NORMAL_ARRAY)
+            glDepthMask(GL_TRUE)
+            glDisable(GL_BLEND)
+            glEnable(GL_TEXTURE_2D)
+
+        # draw the grids
+        if self._display_axis_grids:
+            self.grids.paint()
+
+        # Outline the selection and whatever a tool is previewing
+        glDisable(GL_LIGHTING)
+        glDisable(GL_TEXTURE_2D)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        if self._num_selection_vertices:
+            self.qglColor(QtGui.QColor("yellow"))
+            glVertexPointer(3, GL_FLOAT, 0, self._selection_vertices)
+            glDrawArrays(GL_LINES, 0, self._num_selection_vertices)
+        if self._num_preview_vertices:
+            self.qglColor(self._voxel_colour)
+            glVertexPointer(3, GL_FLOAT, 0, self._preview_vertices)
+            glDrawArrays(GL_LINES, 0, self._num_preview_vertices)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glEnable(GL_LIGHTING)
+        glEnable(GL_TEXTURE_2D)
+
+        # Default back to filled rendering
+        glPolygonMode(GL_FRONT, GL_FILL)
+
+        # Wait for the draw to really finish if we're displaying timings
+        if self._performance_overlay:
+            glFinish()
+
+    # Clear the view, to the given colour or our background, and draw a
+    # mesh from our camera
+    def _draw_model(self, mesh, background = None):
+        if background is None:
+            background = self._background_colour
+        self.qglClearColor(background)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         glLoadIdentity()
         glTranslatef(self._translate_x, self._translate_y, self._translate_z)
@@ -202,16 +336,43 @@ class GLWidget(QtOpenGL.QGLWidget):
         glBindTexture(GL_TEXTURE_2D, self._texture)
 
         # Describe our buffers
-        glVertexPointer(3, GL_FLOAT, 0, self._vertices)
+        glVertexPointer(3, GL_FLOAT, 0, mesh.vertices)
         if self._voxeledges:
-            glTexCoordPointer(2, GL_FLOAT, 0, self._uvs)
+            glTexCoordPointer(2, GL_FLOAT, 0, mesh.uvs)
         else:
             glDisable(GL_TEXTURE_2D)
-        glColorPointer(3, GL_UNSIGNED_BYTE, 0, self._colours)
-        glNormalPointer(GL_FLOAT, 0, self._normals)
+        glColorPointer(3, GL_UNSIGNED_BYTE, 0, mesh.colours)
+        glNormalPointer(GL_FLOAT, 0, mesh.normals)
+
+        # Indexed models look their colours up in the palette, on a second
+        # texture unit so voxel edges still work
+        indexed = mesh.indices and self.voxels.indexed
+        if indexed:
+            glActiveTexture(GL_TEXTURE1)
+            glEnable(GL_TEXTURE_1D)
+            self._bind_palette()
+            glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
+            # Index i+1 to the centre of texel i
+            glMatrixMode(GL_TEXTURE)
+            glLoadIdentity()
+            glScalef(1.0 / self._palette_size, 1.0, 1.0)
+            glTranslatef(-0.5, 0.0, 0.0)
+            glMatrixMode(GL_MODELVIEW)
+            glClientActiveTexture(GL_TEXTURE1)
+            glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+            glTexCoordPointer(1, GL_FLOAT, 0, mesh.indices)
 
         # Render the buffers
-        glDrawArrays(GL_TRIANGLES, 0, self._num_vertices)
+        glDrawArrays(GL_TRIANGLES, 0, mesh.count)
+
+        if indexed:
+            glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+            glClientActiveTexture(GL_TEXTURE0)
+            glMatrixMode(GL_TEXTURE)
+            glLoadIdentity()
+            glMatrixMode(GL_MODELVIEW)
+            glDisable(GL_TEXTURE_1D)
+            glActiveTexture(GL_TEXTURE0)
 
         glDisableClientState(GL_VERTEX_ARRAY)
         glDisableClientState(GL_TEXTURE_COORD_ARRAY)
@@ -221,12 +382,129 @@ class GLWidget(QtOpenGL.QGLWidget):
         if not self._voxeledges:
             glEnable(GL_TEXTURE_2D)
 
-        # draw the grids
-        if self._display_axis_grids:
-            self.grids.paint()
-
-        # Default back to filled rendering
-        glPolygonMode(GL_FRONT, GL_FILL)
+    # Bind the palette of our indexed model as a 1D texture, uploading it
+    # if it has changed since we last did. Recolouring a model only costs
+    # this upload, its meshes stay the same.
+    def _bind_palette(self):
+        if self._palette_texture is None:
+            self._palette_texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_1D, self._palette_texture)
+        if self._palette_revision == self.voxels.palette_revision:
+            return
+        self._palette_revision = self.voxels.palette_revision
+        palette = self.voxels.palette
+        # Texture sizes must be a power of two
+        size = 1
+        while size < len(palette):
+            size *= 2
+        self._palette_size = size
+        palette += (0,) * (size - len(palette))
+        glTexParameteri(GL_TEXTURE_1D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_1D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_1D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexImage1D(GL_TEXTURE_1D, 0, GL_RGBA, size, 0, GL_RGBA,
+            GL_UNSIGNED_BYTE, struct.pack(">%iI" % size, *palette))
+
+    # Render animation frames, all of them if frames is None, offscreen at
+    # the given size from our camera. Returns a QImage of each frame.
+    def render_frames(self, width, height, frames = None):
+        if frames is None:
+            frames = xrange(self.voxels.get_frame_count())
+        self.makeCurrent()
+        target = QtOpenGL.QGLFramebufferObject(width, height,
+            QtOpenGL.QGLFramebufferObject.Depth)
+        if not target.isValid():
+            raise Exception("Unable to render offscreen.")
+        images = []
+        size = (self._width, self._height)
+        target.bind()
+        try:
+            self.resizeGL(width, height)
+            for frame in frames:
+                with profiler.span("render_frame"):
+                    self._draw_model(self._mesh_cache.mesh(self.voxels,
+                        frame))
+                    glPolygonMode(GL_FRONT, GL_FILL)
+                    images.append(target.toImage())
+        finally:
+            target.release()
+            self.resizeGL(*size)
+        return images
+
+    # Render the current frame from our camera at any size, a tile at a
+    # time, each tile narrowing our projection to its part of the view. With
+    # supersample > 1 each tile is rendered that many times larger in each
+    # direction and scaled down. Yields each band of rows of the image as a
+    # QImage, top first, so the whole image is never held at once.
+    def render_tiles(self, width, height, supersample = 1,
+        transparent = False):
+        # Tiles must scale down to whole pixels
+        tile = max(1, self.TILE_SIZE // supersample) * supersample
+        full_width = width * supersample
+        full_height = height * supersample
+        background = QtGui.QColor(self._background_colour)
+        if transparent:
+            background.setAlpha(0)
+        self.makeCurrent()
+        target = QtOpenGL.QGLFramebufferObject(tile, tile,
+            QtOpenGL.QGLFramebufferObject.Depth)
+        if not target.isValid():
+            raise Exception("Unable to render offscreen.")
+        size = (self._width, self._height)
+        # Our projection, as perspective() would set it for the whole view
+        top = math.tan(45.0 / 360.0 * math.pi) * 0.1
+        right = top * full_width / full_height
+        try:
+            for y in xrange(0, full_height, tile):
+                self.makeCurrent()
+                rows = min(tile, full_height - y)
+                band = QtGui.QImage(width, rows // supersample,
+                    QtGui.QImage.Format_ARGB32_Premultiplied)
+                painter = QtGui.QPainter(band)
+                for x in xrange(0, full_width, tile):
+                    columns = min(tile, full_width - x)
+                    with profiler.span("render_tile"):
+                        target.bind()
+                        glViewport(0, 0, columns, rows)
+                        glMatrixMode(GL_PROJECTION)
+                        glLoadIdentity()
+                        glFrustum(-right + 2 * right * x / full_width,
+                            -right + 2 * right * (x + columns) / full_width,
+                            top - 2 * top * (y + rows) / full_height,
+                            top - 2 * top * y / full_height, 0.1, 300)
+                        glMatrixMode(GL_MODELVIEW)
+                        self._draw_model(self._mesh, background)
+                        glPolygonMode(GL_FRONT, GL_FILL)
+                        target.release()
+                        # The tile is at the bottom left of the framebuffer
+                        image = target.toImage().copy(0, tile - rows,
+                            columns, rows)
+                    if supersample > 1:
+                        image = image.scaled(columns // supersample,
+                            rows // supersample,
+                            QtCore.Qt.IgnoreAspectRatio,
+                            QtCore.Qt.SmoothTransformation)
+                    painter.drawImage(x // supersample, 0, image)
+                painter.end()
+                # We may be redrawn while the band is used
+                self.resizeGL(*size)
+                yield band
+        finally:
+            target.release()
+            self.resizeGL(*size)
+
+    # Render our timings over the scene
+    def _paint_overlay(self):
+        glDisable(GL_LIGHTING)
+        glDisable(GL_TEXTURE_2D)
+        self.qglColor(QtGui.QColor("black"))
+        text = ("Mesh: {0:.1f}ms  Triangles: {1}  Draw: {2:.1f}ms  "
+            "Pick: {3:.1f}ms".format(profiler.last("build_mesh"),
+            self._num_vertices // 3, profiler.last("paintGL"),
+            profiler.last("pick")))
+        self.renderText(8, 16, text)
+        glEnable(GL_LIGHTING)
+        glEnable(GL_TEXTURE_2D)
 
     # Window is resizing
     def resizeGL(self, width, height):
@@ -293,15 +571,66 @@ class GLWidget(QtOpenGL.QGLWidget):
 
     # Build a mesh from our current voxel data
     def build_mesh(self):
-        # Grab the voxel vertices
-        (self._vertices, self._colours, self._normals,
-         self._colour_ids, self._uvs) = self.voxels.get_vertices()
-        self._num_vertices = len(self._vertices) // 3
-        self._vertices = array.array("f", self._vertices).tostring()
-        self._colours = array.array("B", self._colours).tostring()
-        self._colour_ids = array.array("B", self._colour_ids).tostring()
-        self._normals = array.array("f", self._normals).tostring()
-        self._uvs = array.array("f", self._uvs).tostring()
+        with profiler.span("build_mesh"):
+            self._build_mesh()
+        self.mesh_changed.emit()
+
+    def _build_mesh(self):
+        # Use the cached mesh of this frame if it hasn't changed
+        mesh = self._mesh_cache.mesh(self.voxels)
+        self._mesh = mesh
+        self._num_vertices = mesh.count
+        self._vertices = mesh.vertices
+        self._colours = mesh.colours
+        self._colour_ids = mesh.colour_ids
+        self._normals = mesh.normals
+        self._uvs = mesh.uvs
+        self._build_ghosts()
+
+    # Find the meshes of the frames around this one, for onion skinning.
+    # They come from the mesh cache so are only rebuilt when their frames
+    # change.
+    def _build_ghosts(self):
+        self._ghosts = []
+        count = self.voxels.get_frame_count()
+        current = self.voxels.get_frame_number()
+        shown = set([current])
+        for distance in xrange(1, self._onion_skin+1):
+            # Fade with distance, earlier frames red, later frames green
+            alpha = 0.4 / distance
+            for frame, colour in (
+                ((current - distance) % count, (1.0, 0.2, 0.2, alpha)),
+                ((current + distance) % count, (0.2, 1.0, 0.2, alpha))):
+                if frame in shown:
+                    continue
+                shown.add(frame)
+                mesh = self._mesh_cache.mesh(self.voxels, frame)
+                if mesh.count:
+                    self._ghosts.append((mesh, colour))
+
+    # Build the meshes of all animation frames in the background, so they
+    # are ready to play
+    def bake_frames(self):
+        self._baker.bake(self.voxels)
+
+    def cancel_bake(self):
+        self._baker.cancel()
+
+    # Build an outline of runs of voxels, one box per run. Returns the
+    # vertices and their count.
+    def _build_outline(self, runs):
+        vertices = []
+        for x, y, z0, z1 in runs or ():
+            x0, y0, z0 = self.voxels.voxel_to_world(x, y, z0)
+            x1, y1, z1 = self.voxels.voxel_to_world(x+1, y+1, z1)
+            vertices += (
+                x0, y0, z0, x1, y0, z0,  x0, y1, z0, x1, y1, z0,
+                x0, y0, z1, x1, y0, z1,  x0, y1, z1, x1, y1, z1,
+                x0, y0, z0, x0, y1, z0,  x1, y0, z0, x1, y1, z0,
+                x0, y0, z1, x0, y1, z1,  x1, y0, z1, x1, y1, z1,
+                x0, y0, z0, x0, y0, z1,  x1, y0, z0, x1, y0, z1,
+                x0, y1, z0, x0, y1, z1,  x1, y1, z0, x1, y1, z1)
+        return array.array("f", vertices).tostring(), len(vertices) // 3
 
     # Build axis grids
     def build_grids(self):
@@ -428,10 +757,11 @@ class GLWidget(QtOpenGL.QGLWidget):
     def window_to_voxel(self, x, y):
         # We must invert y coordinates
         y = self._height - y
-        # Render our scene (to the back buffer) using colour IDs
-        self.paintID()
-        # Grab the colour / ID at the coordinates
-        c = glReadPixels(x, y, 1, 1, GL_RGB, GL_UNSIGNED_BYTE)
+        with profiler.span("pick"):
+            # Render our scene (to the back buffer) using colour IDs
+            self.paintID()
+            # Grab the colour / ID at the coordinates
+            c = glReadPixels(x, y, 1, 1, GL_RGB, GL_UNSIGNED_BYTE)
         if type(c) is str:
             # This is what MESA on Linux seems to return
             # Grab the colour (ID) which was clicked on
@@ -22,6 +22,9 @@ from mainwindow import MainWindow
 def main():
     # create application
     app = QtGui.QApplication(sys.argv)
+    # Our data, such as autosaves, is stored under these names
+    app.setOrganizationName("Zoxel")
+    app.setApplicationName("Zoxel")
 
     # create mainWindow
     mainwindow = MainWindow()
@@ -33,6 +36,9 @@ def main():
     # Load system plugins
     mainwindow.load_plugins()
 
+    # Recover from any crash and start autosaving
+    mainwindow.start_autosave()
+
     # run main loop
     sys.exit(app.exec_())
 
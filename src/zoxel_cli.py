@@ -0,0 +1,240 @@
+# zoxel_cli.py
+# Zoxel - Headless batch file conversion
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Converts models between any of the formats our file handlers support,
+# without creating a QApplication or any widgets. e.g.
+#
+#   python zoxel_cli.py --to obj --output build/models models/*.qb
+#
+# Directories given as input are searched for files we can load, and with
+# --output their subdirectories are recreated there. Files are converted in
+# parallel by a pool of worker processes.
+
+import os
+import sys
+import argparse
+import fnmatch
+import multiprocessing
+from plugin_api import PluginManager
+from voxel import VoxelData
+
+# Stands in for the main window, as far as file handlers are concerned
+class Display(object):
+    def __init__(self):
+        self.voxels = VoxelData()
+
+class HeadlessHost(object):
+
+    def __init__(self):
+        self.display = Display()
+        self.handlers = []
+        self.state = {}
+
+    def register_file_handler(self, handler):
+        self.handlers.append(handler)
+
+    # No tools without a GUI
+    def register_tool(self, tool, activate = False):
+        pass
+
+    def get_setting(self, name):
+        return self.state.get(name)
+
+    def set_setting(self, name, value):
+        self.state[name] = value
+
+    # Return the handler for filename which has the given method (load or
+    # save), or None.
+    def find_handler(self, filename, method):
+        name = os.path.basename(filename).lower()
+        for handler in self.handlers:
+            if (hasattr(handler, method)
+                and fnmatch.fnmatch(name, handler.filetype.lower())):
+                return handler
+        return None
+
+    # Load filename into a new model and return it
+    def load(self, filename):
+        handler = self.find_handler(filename, "load")
+        if not handler:
+            raise Exception("No importer for %s" % filename)
+        voxels = VoxelData()
+        voxels.disable_undo()
+        self.display.voxels = voxels
+        handler.load(filename)
+        voxels.enable_undo()
+        voxels.saved()
+        return voxels
+
+    # Save the model to filename
+    def save(self, voxels, filename):
+        handler = self.find_handler(filename, "save")
+        if not handler:
+            raise Exception("No exporter for %s" % filename)
+        self.display.voxels = voxels
+        handler.save(filename)
+        voxels.saved()
+
+# Create our host and load the file handlers, once per process
+_host = None
+def get_host():
+    global _host
+    if _host is None:
+        _host = HeadlessHost()
+        PluginManager.host = _host
+        import handler_loader
+    return _host
+
+# Convert a single file, returns (source, target, error message or None)
+def convert(job):
+    source, target, options = job
+    try:
+        host = get_host()
+        for handler in host.handlers:
+            if hasattr(handler, "vertex_colours"):
+                handler.vertex_colours = options.get("vertex_colours", False)
+            if hasattr(handler, "delta_frames"):
+                handler.delta_frames = options.get("delta_frames", False)
+        voxels = host.load(source)
+        host.save(voxels, target)
+    except Exception as Ex:
+        return source, target, str(Ex) or Ex.__class__.__name__
+    return source, target, None
+
+# Expand directories into the files within them we know how to load.
+# Returns a list of (filename, path relative to the input it was found in).
+def find_sources(paths):
+    host = get_host()
+    sources = []
+    for path in paths:
+        if not os.path.isdir(path):
+            sources.append((path, os.path.basename(path)))
+            continue
+        for root, _, files in os.walk(path):
+            for name in sorted(files):
+                filename = os.path.join(root, name)
+                if host.find_handler(filename, "load"):
+                    sources.append((filename,
+                        os.path.relpath(filename, path)))
+    return sources
+
+# Return a key comparing the files two paths refer to
+def _file_key(filename):
+    return os.path.normcase(os.path.abspath(filename))
+
+# Find the sources in paths, see find_sources(), and return a list of
+# (source, target) where target is the source renamed with extension. The
+# target is next to its source, or if output is given, at the same place
+# below output as the source is below its input directory. Sources which
+# would share a target keep their own extension too, e.g. model.qb.obj.
+# Raises ValueError if two sources still share a target.
+def find_targets(paths, extension, output = None):
+    sources = []
+    seen = set()
+    for source, relative in find_sources(paths):
+        # The same file may be found through more than one input
+        if _file_key(source) not in seen:
+            seen.add(_file_key(source))
+            sources.append((source, relative))
+    def target(source, relative, keep_extension):
+        if output:
+            directory = os.path.join(output, os.path.dirname(relative))
+        else:
+            directory = os.path.dirname(source)
+        name = os.path.basename(source)
+        if not keep_extension:
+            name = os.path.splitext(name)[0]
+        return os.path.join(directory, name + extension)
+    def duplicates(targets):
+        counts = {}
+        for filename in targets:
+            key = _file_key(filename)
+            counts[key] = counts.get(key, 0) + 1
+        return [counts[_file_key(filename)] > 1 for filename in targets]
+    targets = [target(source, relative, False)
+        for source, relative in sources]
+    targets = [target(source, relative, True) if shared else filename
+        for (source, relative), filename, shared
+        in zip(sources, targets, duplicates(targets))]
+    shared = [source for (source, _), duplicate
+        in zip(sources, duplicates(targets)) if duplicate]
+    if shared:
+        raise ValueError("these inputs would be written to the same "
+            "files: %s" % ", ".join(shared))
+    return [(source, filename) for (source, _), filename
+        in zip(sources, targets)]
+
+# Create the directories of the given files which don't exist yet
+def make_directories(filenames):
+    for directory in set(os.path.dirname(f) for f in filenames):
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description = "Convert voxel models between file formats.")
+    parser.add_argument("inputs", nargs = "+", metavar = "INPUT",
+        help = "files or directories to convert")
+    parser.add_argument("-t", "--to", required = True, metavar = "EXT",
+        help = "extension of the format to convert to, e.g. obj")
+    parser.add_argument("-o", "--output", metavar = "DIR",
+        help = "directory to write to (default: next to each input)")
+    parser.add_argument("-j", "--jobs", type = int, default = None,
+        help = "number of worker processes (default: one per CPU)")
+    parser.add_argument("--vertex-colours", action = "store_true",
+        help = "write vertex colours where the format supports them")
+    parser.add_argument("--delta-frames", action = "store_true",
+        help = "store animation frames as changes where the format "
+            "supports them")
+    args = parser.parse_args(argv)
+
+    extension = "." + args.to.lstrip(".")
+    if not get_host().find_handler("model" + extension, "save"):
+        parser.error("no exporter for %s files" % extension)
+
+    options = {"vertex_colours": args.vertex_colours,
+        "delta_frames": args.delta_frames}
+    try:
+        targets = find_targets(args.inputs, extension, args.output)
+    except ValueError as Ex:
+        parser.error(str(Ex))
+    jobs = [(source, target, options) for source, target in targets]
+    make_directories(target for _, target, _ in jobs)
+
+    failures = 0
+    pool = None
+    if args.jobs == 1 or len(jobs) < 2:
+        results = (convert(job) for job in jobs)
+    else:
+        pool = multiprocessing.Pool(args.jobs)
+        results = pool.imap_unordered(convert, jobs)
+    for source, target, error in results:
+        if error:
+            failures += 1
+            sys.stderr.write("%s: %s\n" % (source, error))
+        else:
+            print "%s -> %s" % (source, target)
+    if pool:
+        pool.close()
+        pool.join()
+    if failures:
+        sys.stderr.write("%i of %i conversions failed\n"
+            % (failures, len(jobs)))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# zoxel_sprites.py
+# Zoxel - Headless sprite sheet rendering
+# Copyright (c) 2014, Graham R King
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Renders every frame of each model from several angles into a sprite sheet,
+# name.png, and its frame map, name.json. e.g.
+#
+#   python zoxel_sprites.py --angles 8 --output build/sprites models
+#
+# Like zoxel_cli.py, directories are searched for files we can load, and
+# models are rendered in parallel by a pool of worker processes.
+
+import os
+import sys
+import json
+import argparse
+import multiprocessing
+from zoxel_cli import get_host, find_targets, make_directories
+import sprites
+
+# Render the sprite sheet of a single model, returns (source, target, error
+# message or None)
+def render(job):
+    source, target, options = job
+    try:
+        voxels = get_host().load(source)
+        name = os.path.splitext(os.path.basename(target))[0]
+        sheet, frame_map = sprites.build_sheet(voxels, name,
+            os.path.basename(target), **options)
+        if not sheet.save(target, "PNG"):
+            raise Exception("Unable to write %s" % target)
+        with open(os.path.splitext(target)[0] + ".json", "wt") as f:
+            json.dump(frame_map, f, indent = 1, sort_keys = True)
+    except Exception as Ex:
+        return source, target, str(Ex) or Ex.__class__.__name__
+    return source, target, None
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description = "Render voxel models into sprite sheets.")
+    parser.add_argument("inputs", nargs = "+", metavar = "INPUT",
+        help = "files or directories to render")
+    parser.add_argument("-o", "--output", metavar = "DIR",
+        help = "directory to write to (default: next to each input)")
+    parser.add_argument("-j", "--jobs", type = int, default = None,
+        help = "number of worker processes (default: one per CPU)")
+    parser.add_argument("-a", "--angles", type = int,
+        default = sprites.DEFAULT_ANGLES,
+        help = "number of camera angles around each model "
+            "(default: %(default)s)")
+    parser.add_argument("-p", "--pitch", type = float,
+        default = sprites.DEFAULT_PITCH,
+        help = "degrees the camera looks down on the model "
+            "(default: %(default)s)")
+    parser.add_argument("-s", "--scale", type = int,
+        default = sprites.DEFAULT_SCALE,
+        help = "pixels per voxel (default: %(default)s)")
+    args = parser.parse_args(argv)
+    if args.angles < 1 or args.scale < 1:
+        parser.error("angles and scale must be at least 1")
+
+    options = {"angles": args.angles, "pitch": args.pitch,
+        "scale": args.scale}
+    # The .json is named after the .png, so they can't clash either
+    try:
+        targets = find_targets(args.inputs, ".png", args.output)
+    except ValueError as Ex:
+        parser.error(str(Ex))
+    jobs = [(source, target, options) for source, target in targets]
+    make_directories(target for _, target, _ in jobs)
+
+    failures = 0
+    pool = None
+    if args.jobs == 1 or len(jobs) < 2:
+        results = (render(job) for job in jobs)
+    else:
+        pool = multiprocessing.Pool(args.jobs)
+        results = pool.imap_unordered(render, jobs)
+    for source, target, error in results:
+        if error:
+            failures += 1
+            sys.stderr.write("%s: %s\n" % (source, error))
+        else:
+            print "%s -> %s" % (source, target)
+    if pool:
+        pool.close()
+        pool.join()
+    if failures:
+        sys.stderr.write("%i of %i models failed\n"
+            % (failures, len(jobs)))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())